@@ -19,12 +19,17 @@
 # MA 02110-1301, USA
 
 from appstream.store import Store
+from appstream.snapshot import StoreSnapshot, SnapshotHolder
+from appstream.flat import FlatStore
 from appstream.component import Component
 from appstream.component import Checksum
 from appstream.component import Provide
+from appstream.component import Icon
 from appstream.component import Image
 from appstream.component import Release
 from appstream.component import Require
 from appstream.component import Review
 from appstream.component import Screenshot
+from appstream.compact import ReleasePolicy
 from appstream.errors import ParseError, ValidationError
+from appstream.limits import ParseLimits
@@ -0,0 +1,321 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+""" Command line tool for AppStream catalogs, run as python -m appstream """
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import sys
+
+from appstream.component import Component
+from appstream.errors import ParseError
+from appstream.flat import FlatStore, _MAGIC as _FLAT_MAGIC
+from appstream.store import Store
+from appstream.utils import _escape
+
+# the amount of compressed data read at once when streaming
+_READ_SIZE = 64 * 1024
+
+# the end of each component, and what can follow the name of its start tag
+_END_TAG = b'</component>'
+_TAG_ENDS = (b' ', b'>', b'\t', b'\n', b'\r', b'/')
+
+class _StopParsing(Exception):
+    """ Raised from a callback to stop streaming a catalog early """
+    pass
+
+def _get_magic(filename):
+    """ Returns the first bytes of a file """
+    with open(filename, 'rb') as f:
+        return f.read(len(_FLAT_MAGIC))
+
+def _open(filename):
+    """ Open a catalog, which may be compressed """
+    if _get_magic(filename)[:2] == b'\x1f\x8b':
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+def _stream(filename, on_component, on_root=None, locales=None, fields=None):
+    """ Parse a catalog without keeping it in memory
+
+    Each component is passed to on_component as soon as it has been parsed,
+    and reading stops if a callback raises _StopParsing.
+    """
+    from appstream.builder import ComponentBuilder, FeedParser
+    from appstream.component import _get_fields
+    from appstream.utils import _expand_locales
+    target = ComponentBuilder(on_component, 2, on_root,
+                              _expand_locales(locales), _get_fields(fields))
+    parser = FeedParser(target)
+    f = _open(filename)
+    try:
+        while True:
+            data = f.read(_READ_SIZE)
+            if not data:
+                break
+            parser.feed(data)
+        parser.close()
+    except _StopParsing:
+        pass
+    finally:
+        f.close()
+
+def _load(filename, locales=None):
+    """ Returns a Store for a catalog, which may be compressed """
+    store = Store()
+    f = _open(filename)
+    try:
+        store.parse(f.read(), locales=locales)
+    finally:
+        f.close()
+    return store
+
+def _get_locales(args):
+    if args.locale:
+        return [args.locale]
+    return None
+
+def _write(text):
+    """ Write text to stdout, encoding it if required """
+    if sys.version_info[0] == 2 and isinstance(text, unicode):
+        text = text.encode('utf-8')
+    sys.stdout.write(text)
+
+def _cmd_dump(args):
+    """ Write every component of a catalog as XML """
+    def _on_root(attrib):
+        _write('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<components version="0.9" origin="%s">\n' % _escape(attrib.get('origin')))
+    def _on_component(component):
+        _write(component.to_xml())
+    _stream(args.filename, _on_component, _on_root, _get_locales(args))
+    _write('</components>\n')
+    return 0
+
+def _find_start(data, pos):
+    """ Returns where the <component> element holding pos starts, or -1 """
+    while True:
+        pos = data.rfind(b'<component', 0, pos)
+        if pos < 0 or data[pos + 10:pos + 11] in _TAG_ENDS:
+            return pos
+
+def _scan(filename, app_id, locales=None):
+    """ Returns a component found by searching the raw catalog data
+
+    Only the components that contain the escaped ID somewhere are parsed,
+    so nothing is built for the others. Returns None if the ID is not found
+    this way, e.g. when it was written with character references.
+    """
+    needle = _escape(app_id).encode('utf-8')
+    f = _open(filename)
+    try:
+        buf = b''
+        while True:
+            data = f.read(_READ_SIZE)
+            if not data:
+                return None
+            buf += data
+            # only search the components that have been read completely
+            cut = buf.rfind(_END_TAG)
+            if cut < 0:
+                continue
+            cut += len(_END_TAG)
+            pos = buf.find(needle, 0, cut)
+            while pos >= 0:
+                start = _find_start(buf, pos)
+                end = buf.find(_END_TAG, pos, cut) + len(_END_TAG)
+                if start >= 0:
+                    component = Component()
+                    try:
+                        component.parse(buf[start:end], locales=locales)
+                    except ParseError:
+                        component = None
+                    if component and component.id == app_id:
+                        return component
+                pos = buf.find(needle, end, cut)
+            buf = buf[cut:]
+    finally:
+        f.close()
+
+def _get_flat(filename, app_id, locales=None):
+    """ Returns a component from a flat catalog, or None """
+    flat = FlatStore.open(filename)
+    try:
+        view = flat.get_component(app_id)
+        if view is None:
+            return None
+        component = view.get_component()
+    finally:
+        flat.close()
+    if locales:
+        xml = component.to_xml()
+        component = Component()
+        component.parse(xml, locales=locales)
+    return component
+
+def _get_streamed(filename, app_id, locales=None):
+    """ Returns a component by parsing the catalog until it is found """
+    found = []
+    def _on_component(component):
+        if component.id == app_id:
+            found.append(component)
+            raise _StopParsing()
+    _stream(filename, _on_component, locales=locales)
+    if found:
+        return found[0]
+    return None
+
+def _cmd_get(args):
+    """ Write one component as XML
+
+    A flat catalog is looked up by ID; for XML the raw data is searched for
+    the ID, and the catalog is only parsed in full if that fails.
+    """
+    locales = _get_locales(args)
+    if _get_magic(args.filename) == _FLAT_MAGIC:
+        component = _get_flat(args.filename, args.id, locales)
+    else:
+        component = _scan(args.filename, args.id, locales)
+        if component is None:
+            component = _get_streamed(args.filename, args.id, locales)
+    if component is None:
+        print('%s not found' % args.id, file=sys.stderr)
+        return 1
+    _write(component.to_xml())
+    return 0
+
+def _cmd_search(args):
+    """ List the components matching a search term """
+    term = args.term.lower()
+    matches = []
+    def _on_component(component):
+        values = [component.id, component.get_name(args.locale),
+                  component.get_summary(args.locale)]
+        values.extend(component.keywords)
+        for value in values:
+            if value and term in value.lower():
+                matches.append(component)
+                break
+        if args.limit and len(matches) >= args.limit:
+            raise _StopParsing()
+    _stream(args.filename, _on_component, locales=_get_locales(args),
+            fields=['name', 'summary', 'keywords'])
+    for component in matches:
+        _write('%s\t%s\n' % (component.id, component.get_name(args.locale) or ''))
+    return 0
+
+def _cmd_validate(args):
+    """ Validate every component of a catalog """
+    report = _load(args.filename).validate_all(workers=args.workers)
+    for app_id in sorted(report):
+        for problem in report[app_id]:
+            _write('%s: %s\n' % (app_id, problem))
+    if report:
+        return 1
+    return 0
+
+def _cmd_merge(args):
+    """ Merge several catalogs into one file """
+    stores = [_load(filename) for filename in args.filenames]
+    priority = None
+    if args.priority:
+        priority = args.priority.split(',')
+    store = Store()
+    store.merge(stores, priority)
+    if args.origin:
+        store.origin = args.origin
+    store.to_file(args.output)
+    return 0
+
+def _cmd_stats(args):
+    """ Show the number of objects in a catalog """
+    origin = []
+    counts = {'components': 0, 'releases': 0, 'reviews': 0, 'screenshots': 0}
+    def _on_root(attrib):
+        origin.append(attrib.get('origin'))
+    def _on_component(component):
+        counts['components'] += 1
+        counts['releases'] += len(component.releases)
+        counts['reviews'] += len(component.reviews)
+        counts['screenshots'] += len(component.screenshots)
+    _stream(args.filename, _on_component, _on_root,
+            fields=['releases', 'reviews', 'screenshots'])
+    _write('origin: %s\n' % (origin[0] if origin else None))
+    for key in ['components', 'releases', 'reviews', 'screenshots']:
+        _write('%s: %i\n' % (key, counts[key]))
+    return 0
+
+def _get_parser():
+    parser = argparse.ArgumentParser(prog='python -m appstream',
+                                     description='Query and modify AppStream catalogs')
+    commands = parser.add_subparsers(dest='command')
+
+    cmd = commands.add_parser('dump', help='write all the components as XML')
+    cmd.add_argument('filename')
+    cmd.add_argument('--locale', help='only keep translations for this locale')
+    cmd.set_defaults(func=_cmd_dump)
+
+    cmd = commands.add_parser('get', help='write one component as XML, '
+                              'also from a flat catalog')
+    cmd.add_argument('filename')
+    cmd.add_argument('id')
+    cmd.add_argument('--locale', help='only keep translations for this locale')
+    cmd.set_defaults(func=_cmd_get)
+
+    cmd = commands.add_parser('search', help='find components by ID, name or keyword')
+    cmd.add_argument('filename')
+    cmd.add_argument('term')
+    cmd.add_argument('--locale', help='only search translations for this locale')
+    cmd.add_argument('--limit', type=int, default=0, help='stop after this many matches')
+    cmd.set_defaults(func=_cmd_search)
+
+    cmd = commands.add_parser('validate', help='check every component for problems')
+    cmd.add_argument('filename')
+    cmd.add_argument('--workers', type=int, default=1, help='number of processes')
+    cmd.set_defaults(func=_cmd_validate)
+
+    cmd = commands.add_parser('merge', help='merge catalogs into a compressed file')
+    cmd.add_argument('output')
+    cmd.add_argument('filenames', nargs='+')
+    cmd.add_argument('--priority', help='comma separated origins, highest first')
+    cmd.add_argument('--origin', help='the origin of the merged catalog')
+    cmd.set_defaults(func=_cmd_merge)
+
+    cmd = commands.add_parser('stats', help='count the objects in a catalog')
+    cmd.add_argument('filename')
+    cmd.set_defaults(func=_cmd_stats)
+    return parser
+
+def main(argv=None):
+    parser = _get_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 2
+    try:
+        return args.func(args)
+    except (IOError, ParseError) as e:
+        print('%s: %s' % (parser.prog, e), file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
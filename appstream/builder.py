@@ -0,0 +1,249 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+import xml.etree.ElementTree as ET
+
+try:
+    # Py2.7 and newer
+    from xml.etree.ElementTree import ParseError as StdlibParseError
+except ImportError:
+    # Py2.6 and older
+    from xml.parsers.expat import ExpatError as StdlibParseError
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+from appstream.errors import ParseError
+from appstream.component import Component, Release, Review, Screenshot
+from appstream.component import _FIELD_FOR_TAG, _LIST_SECTIONS
+from appstream.limits import _FEED_SIZE, _wrap_target
+from appstream.utils import _get_lang, _parse_desc
+
+# the sections of <component> holding objects with their own children
+_OBJECT_SECTIONS = {
+    'releases': ('release', Release, 'add_release'),
+    'reviews': ('review', Review, 'add_review'),
+    'screenshots': ('screenshot', Screenshot, 'add_screenshot'),
+}
+
+# the children of those objects that contain description markup
+_MARKUP_CHILDREN = {
+    'release': 'description',
+    'review': 'description',
+    'screenshot': 'caption',
+}
+
+class ComponentBuilder(object):
+    """ A parser target that builds Component objects directly from events
+
+    Unlike the tree backend no element tree is built for the catalog; only
+    description markup is collected into a small tree so it is formatted in
+    exactly the same way. Each component is passed to on_component as soon
+    as its closing tag is seen.
+
+    The component elements are at component_depth, i.e. 2 for a catalog and
+    1 for a metainfo file. If on_root is set it is called with the attributes
+    of the root element. The locales must already have been expanded.
+    """
+    def __init__(self, on_component, component_depth=2, on_root=None,
+                 locales=None, fields=None, new_component=Component):
+        """ Set defaults """
+        self._on_component = on_component
+        self._on_root = on_root
+        self._component_depth = component_depth
+        self._locales = locales
+        self._fields = fields
+        self._new_component = new_component
+        self._depth = 0
+        self._skip_depth = 0
+        self._stack = []
+        self._parts = None
+        self._text_depth = 0
+        self._component = None
+        self._section = None
+        self._item = None
+        self._markup = None
+        self._markup_depth = 0
+        self._markup_lang = None
+
+    def _start_markup(self, tag, attrib, lang=None):
+        """ Collect the markup of this element into a small tree """
+        self._markup = ET.TreeBuilder()
+        self._markup_depth = self._depth
+        self._markup_lang = lang
+        self._markup.start(tag, dict(attrib))
+
+    def start(self, tag, attrib):
+        self._depth += 1
+        if self._skip_depth:
+            return
+        if self._markup is not None:
+            self._markup.start(tag, dict(attrib))
+            return
+
+        # text is only kept until the first child element, like ElementTree,
+        # as data is only collected at the depth of the latest start
+        self._parts = []
+        self._text_depth = self._depth
+        self._stack.append((tag, attrib, self._parts))
+
+        level = self._depth - self._component_depth
+        if level < 0:
+            if self._depth == 1 and self._on_root:
+                self._on_root(attrib)
+        elif level == 0:
+            self._component = self._new_component()
+            if 'type' in attrib:
+                self._component.kind = attrib['type']
+        elif level == 1:
+            if self._fields is not None and _FIELD_FOR_TAG.get(tag) not in self._fields:
+                self._skip()
+                return
+            self._section = tag
+            if tag == 'description':
+                lang = _get_lang(attrib)
+                if not self._component._want_description(lang, self._locales):
+                    self._skip()
+                    return
+                self._start_markup(tag, attrib, lang)
+        elif level == 2:
+            if self._section in _OBJECT_SECTIONS:
+                child_tag, cls, _ = _OBJECT_SECTIONS[self._section]
+                if tag == child_tag:
+                    self._item = cls()
+                    self._item._parse_attrib(attrib)
+        elif level == 3:
+            if self._item is not None:
+                if _MARKUP_CHILDREN[self._stack[-2][0]] == tag:
+                    self._start_markup(tag, attrib)
+
+    def _skip(self):
+        """ Ignore everything until the current element ends """
+        self._skip_depth = self._depth
+        self._stack.pop()
+
+    def data(self, data):
+        # markup is never collected while skipping, and the text of skipped
+        # elements is collected but never used
+        if self._markup is not None:
+            self._markup.data(data)
+        elif self._depth == self._text_depth:
+            self._parts.append(data)
+
+    def end(self, tag):
+        depth = self._depth
+        self._depth -= 1
+        if self._skip_depth:
+            if depth == self._skip_depth:
+                self._skip_depth = 0
+            return
+        if self._markup is not None:
+            if depth != self._markup_depth:
+                self._markup.end(tag)
+                return
+            self._markup.end(tag)
+            desc = _parse_desc(self._markup.close())
+            self._markup = None
+            self._stack.pop()
+            if self._item is not None:
+                if tag == 'caption':
+                    self._item.caption = desc
+                else:
+                    self._item.description = desc
+            else:
+                self._component._set_description(self._markup_lang, desc)
+            return
+
+        _, attrib, parts = self._stack.pop()
+        text = ''.join(parts) if parts else None
+        level = depth - self._component_depth
+        if level == 0:
+            component = self._component
+            self._component = None
+            self._on_component(component)
+        elif level == 1:
+            if tag not in _OBJECT_SECTIONS and tag not in _LIST_SECTIONS:
+                self._component._parse_child(tag, attrib, text, self._locales)
+            self._section = None
+        elif level == 2:
+            if self._section in _OBJECT_SECTIONS:
+                if self._item is not None:
+                    add = getattr(self._component, _OBJECT_SECTIONS[self._section][2])
+                    add(self._item)
+                    self._item = None
+            elif self._section in _LIST_SECTIONS:
+                self._component._parse_item(self._section, tag, attrib, text)
+        elif level == 3:
+            if self._item is not None:
+                self._item._parse_child(tag, attrib, text)
+        elif level == 4:
+            if isinstance(self._item, Review) and self._stack[-1][0] == 'metadata':
+                self._item._parse_metadata(tag, attrib, text)
+
+    def close(self):
+        return None
+
+def _new_parser(target):
+    """ Returns a parser for a target, using lxml if it is installed """
+    if lxml_etree is not None:
+        return lxml_etree.XMLParser(target=target)
+    return ET.XMLParser(target=target)
+
+def _get_parse_errors():
+    if lxml_etree is not None:
+        return (StdlibParseError, lxml_etree.XMLSyntaxError)
+    return (StdlibParseError,)
+
+class FeedParser(object):
+    """ Parses XML into a target as it is pushed in a chunk at a time
+
+    The target sees the events for each chunk before feed() returns, so a
+    ComponentBuilder finishes each component as soon as its closing tag
+    has been fed.
+    """
+    def __init__(self, target, limits=None, component_depth=2):
+        """ Set defaults """
+        self._parser = _new_parser(_wrap_target(target, limits, component_depth))
+        self._limits = limits
+        self._size = 0
+
+    def feed(self, data):
+        """ Parse the next chunk of data """
+        if lxml_etree is not None and not isinstance(data, bytes):
+            # lxml refuses unicode with an encoding declaration
+            data = data.encode('utf-8')
+        if self._limits is not None:
+            self._size += len(data)
+            self._limits.check_size(self._size)
+        try:
+            # lxml has a limit on how much can be fed at once
+            for offset in range(0, len(data), _FEED_SIZE):
+                self._parser.feed(data[offset:offset + _FEED_SIZE])
+        except _get_parse_errors() as e:
+            raise ParseError(str(e))
+
+    def close(self):
+        """ Finish parsing, returning the result of the target """
+        try:
+            return self._parser.close()
+        except _get_parse_errors() as e:
+            raise ParseError(str(e))
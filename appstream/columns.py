@@ -0,0 +1,123 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+import csv
+import json
+from array import array
+
+try:
+    array('q')
+    _INT_TYPECODE = 'q'
+except ValueError:
+    # Py2 has no 64 bit typecode
+    _INT_TYPECODE = 'l'
+
+# the columns in each table, numeric ones stored as packed integers
+COMPONENT_COLUMNS = ['id', 'kind']
+RELEASE_COLUMNS = [
+    'component',
+    'version',
+    'timestamp',
+    'urgency',
+    'size_installed',
+    'size_download',
+    'checksums',
+]
+_NUMERIC_COLUMNS = frozenset([
+    'component',
+    'timestamp',
+    'size_installed',
+    'size_download',
+    'checksums',
+])
+
+def _get_numpy():
+    """ Returns the numpy module, or None if not installed """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def _new_column(name):
+    if name in _NUMERIC_COLUMNS:
+        return array(_INT_TYPECODE)
+    return []
+
+def _iter_release_values(components):
+    """ Yields the component index, component and release value tuples """
+    for idx, component in enumerate(components):
+        for rel in component.releases:
+            yield (idx, component, (idx,
+                                    rel.version,
+                                    rel.timestamp,
+                                    rel.urgency,
+                                    rel.size_installed,
+                                    rel.size_download,
+                                    len(rel.checksums)))
+
+def to_columns(components, use_numpy=True):
+    """ Returns the component and release tables as dicts of columns
+
+    The 'component' column of the release table is the index of the
+    release's component in the component table. Numeric columns are NumPy
+    arrays if NumPy is installed and use_numpy is set, otherwise they are
+    array.array objects; string columns are lists or NumPy object arrays.
+    """
+    comps = dict((name, _new_column(name)) for name in COMPONENT_COLUMNS)
+    rels = dict((name, _new_column(name)) for name in RELEASE_COLUMNS)
+    rel_columns = [rels[name] for name in RELEASE_COLUMNS]
+    for component in components:
+        comps['id'].append(component.id)
+        comps['kind'].append(component.kind)
+    for _, _, values in _iter_release_values(components):
+        for column, value in zip(rel_columns, values):
+            column.append(value)
+
+    numpy = _get_numpy() if use_numpy else None
+    if numpy:
+        for table in [comps, rels]:
+            for name in table:
+                if name in _NUMERIC_COLUMNS:
+                    table[name] = numpy.array(table[name], dtype=numpy.int64)
+                else:
+                    table[name] = numpy.array(table[name], dtype=object)
+    return {'components': comps, 'releases': rels}
+
+def _iter_release_rows(components):
+    """ Yields one flat row per release, including the component columns """
+    for _, component, values in _iter_release_values(components):
+        yield (component.id, component.kind) + values[1:]
+
+# the header of the flat release rows
+RELEASE_ROW_COLUMNS = ['id', 'kind'] + RELEASE_COLUMNS[1:]
+
+def write_csv(components, f):
+    """ Write one CSV row per release to a file object """
+    writer = csv.writer(f)
+    writer.writerow(RELEASE_ROW_COLUMNS)
+    for row in _iter_release_rows(components):
+        writer.writerow(row)
+
+def write_jsonl(components, f):
+    """ Write one JSON object per line for each release to a file object """
+    for row in _iter_release_rows(components):
+        f.write(json.dumps(dict(zip(RELEASE_ROW_COLUMNS, row)), sort_keys=True))
+        f.write('\n')
@@ -0,0 +1,74 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+class ReleasePolicy(object):
+    """ Which releases of each component to keep when publishing a catalog
+
+    A release is kept if any of the rules that are set keeps it:
+
+     - keep_latest: the newest N releases, by timestamp
+     - newer_than: releases with a timestamp after this UNIX time
+     - urgencies: releases with one of these urgencies, e.g. ['critical']
+
+    If no rules are set every release is kept.
+    """
+    def __init__(self, keep_latest=None, newer_than=None, urgencies=None):
+        """ Set defaults """
+        self.keep_latest = keep_latest
+        self.newer_than = newer_than
+        self.urgencies = frozenset(urgencies or [])
+
+    def select(self, releases):
+        """ Returns the releases to keep, in their original order """
+        if self.keep_latest is None and self.newer_than is None and not self.urgencies:
+            return releases
+        latest = set()
+        if self.keep_latest:
+            ordered = sorted(range(len(releases)),
+                             key=lambda idx: releases[idx].timestamp, reverse=True)
+            latest = set(ordered[:self.keep_latest])
+        kept = []
+        for idx, rel in enumerate(releases):
+            if idx in latest or rel.urgency in self.urgencies or \
+               (self.newer_than is not None and rel.timestamp > self.newer_than):
+                kept.append(rel)
+        return kept
+
+def new_report():
+    """ Returns an empty report of what a policy removed """
+    return {'releases_kept': 0, 'releases_dropped': 0, 'bytes_saved': 0}
+
+def compact_component_xml(component, policy, report):
+    """ Returns the XML of a component with only the releases a policy keeps
+
+    The component is not modified. The number of releases kept and dropped
+    and the size of the XML that was left out are added to the report.
+    """
+    releases = policy.select(component.releases)
+    report['releases_kept'] += len(releases)
+    if len(releases) != len(component.releases):
+        kept = set(id(rel) for rel in releases)
+        for rel in component.releases:
+            if id(rel) not in kept:
+                report['releases_dropped'] += 1
+                report['bytes_saved'] += len(rel.to_xml().encode('utf-8'))
+        if not releases:
+            report['bytes_saved'] += len('    <releases>\n    </releases>\n')
+    return component.to_xml(releases=releases)
@@ -19,19 +19,12 @@
 # MA 02110-1301, USA
 
 import sys
-import xml.etree.ElementTree as ET
-import dateutil.parser
 from datetime import datetime
 
-try:
-    # Py2.7 and newer
-    from xml.etree.ElementTree import ParseError as StdlibParseError
-except ImportError:
-    # Py2.6 and older
-    from xml.parsers.expat import ExpatError as StdlibParseError
-
 from appstream.errors import ParseError, ValidationError
-from appstream.utils import _join_lines, _parse_desc
+from appstream.utils import _join_lines, _parse_desc, _get_lang
+from appstream.utils import _expand_locales, _get_localized
+from appstream.utils import _parse_xml, _escape
 
 if sys.version_info[0] == 2:
     # Python2 has a nice basestring base class
@@ -40,7 +33,110 @@ else:
     # But python3 has distinct types
     string_types = (str, bytes)
 
-class Checksum(object):
+# the parse backends that can be chosen
+BACKENDS = ['tree', 'events']
+
+# licenses allowed for <metadata_license>
+_VALID_METADATA_LICENSES = frozenset([
+    'CC0-1.0',
+    'CC-BY-3.0',
+    'CC-BY-4.0',
+    'CC-BY-SA-3.0',
+    'CC-BY-SA-4.0',
+    'GFDL-1.1',
+    'GFDL-1.2',
+    'GFDL-1.3',
+    'FSFAP'
+])
+
+# the Component field that each child element of <component> is parsed into
+_FIELD_FOR_TAG = {
+    'id': 'id',
+    'updatecontact': 'update_contact',
+    'update_contact': 'update_contact',
+    'metadata_license': 'metadata_license',
+    'releases': 'releases',
+    'reviews': 'reviews',
+    'screenshots': 'screenshots',
+    'provides': 'provides',
+    'requires': 'requires',
+    'kudos': 'kudos',
+    'keywords': 'keywords',
+    'categories': 'categories',
+    'custom': 'custom',
+    'project_license': 'project_license',
+    'licence': 'project_license',
+    'developer_name': 'developer_name',
+    'name': 'name',
+    'pkgname': 'pkgname',
+    'summary': 'summary',
+    'description': 'description',
+    'url': 'urls',
+    'icon': 'icons',
+    'bundle': 'bundle',
+}
+_FIELDS = frozenset(_FIELD_FOR_TAG.values()) | frozenset(['kind'])
+
+# the sections of <component> that are a flat list of simple elements
+_LIST_SECTIONS = frozenset([
+    'provides',
+    'requires',
+    'kudos',
+    'keywords',
+    'categories',
+    'custom',
+])
+
+def _get_fields(fields):
+    """ Returns the set of fields to parse, or None for all of them """
+    if fields is None:
+        return None
+    fields = frozenset(fields) | frozenset(['id'])
+    unknown = fields - _FIELDS
+    if unknown:
+        raise ValueError('Unknown fields: %s' % ', '.join(sorted(unknown)))
+    return fields
+
+def _parse_date(value):
+    """ Returns a date string as a UNIX timestamp """
+    # dateutil is slow to import and most files only use timestamps
+    import dateutil.parser
+    dt = dateutil.parser.parse(value)
+    return int(dt.strftime("%s"))
+
+def _restore(cls, values):
+    """ Returns a model object from the values of its _FIELDS """
+    obj = cls.__new__(cls)
+    obj.__dict__.update(cls._TRANSIENT)
+    obj.__dict__.update(zip(cls._FIELDS, values))
+    return obj
+
+class _Model(object):
+    """ A model object that is pickled as a tuple of its field values
+
+    This avoids writing the attribute names for every object. Attributes
+    added by subclasses or callers are pickled by name as before, and the
+    _TRANSIENT attributes are reset to their defaults when loaded.
+    """
+    _FIELDS = ()
+    _TRANSIENT = {}
+
+    def _get_state(self):
+        """ Returns the values of _FIELDS as a tuple """
+        return tuple(map(self.__dict__.__getitem__, self._FIELDS))
+
+    def __reduce__(self):
+        attrs = self.__dict__
+        if len(attrs) == len(self._FIELDS) + len(self._TRANSIENT):
+            return (_restore, (self.__class__, self._get_state()))
+        fields = frozenset(self._FIELDS)
+        extra = dict((key, attrs[key]) for key in attrs
+                     if key not in fields and key not in self._TRANSIENT)
+        return (_restore, (self.__class__, self._get_state()), extra)
+
+class Checksum(_Model):
+    _FIELDS = ('kind', 'target', 'value', 'filename')
+
     def __init__(self):
         """ Set defaults """
         self.kind = 'sha1'
@@ -48,18 +144,26 @@ class Checksum(object):
         self.value = None
         self.filename = None
     def to_xml(self):
-        return '        <checksum filename="%s" target="%s" type="sha1">%s</checksum>\n' % (self.filename, self.target, self.value)
+        return '        <checksum filename="%s" target="%s" type="%s">%s</checksum>\n' % \
+            (_escape(self.filename), _escape(self.target), _escape(self.kind), _escape(self.value))
     def _parse_tree(self, node):
         """ Parse a <checksum> object """
-        if 'filename' in node.attrib:
-            self.filename = node.attrib['filename']
-        if 'type' in node.attrib:
-            self.kind = node.attrib['type']
-        if 'target' in node.attrib:
-            self.target = node.attrib['target']
-        self.value = node.text
-
-class Review(object):
+        self._parse_element(node.tag, node.attrib, node.text)
+    def _parse_element(self, tag, attrib, text):
+        """ Parse a <checksum> element from its parts """
+        if 'filename' in attrib:
+            self.filename = attrib['filename']
+        if 'type' in attrib:
+            self.kind = attrib['type']
+        if 'target' in attrib:
+            self.target = attrib['target']
+        self.value = text
+
+class Review(_Model):
+    _FIELDS = ('id', 'summary', 'description', 'locale', 'karma', 'score',
+               'rating', 'version', 'reviewer_id', 'reviewer_name', 'date',
+               'metadata')
+
     def __init__(self):
         """ Set defaults """
         self.id = None
@@ -77,35 +181,47 @@ class Review(object):
 
     def _parse_tree(self, node):
         """ Parse a <review> object """
-        if 'date' in node.attrib:
-            dt = dateutil.parser.parse(node.attrib['date'])
-            self.date = int(dt.strftime("%s"))
-        if 'id' in node.attrib:
-            self.id = node.attrib['id']
-        if 'karma' in node.attrib:
-            self.karma = int(node.attrib['karma'])
-        if 'score' in node.attrib:
-            self.score = int(node.attrib['score'])
-        if 'rating' in node.attrib:
-            self.rating = int(node.attrib['rating'])
+        self._parse_attrib(node.attrib)
         for c3 in node:
-            if c3.tag == 'lang':
-                self.locale = c3.text
-            if c3.tag == 'version':
-                self.version = c3.text
-            if c3.tag == 'reviewer_id':
-                self.reviewer_id = c3.text
-            if c3.tag == 'reviewer_name':
-                self.reviewer_name = c3.text
-            if c3.tag == 'summary':
-                self.summary = c3.text
             if c3.tag == 'description':
                 self.description = _parse_desc(c3)
-            if c3.tag == 'metadata':
+            elif c3.tag == 'metadata':
                 for c4 in c3:
-                    if c4.tag == 'value':
-                        if 'key' in c4.attrib:
-                            self.metadata[c4.attrib['key']] = c4.text
+                    self._parse_metadata(c4.tag, c4.attrib, c4.text)
+            else:
+                self._parse_child(c3.tag, c3.attrib, c3.text)
+
+    def _parse_attrib(self, attrib):
+        """ Parse the attributes of a <review> element """
+        if 'date' in attrib:
+            self.date = _parse_date(attrib['date'])
+        if 'id' in attrib:
+            self.id = attrib['id']
+        if 'karma' in attrib:
+            self.karma = int(attrib['karma'])
+        if 'score' in attrib:
+            self.score = int(attrib['score'])
+        if 'rating' in attrib:
+            self.rating = int(attrib['rating'])
+
+    def _parse_child(self, tag, attrib, text):
+        """ Parse a simple child element of a <review> """
+        if tag == 'lang':
+            self.locale = text
+        if tag == 'version':
+            self.version = text
+        if tag == 'reviewer_id':
+            self.reviewer_id = text
+        if tag == 'reviewer_name':
+            self.reviewer_name = text
+        if tag == 'summary':
+            self.summary = text
+
+    def _parse_metadata(self, tag, attrib, text):
+        """ Parse a child element of the review <metadata> """
+        if tag == 'value':
+            if 'key' in attrib:
+                self.metadata[attrib['key']] = text
 
     def to_xml(self):
         xml = '      <review'
@@ -118,29 +234,33 @@ class Review(object):
         if self.karma:
             xml += ' karma="%s"' % self.karma
         if self.id:
-            xml += ' id="%s"' % self.id
+            xml += ' id="%s"' % _escape(self.id)
         xml += '>\n'
         if self.summary:
-            xml += '        <summary>%s</summary>\n' % self.summary
+            xml += '        <summary>%s</summary>\n' % _escape(self.summary)
         if self.description:
             xml += '        <description>%s</description>\n' % self.description
         if self.version:
-            xml += '        <version>%s</version>\n' % self.version
+            xml += '        <version>%s</version>\n' % _escape(self.version)
         if self.reviewer_id:
-            xml += '        <reviewer_id>%s</reviewer_id>\n' % self.reviewer_id
+            xml += '        <reviewer_id>%s</reviewer_id>\n' % _escape(self.reviewer_id)
         if self.reviewer_name:
-            xml += '        <reviewer_name>%s</reviewer_name>\n' % self.reviewer_name
+            xml += '        <reviewer_name>%s</reviewer_name>\n' % _escape(self.reviewer_name)
         if self.locale:
-            xml += '        <lang>%s</lang>\n' % self.locale
+            xml += '        <lang>%s</lang>\n' % _escape(self.locale)
         if len(self.metadata) > 0:
             xml += '        <metadata>\n'
-            for key in self.metadata:
-                xml += '          <value key=\"%s\">%s</value>\n' % (key, self.metadata[key])
+            for key in sorted(self.metadata):
+                xml += '          <value key="%s">%s</value>\n' % \
+                    (_escape(key), _escape(self.metadata[key]))
             xml += '        </metadata>\n'
         xml += '      </review>\n'
         return xml
 
-class Release(object):
+class Release(_Model):
+    _FIELDS = ('version', 'description', 'timestamp', 'checksums', 'location',
+               'size_installed', 'size_download', 'urgency')
+
     def __init__(self):
         """ Set defaults """
         self.version = None
@@ -169,48 +289,58 @@ class Release(object):
 
     def _parse_tree(self, node):
         """ Parse a <release> object """
-        if 'timestamp' in node.attrib:
-            self.timestamp = int(node.attrib['timestamp'])
-        if 'date' in node.attrib:
-            dt = dateutil.parser.parse(node.attrib['date'])
-            self.timestamp = int(dt.strftime("%s"))
-        if 'urgency' in node.attrib:
-            self.urgency = node.attrib['urgency']
-        if 'version' in node.attrib:
-            self.version = node.attrib['version']
-            # fix up hex value
-            if self.version.startswith('0x'):
-                self.version = str(int(self.version[2:], 16))
+        self._parse_attrib(node.attrib)
         for c3 in node:
             if c3.tag == 'description':
                 self.description = _parse_desc(c3)
-            if c3.tag == 'size':
-                if 'type' not in c3.attrib:
-                    continue
-                if c3.attrib['type'] == 'installed':
-                    self.size_installed = int(c3.text)
-                if c3.attrib['type'] == 'download':
-                    self.size_download = int(c3.text)
-            elif c3.tag == 'checksum':
-                csum = Checksum()
-                csum._parse_tree(c3)
-                self.add_checksum(csum)
+            else:
+                self._parse_child(c3.tag, c3.attrib, c3.text)
+
+    def _parse_attrib(self, attrib):
+        """ Parse the attributes of a <release> element """
+        if 'timestamp' in attrib:
+            self.timestamp = int(attrib['timestamp'])
+        if 'date' in attrib:
+            self.timestamp = _parse_date(attrib['date'])
+        if 'urgency' in attrib:
+            self.urgency = attrib['urgency']
+        if 'version' in attrib:
+            self.version = attrib['version']
+            # fix up hex value
+            if self.version.startswith('0x'):
+                self.version = str(int(self.version[2:], 16))
+
+    def _parse_child(self, tag, attrib, text):
+        """ Parse a simple child element of a <release> """
+        if tag == 'size':
+            if 'type' not in attrib:
+                return
+            if attrib['type'] == 'installed':
+                self.size_installed = int(text)
+            if attrib['type'] == 'download':
+                self.size_download = int(text)
+        elif tag == 'checksum':
+            csum = Checksum()
+            csum._parse_element(tag, attrib, text)
+            self.add_checksum(csum)
+        elif tag == 'location':
+            self.location = text
 
     def to_xml(self):
         xml = '      <release'
         if self.version:
-            xml += ' version="%s"' % self.version
+            xml += ' version="%s"' % _escape(self.version)
         if self.timestamp:
             xml += ' timestamp="%i"' % self.timestamp
         if self.urgency:
-            xml += ' urgency="%s"' % self.urgency
+            xml += ' urgency="%s"' % _escape(self.urgency)
         xml += '>\n'
         if self.size_installed > 0:
             xml += '        <size type="installed">%i</size>\n' % self.size_installed
         if self.size_download > 0:
             xml += '        <size type="download">%i</size>\n' % self.size_download
         if self.location:
-            xml += '        <location>%s</location>\n' % self.location
+            xml += '        <location>%s</location>\n' % _escape(self.location)
         for csum in self.checksums:
             xml += csum.to_xml()
         if self.description:
@@ -218,7 +348,9 @@ class Release(object):
         xml += '      </release>\n'
         return xml
 
-class Image(object):
+class Image(_Model):
+    _FIELDS = ('kind', 'width', 'height', 'url')
+
     def __init__(self):
         """ Set defaults """
         self.kind = None
@@ -229,28 +361,76 @@ class Image(object):
     def to_xml(self):
         xml = '        <image'
         if self.kind:
-            xml += ' type="%s"' % self.kind
+            xml += ' type="%s"' % _escape(self.kind)
         if self.width > 0:
             xml += ' width="%i"' % self.width
         if self.height > 0:
             xml += ' height="%i"' % self.height
         xml += '>'
         if self.url:
-            xml += self.url
+            xml += _escape(self.url)
         xml += '</image>\n'
         return xml
 
     def _parse_tree(self, node):
         """ Parse a <image> object """
-        if 'type' in node.attrib:
-            self.kind = node.attrib['type']
-        if 'width' in node.attrib:
-            self.width = int(node.attrib['width'])
-        if 'height' in node.attrib:
-            self.height = int(node.attrib['height'])
-        self.url = node.text
-
-class Screenshot(object):
+        self._parse_element(node.tag, node.attrib, node.text)
+
+    def _parse_element(self, tag, attrib, text):
+        """ Parse a <image> element from its parts """
+        if 'type' in attrib:
+            self.kind = attrib['type']
+        if 'width' in attrib:
+            self.width = int(attrib['width'])
+        if 'height' in attrib:
+            self.height = int(attrib['height'])
+        self.url = text
+
+class Icon(_Model):
+    _FIELDS = ('kind', 'value', 'width', 'height', 'scale')
+
+    def __init__(self):
+        """ Set defaults """
+        self.kind = None
+        self.value = None
+        self.width = 0
+        self.height = 0
+        self.scale = 1
+
+    def to_xml(self):
+        xml = '    <icon'
+        if self.kind:
+            xml += ' type="%s"' % _escape(self.kind)
+        if self.width > 0:
+            xml += ' width="%i"' % self.width
+        if self.height > 0:
+            xml += ' height="%i"' % self.height
+        if self.scale > 1:
+            xml += ' scale="%i"' % self.scale
+        xml += '>'
+        if self.value:
+            xml += _escape(self.value)
+        xml += '</icon>\n'
+        return xml
+
+    def _parse_tree(self, node):
+        """ Parse a <icon> object """
+        self._parse_element(node.tag, node.attrib, node.text)
+
+    def _parse_element(self, tag, attrib, text):
+        """ Parse a <icon> element from its parts """
+        self.kind = attrib.get('type', 'unknown')
+        if 'width' in attrib:
+            self.width = int(attrib['width'])
+        if 'height' in attrib:
+            self.height = int(attrib['height'])
+        if 'scale' in attrib:
+            self.scale = int(attrib['scale'])
+        self.value = text
+
+class Screenshot(_Model):
+    _FIELDS = ('kind', 'caption', 'images')
+
     def __init__(self):
         """ Set defaults """
         self.kind = None
@@ -265,29 +445,39 @@ class Screenshot(object):
         return None
 
     def add_image(self, im):
-        """ Add a image to a screenshot object """
+        """ Add a image to a screenshot object, replacing one of the same size """
         for im_tmp in self.images:
-            if im_tmp.kind == im.kind:
+            if im_tmp.kind == im.kind and \
+               im_tmp.width == im.width and im_tmp.height == im.height:
                 self.images.remove(im_tmp)
                 break
         self.images.append(im)
 
     def _parse_tree(self, node):
         """ Parse a <screenshot> object """
-        if 'type' in node.attrib:
-            self.kind = node.attrib['type']
+        self._parse_attrib(node.attrib)
         for c3 in node:
             if c3.tag == 'caption':
                 self.caption = _parse_desc(c3)
-            elif c3.tag == 'image':
-                im = Image()
-                im._parse_tree(c3)
-                self.add_image(im)
+            else:
+                self._parse_child(c3.tag, c3.attrib, c3.text)
+
+    def _parse_attrib(self, attrib):
+        """ Parse the attributes of a <screenshot> element """
+        if 'type' in attrib:
+            self.kind = attrib['type']
+
+    def _parse_child(self, tag, attrib, text):
+        """ Parse a simple child element of a <screenshot> """
+        if tag == 'image':
+            im = Image()
+            im._parse_element(tag, attrib, text)
+            self.add_image(im)
 
     def to_xml(self):
         xml = '      <screenshot'
         if self.kind:
-            xml += ' type="%s"' % self.kind
+            xml += ' type="%s"' % _escape(self.kind)
         xml += '>\n'
         for im in self.images:
             xml += im.to_xml()
@@ -296,19 +486,33 @@ class Screenshot(object):
         xml += '      </screenshot>\n'
         return xml
 
-class Provide(object):
+class Provide(_Model):
+    _FIELDS = ('kind', 'value')
+
     def __init__(self):
         """ Set defaults """
         self.kind = None
         self.value = None
     def _parse_tree(self, node):
         """ Parse a <provide> object """
-        if node.tag == 'firmware':
-            if 'type' in node.attrib and node.attrib['type'] == 'flashed':
-                self.kind = 'firmware-flashed'
-            self.value = node.text.lower()
+        self._parse_element(node.tag, node.attrib, node.text)
+    def _parse_element(self, tag, attrib, text):
+        """ Parse a <provide> element from its parts """
+        if tag == 'firmware':
+            if 'type' in attrib:
+                self.kind = 'firmware-%s' % attrib['type']
+            self.value = text.lower()
+
+    def to_xml(self):
+        xml = '      <firmware'
+        if self.kind and self.kind.startswith('firmware-'):
+            xml += ' type="%s"' % _escape(self.kind[9:])
+        xml += '>%s</firmware>\n' % _escape(self.value)
+        return xml
+
+class Require(_Model):
+    _FIELDS = ('kind', 'compare', 'version', 'value')
 
-class Require(object):
     def __init__(self):
         """ Set defaults """
         self.kind = None
@@ -317,15 +521,25 @@ class Require(object):
         self.value = None
     def _parse_tree(self, node):
         """ Parse a <require> object """
-        self.kind = node.tag
-        if 'compare' in node.attrib:
-            self.compare = node.attrib['compare']
-        if 'version' in node.attrib:
-            self.version = node.attrib['version']
-        self.value = node.text
-
-class Component(object):
+        self._parse_element(node.tag, node.attrib, node.text)
+    def _parse_element(self, tag, attrib, text):
+        """ Parse a <require> element from its parts """
+        self.kind = tag
+        if 'compare' in attrib:
+            self.compare = attrib['compare']
+        if 'version' in attrib:
+            self.version = attrib['version']
+        self.value = text
+
+class Component(_Model):
     """ A quick'n'dirty MetaInfo parser """
+    _FIELDS = ('id', 'update_contact', 'kind', 'provides', 'requires', 'name',
+               'pkgname', 'summary', 'description', 'names', 'summaries',
+               'descriptions', 'urls', 'icons', 'metadata_license',
+               'project_license', 'developer_name', 'releases', 'reviews',
+               'screenshots', 'kudos', 'keywords', 'categories', 'custom',
+               'bundle', 'origin')
+    _TRANSIENT = {'_feed_parser': None}
 
     def __init__(self):
         """ Set defaults """
@@ -338,6 +552,9 @@ class Component(object):
         self.pkgname = None
         self.summary = None
         self.description = None
+        self.names = {}
+        self.summaries = {}
+        self.descriptions = {}
         self.urls = {}
         self.icons = {}
         self.metadata_license = None
@@ -351,38 +568,57 @@ class Component(object):
         self.categories = []
         self.custom = {}
         self.bundle = {}
+        self.origin = None
+        self._feed_parser = None
 
-    def to_xml(self):
-        xml = '  <component type="firmware">\n'
+    def to_xml(self, releases=None):
+        """ Returns the component as XML, optionally with other releases """
+        if releases is None:
+            releases = self.releases
+        if self.kind:
+            xml = '  <component type="%s">\n' % _escape(self.kind)
+        else:
+            xml = '  <component>\n'
         if self.id:
-            xml += '    <id>%s</id>\n' % self.id
+            xml += '    <id>%s</id>\n' % _escape(self.id)
+        if self.update_contact:
+            xml += '    <update_contact>%s</update_contact>\n' % _escape(self.update_contact)
+        if self.metadata_license:
+            xml += '    <metadata_license>%s</metadata_license>\n' % _escape(self.metadata_license)
         if self.pkgname:
-            xml += '    <pkgname>%s</pkgname>\n' % self.pkgname
+            xml += '    <pkgname>%s</pkgname>\n' % _escape(self.pkgname)
         if self.name:
-            xml += '    <name>%s</name>\n' % self.name
+            xml += '    <name>%s</name>\n' % _escape(self.name)
+        for lang in sorted(self.names):
+            xml += '    <name xml:lang="%s">%s</name>\n' % (_escape(lang), _escape(self.names[lang]))
         if self.summary:
-            xml += '    <summary>%s</summary>\n' % self.summary
+            xml += '    <summary>%s</summary>\n' % _escape(self.summary)
+        for lang in sorted(self.summaries):
+            xml += '    <summary xml:lang="%s">%s</summary>\n' % (_escape(lang), _escape(self.summaries[lang]))
         if self.developer_name:
-            xml += '    <developer_name>%s</developer_name>\n' % self.developer_name
+            xml += '    <developer_name>%s</developer_name>\n' % _escape(self.developer_name)
         if self.project_license:
-            xml += '    <project_license>%s</project_license>\n' % self.project_license
+            xml += '    <project_license>%s</project_license>\n' % _escape(self.project_license)
+        # descriptions are already markup
         if self.description:
             xml += '    <description>%s</description>\n' % self.description
+        for lang in sorted(self.descriptions):
+            xml += '    <description xml:lang="%s">%s</description>\n' % (_escape(lang), self.descriptions[lang])
         if self.bundle:
-            xml += '    <bundle type="%(type)" %(runtime) %(sdk)>%(value)</bundle>\n' % \
-                   {
-                       'type': self.bundle['type'],
-                       'runtime': ('runtime="%s"' % self.bundle['runtime']) if self.bundle['runtime'] != 'unknown' else "",
-                       'sdk': ('sdk="%s"' % self.bundle['sdk']) if self.bundle['sdk'] != 'unknown' else "",
-                       'value': self.bundle['value']
-                   }
-        for key in self.urls:
-            xml += '    <url type="%s">%s</url>\n' % (key, self.urls[key])
-        for key in self.icons:
-            xml += '    <icon type="%s">%s</icon>\n' % (key, self.icons[key]['value'])
-        if len(self.releases) > 0:
+            xml += '    <bundle type="%s"' % _escape(self.bundle['type'])
+            if self.bundle['runtime'] != 'unknown':
+                xml += ' runtime="%s"' % _escape(self.bundle['runtime'])
+            if self.bundle['sdk'] != 'unknown':
+                xml += ' sdk="%s"' % _escape(self.bundle['sdk'])
+            xml += '>%s</bundle>\n' % _escape(self.bundle['value'])
+        for key in sorted(self.urls):
+            xml += '    <url type="%s">%s</url>\n' % (_escape(key), _escape(self.urls[key]))
+        for key in sorted(self.icons):
+            for icon in self.icons[key]:
+                xml += icon.to_xml()
+        if len(releases) > 0:
             xml += '    <releases>\n'
-            for rel in self.releases:
+            for rel in releases:
                 xml += rel.to_xml()
             xml += '    </releases>\n'
         if len(self.reviews) > 0:
@@ -398,22 +634,22 @@ class Component(object):
         if len(self.kudos) > 0:
             xml += '    <kudos>\n'
             for kudo in self.kudos:
-                xml += '      <kudo>%s</kudo>\n' % kudo
+                xml += '      <kudo>%s</kudo>\n' % _escape(kudo)
             xml += '    </kudos>\n'
         if len(self.keywords) > 0:
             xml += '    <keywords>\n'
             for keyword in self.keywords:
-                xml += '      <keyword>%s</keyword>\n' % keyword
+                xml += '      <keyword>%s</keyword>\n' % _escape(keyword)
             xml += '    </keywords>\n'
         if len(self.categories) > 0:
             xml += '    <categories>\n'
             for category in self.categories:
-                xml += '      <category>%s</category>\n' % category
+                xml += '      <category>%s</category>\n' % _escape(category)
             xml += '    </categories>\n'
         if len(self.provides) > 0:
             xml += '    <provides>\n'
             for p in self.provides:
-                xml += '      <firmware type="flashed">%s</firmware>\n' % p.value
+                xml += p.to_xml()
             xml += '    </provides>\n'
         if len(self.requires) > 0:
             xml += '    <requires>\n'
@@ -422,22 +658,38 @@ class Component(object):
                     continue
                 xml += '      <%s' % p.kind
                 if p.compare:
-                    xml += ' compare="%s"' % p.compare
+                    xml += ' compare="%s"' % _escape(p.compare)
                 if p.version:
-                    xml += ' version="%s"' % p.version
+                    xml += ' version="%s"' % _escape(p.version)
                 xml += '>'
                 if p.value:
-                    xml += p.value
+                    xml += _escape(p.value)
                 xml += '</%s>\n' % p.kind
             xml += '    </requires>\n'
         if len(self.custom) > 0:
             xml += '    <custom>\n'
-            for key in self.custom:
-                xml += '      <value key="%s">%s</value>\n' % (key, self.custom[key])
+            for key in sorted(self.custom):
+                xml += '      <value key="%s">%s</value>\n' % (_escape(key), _escape(self.custom[key]))
             xml += '    </custom>\n'
         xml += '  </component>\n'
         return xml
 
+    def get_name(self, locale=None):
+        """ Returns the name, falling back to less specific locales """
+        return _get_localized(self.names, self.name, locale)
+
+    def get_summary(self, locale=None):
+        """ Returns the summary, falling back to less specific locales """
+        return _get_localized(self.summaries, self.summary, locale)
+
+    def get_description(self, locale=None):
+        """ Returns the description, falling back to less specific locales """
+        return _get_localized(self.descriptions, self.description, locale)
+
+    def add_icon(self, icon):
+        """ Add an icon object """
+        self.icons.setdefault(icon.kind, []).append(icon)
+
     def add_release(self, release):
         """ Add a release object if it does not already exist """
         for r in self.releases:
@@ -487,64 +739,132 @@ class Component(object):
                 return r
         return None
 
-    def validate(self):
-        """ Parse XML data """
+    def _iter_problems(self):
+        """ Yields a message for every validation problem """
         if not self.id or len(self.id) == 0:
-            raise ValidationError('No <id> tag')
+            yield 'No <id> tag'
         if not self.name or len(self.name) == 0:
-            raise ValidationError('No <name> tag')
+            yield 'No <name> tag'
         if not self.summary or len(self.summary) == 0:
-            raise ValidationError('No <summary> tag')
+            yield 'No <summary> tag'
         if not self.description or len(self.description) == 0:
-            raise ValidationError('No <description> tag')
+            yield 'No <description> tag'
         if self.kind == 'firmware':
             if len(self.provides) == 0:
-                raise ValidationError('No <provides> tag')
+                yield 'No <provides> tag'
             if len(self.releases) == 0:
-                raise ValidationError('No <release> tag')
+                yield 'No <release> tag'
         if self.kind == 'desktop':
             if len(self.screenshots) == 0:
-                raise ValidationError('No <screenshot> tag')
+                yield 'No <screenshot> tag'
         if not self.metadata_license or len(self.metadata_license) == 0:
-            raise ValidationError('No <metadata_license> tag')
-        valid_licenses = [
-            'CC0-1.0',
-            'CC-BY-3.0',
-            'CC-BY-4.0',
-            'CC-BY-SA-3.0',
-            'CC-BY-SA-4.0',
-            'GFDL-1.1',
-            'GFDL-1.2',
-            'GFDL-1.3',
-            'FSFAP'
-        ]
-        if self.metadata_license not in valid_licenses:
-            raise ValidationError('Invalid <metadata_license> tag')
+            yield 'No <metadata_license> tag'
+        elif self.metadata_license not in _VALID_METADATA_LICENSES:
+            yield 'Invalid <metadata_license> tag'
         if not self.project_license or len(self.project_license) == 0:
-            raise ValidationError('No <project_license> tag')
+            yield 'No <project_license> tag'
         if not self.developer_name or len(self.developer_name) == 0:
-            raise ValidationError('No <developer_name> tag')
+            yield 'No <developer_name> tag'
 
         # verify release objects
         for rel in self.releases:
             if not rel.version or len(rel.version) == 0:
-                raise ValidationError('No version in <release> tag')
+                yield 'No version in <release> tag'
             if rel.timestamp == 0:
-                raise ValidationError('No timestamp in <release> tag')
+                yield 'No timestamp in <release> tag'
+
+    def get_problems(self):
+        """ Returns a list of all the validation problems """
+        return list(self._iter_problems())
 
-    def parse(self, xml_data):
+    def validate(self):
         """ Parse XML data """
+        for problem in self._iter_problems():
+            raise ValidationError(problem)
+
+    def parse(self, xml_data, locales=None, fields=None, backend='tree',
+              limits=None):
+        """ Parse XML data
+
+        If locales is set then translations for any other locale are skipped,
+        although the untranslated values are always kept.
+
+        If fields is set then only those attributes are parsed, e.g.
+        ['provides', 'releases']. XML data is then always parsed from events,
+        so the other sections are skipped as they are read.
+
+        The 'events' backend builds the objects directly from parser events
+        rather than building an element tree first. It only changes the
+        component once all of the data has been parsed, so it is left as it
+        was if a ParseError is raised.
+
+        If limits is a ParseLimits then a ParseError is raised as soon as the
+        data exceeds any of them.
+        """
+
+        if backend not in BACKENDS:
+            raise ValueError('Unknown parse backend %s' % backend)
+
+        # parse events into a new component, so that this one is only
+        # changed if all of the data is valid
+        fields = _get_fields(fields)
+        if (backend == 'events' or fields is not None) and \
+           isinstance(xml_data, string_types):
+            parsed = Component()
+            parser = parsed._new_feed_parser(locales, fields, limits)
+            parser.feed(xml_data)
+            parser.close()
+            for key in parsed.__dict__:
+                if key not in self._TRANSIENT:
+                    self.__dict__[key] = parsed.__dict__[key]
+            return
 
         # parse tree
         if isinstance(xml_data, string_types):
             # Presumably, this is textual xml data.
-            try:
-                root = ET.fromstring(xml_data)
-            except StdlibParseError as e:
-                raise ParseError(str(e))
+            root = _parse_xml(xml_data, limits=limits, component_depth=1)
         else:
             # Otherwise, assume it has already been parsed into a tree
             root = xml_data
+        self._parse_tree(root, _expand_locales(locales), fields)
+
+    def _new_feed_parser(self, locales, fields, limits):
+        """ Returns a FeedParser that parses into this component """
+        from appstream.builder import ComponentBuilder, FeedParser
+        builder = ComponentBuilder(lambda component: None,
+                                   component_depth=1,
+                                   locales=_expand_locales(locales),
+                                   fields=_get_fields(fields),
+                                   new_component=lambda: self)
+        return FeedParser(builder, limits, component_depth=1)
+
+    def start_feed(self, locales=None, fields=None, limits=None):
+        """ Start parsing XML pushed a chunk at a time with feed()
+
+        This is only needed to set options like those of parse(); feed()
+        starts with the defaults otherwise.
+        """
+        self._feed_parser = self._new_feed_parser(locales, fields, limits)
+
+    def feed(self, data):
+        """ Parse the next chunk of XML data """
+        if self._feed_parser is None:
+            self.start_feed()
+        try:
+            self._feed_parser.feed(data)
+        except ParseError:
+            self._feed_parser = None
+            raise
+
+    def close(self):
+        """ Finish parsing the data passed to feed() """
+        parser = self._feed_parser
+        self._feed_parser = None
+        if parser is not None:
+            parser.close()
+
+    def _parse_tree(self, root, locales=None, fields=None):
+        """ Parse a <component> object, keeping only translations in locales """
 
         # get type
         if 'type' in root.attrib:
@@ -553,20 +873,12 @@ class Component(object):
         # parse component
         for c1 in root:
 
-            # <id>
-            if c1.tag == 'id':
-                self.id = c1.text
-
-            # <updatecontact>
-            elif c1.tag == 'updatecontact' or c1.tag == 'update_contact':
-                self.update_contact = c1.text
-
-            # <metadata_license>
-            elif c1.tag == 'metadata_license':
-                self.metadata_license = c1.text
+            # not wanted
+            if fields is not None and _FIELD_FOR_TAG.get(c1.tag) not in fields:
+                continue
 
             # <releases>
-            elif c1.tag == 'releases':
+            if c1.tag == 'releases':
                 for c2 in c1:
                     if c2.tag == 'release':
                         rel = Release()
@@ -589,97 +901,141 @@ class Component(object):
                         ss._parse_tree(c2)
                         self.add_screenshot(ss)
 
-            # <provides>
-            elif c1.tag == 'provides':
+            # <provides>, <requires>, <kudos>, <keywords>, <categories>, <custom>
+            elif c1.tag in _LIST_SECTIONS:
                 for c2 in c1:
-                    prov = Provide()
-                    prov._parse_tree(c2)
-                    self.add_provide(prov)
+                    self._parse_item(c1.tag, c2.tag, c2.attrib, c2.text)
 
-            # <requires>
-            elif c1.tag == 'requires':
-                for c2 in c1:
-                    req = Require()
-                    req._parse_tree(c2)
-                    self.add_require(req)
+            # <description>
+            elif c1.tag == 'description':
+                lang = _get_lang(c1.attrib)
+                if self._want_description(lang, locales):
+                    self._set_description(lang, _parse_desc(c1))
 
-            # <kudos>
-            elif c1.tag == 'kudos':
-                for c2 in c1:
-                    if not c2.tag == 'kudo':
-                        continue
-                    self.kudos.append(c2.text)
+            # everything else only has text
+            else:
+                self._parse_child(c1.tag, c1.attrib, c1.text, locales)
 
-            # <keywords>
-            elif c1.tag == 'keywords':
-                for c2 in c1:
-                    if not c2.tag == 'keyword':
-                        continue
-                    self.keywords.append(c2.text)
+    def _want_description(self, lang, locales):
+        """ Returns if a <description> in this language should be parsed """
+        if lang:
+            if lang in self.descriptions:
+                return False
+            if locales is not None and lang not in locales:
+                return False
+            return True
+        return not self.description
 
-            # <categories>
-            elif c1.tag == 'categories':
-                for c2 in c1:
-                    if not c2.tag == 'category':
-                        continue
-                    self.categories.append(c2.text)
+    def _set_description(self, lang, description):
+        if lang:
+            self.descriptions[lang] = description
+        else:
+            self.description = description
 
-            # <custom>
-            elif c1.tag == 'custom':
-                for c2 in c1:
-                    if not c2.tag == 'value':
-                        continue
-                    if 'key' not in c2.attrib:
-                        continue
-                    self.custom[c2.attrib['key']] = c2.text
+    def _parse_item(self, section, tag, attrib, text):
+        """ Parse a child element of one of the list sections """
 
-            # <project_license>
-            elif c1.tag == 'project_license' or c1.tag == 'licence':
-                self.project_license = c1.text
+        # <provides>
+        if section == 'provides':
+            prov = Provide()
+            prov._parse_element(tag, attrib, text)
+            self.add_provide(prov)
 
-            # <developer_name>
-            elif c1.tag == 'developer_name':
-                self.developer_name = _join_lines(c1.text)
+        # <requires>
+        elif section == 'requires':
+            req = Require()
+            req._parse_element(tag, attrib, text)
+            self.add_require(req)
 
-            # <name>
-            elif c1.tag == 'name' and not self.name:
-                self.name = _join_lines(c1.text)
+        # <kudos>
+        elif section == 'kudos':
+            if tag == 'kudo':
+                self.kudos.append(text)
 
-            # <pkgname>
-            elif c1.tag == 'pkgname' and not self.pkgname:
-                self.pkgname = _join_lines(c1.text)
+        # <keywords>
+        elif section == 'keywords':
+            if tag == 'keyword':
+                self.keywords.append(text)
 
-            # <summary>
-            elif c1.tag == 'summary' and not self.summary:
-                self.summary = _join_lines(c1.text)
+        # <categories>
+        elif section == 'categories':
+            if tag == 'category':
+                self.categories.append(text)
 
-            # <description>
-            elif c1.tag == 'description' and not self.description:
-                self.description = _parse_desc(c1)
-
-            # <url>
-            elif c1.tag == 'url':
-                key = 'homepage'
-                if 'type' in c1.attrib:
-                    key = c1.attrib['type']
-                self.urls[key] = c1.text
-
-            # <icon>
-            elif c1.tag == 'icon':
-                key = c1.attrib.pop('type', 'unknown')
-                c1.attrib['value'] = c1.text
-                self.icons[key] = self.icons.get(key, []) + [c1.attrib]
-
-            # <bundle>
-            elif c1.tag == 'bundle':
-                type = c1.attrib.pop('type', 'unknown')
-                runtime = c1.attrib.pop('runtime', 'unknown')
-                sdk = c1.attrib.pop('sdk', 'unknown')
-                value = c1.text
-                self.bundle = {
-                    'type': type,
-                    'runtime': runtime,
-                    'sdk': sdk,
-                    'value': value
-                }
+        # <custom>
+        elif section == 'custom':
+            if tag == 'value' and 'key' in attrib:
+                self.custom[attrib['key']] = text
+
+    def _parse_child(self, tag, attrib, text, locales=None):
+        """ Parse a child element of <component> that only has text """
+
+        # <id>
+        if tag == 'id':
+            self.id = text
+
+        # <updatecontact>
+        elif tag == 'updatecontact' or tag == 'update_contact':
+            self.update_contact = text
+
+        # <metadata_license>
+        elif tag == 'metadata_license':
+            self.metadata_license = text
+
+        # <project_license>
+        elif tag == 'project_license' or tag == 'licence':
+            self.project_license = text
+
+        # <developer_name>
+        elif tag == 'developer_name':
+            self.developer_name = _join_lines(text)
+
+        # <name>
+        elif tag == 'name':
+            lang = _get_lang(attrib)
+            if lang:
+                if lang in self.names:
+                    return
+                if locales is not None and lang not in locales:
+                    return
+                self.names[lang] = _join_lines(text)
+            elif not self.name:
+                self.name = _join_lines(text)
+
+        # <pkgname>
+        elif tag == 'pkgname' and not self.pkgname:
+            self.pkgname = _join_lines(text)
+
+        # <summary>
+        elif tag == 'summary':
+            lang = _get_lang(attrib)
+            if lang:
+                if lang in self.summaries:
+                    return
+                if locales is not None and lang not in locales:
+                    return
+                self.summaries[lang] = _join_lines(text)
+            elif not self.summary:
+                self.summary = _join_lines(text)
+
+        # <url>
+        elif tag == 'url':
+            key = 'homepage'
+            if 'type' in attrib:
+                key = attrib['type']
+            self.urls[key] = text
+
+        # <icon>
+        elif tag == 'icon':
+            icon = Icon()
+            icon._parse_element(tag, attrib, text)
+            self.add_icon(icon)
 
+        # <bundle>
+        elif tag == 'bundle':
+            self.bundle = {
+                'type': attrib.get('type', 'unknown'),
+                'runtime': attrib.get('runtime', 'unknown'),
+                'sdk': attrib.get('sdk', 'unknown'),
+                'value': text
+            }
@@ -0,0 +1,77 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+from appstream.errors import ParseError
+from appstream.component import Component
+from appstream.utils import _escape, _parse_xml
+
+# A delta is a small XML document holding only what changed between two
+# versions of a catalog:
+#
+#  <components_delta version="0.9" origin="new-origin">
+#    <removed><id>org.example.Old</id></removed>
+#    <component type="firmware">...</component>
+#  </components_delta>
+#
+# Each <component> is either new or replaces the component with that ID.
+
+def make_delta(old, new, origin=None):
+    """ Returns a delta that turns one dict of components into another
+
+    Components are compared using their XML, so any change to a component
+    includes the whole of it in the delta.
+    """
+    removed = [app_id for app_id in sorted(old) if app_id not in new]
+    changed = []
+    for app_id in sorted(new):
+        xml = new[app_id].to_xml()
+        if app_id not in old or old[app_id].to_xml() != xml:
+            changed.append(xml)
+
+    xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    xml += '<components_delta version="0.9" origin="%s">\n' % _escape(origin)
+    if removed:
+        xml += '  <removed>\n'
+        for app_id in removed:
+            xml += '    <id>%s</id>\n' % _escape(app_id)
+        xml += '  </removed>\n'
+    xml += ''.join(changed)
+    xml += '</components_delta>\n'
+    return xml
+
+def parse_delta(xml_data):
+    """ Returns the origin, removed IDs and changed components of a delta """
+    root = _parse_xml(xml_data)
+    if root.tag != 'components_delta':
+        raise ParseError('Expected <components_delta>, got <%s>' % root.tag)
+    origin = root.attrib.get('origin')
+    removed = []
+    components = []
+    for child in root:
+        if child.tag == 'removed':
+            for c2 in child:
+                if c2.tag == 'id' and c2.text:
+                    removed.append(c2.text.strip())
+        elif child.tag == 'component':
+            component = Component()
+            component._parse_tree(child)
+            component.origin = origin
+            components.append(component)
+    return origin, removed, components
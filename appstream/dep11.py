@@ -0,0 +1,276 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+import gzip
+import io
+import itertools
+
+from appstream.errors import ParseError
+from appstream.component import Component, Icon, Image, Provide, Release, Screenshot
+from appstream.utils import _expand_locales
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+def _get_yaml():
+    """ Returns the yaml module, which is only needed for DEP-11 """
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError('PyYAML is required for DEP-11 support')
+    return yaml
+
+def _open_maybe_gzip(f):
+    """ Returns a file object that decompresses the data if required """
+    if not hasattr(f, 'peek'):
+        f = io.BufferedReader(f)
+    if f.peek(2)[:2] == _GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    return f
+
+def _split_localized(values, locales):
+    """ Returns the untranslated value and the wanted translations """
+    if not isinstance(values, dict):
+        return values, {}
+    translations = {}
+    for lang in values:
+        if lang == 'C':
+            continue
+        if locales is not None and lang not in locales:
+            continue
+        translations[lang] = values[lang]
+    return values.get('C'), translations
+
+def _to_localized(value, translations):
+    """ Returns the DEP-11 dict for a translated value """
+    values = {}
+    if value:
+        values['C'] = value
+    values.update(translations)
+    return values
+
+def _image_from_dep11(doc, kind):
+    im = Image()
+    im.kind = kind
+    im.url = doc.get('url')
+    im.width = int(doc.get('width', 0))
+    im.height = int(doc.get('height', 0))
+    return im
+
+def _image_to_dep11(im):
+    doc = {'url': im.url}
+    if im.width > 0:
+        doc['width'] = im.width
+    if im.height > 0:
+        doc['height'] = im.height
+    return doc
+
+def component_from_dep11(doc, locales=None):
+    """ Returns a Component for a DEP-11 document
+
+    The locales must already have been expanded with _expand_locales().
+    """
+    app = Component()
+    app.id = doc.get('ID')
+    app.kind = doc.get('Type')
+    app.pkgname = doc.get('Package')
+    app.name, app.names = _split_localized(doc.get('Name'), locales)
+    app.summary, app.summaries = _split_localized(doc.get('Summary'), locales)
+    app.description, app.descriptions = \
+        _split_localized(doc.get('Description'), locales)
+    if app.description:
+        app.description = app.description.strip()
+    app.developer_name = _split_localized(doc.get('DeveloperName'), locales)[0]
+    app.project_license = doc.get('ProjectLicense')
+    app.metadata_license = doc.get('MetadataLicense')
+    app.categories = list(doc.get('Categories', []))
+    keywords = _split_localized(doc.get('Keywords'), locales)[0]
+    if keywords:
+        app.keywords = list(keywords)
+    urls = doc.get('Url')
+    if urls:
+        app.urls = dict(urls)
+    for kind, icons in (doc.get('Icon') or {}).items():
+        if not isinstance(icons, list):
+            icons = [{'name': icons}]
+        for tmp in icons:
+            icon = Icon()
+            icon.kind = kind
+            icon.value = tmp.get('name', tmp.get('url'))
+            icon.width = int(tmp.get('width', 0))
+            icon.height = int(tmp.get('height', 0))
+            icon.scale = int(tmp.get('scale', 1))
+            app.add_icon(icon)
+    for provide in (doc.get('Provides') or {}).get('firmware', []):
+        prov = Provide()
+        if provide.get('type'):
+            prov.kind = 'firmware-%s' % provide['type']
+        prov.value = provide.get('guid', '').lower()
+        app.add_provide(prov)
+    for release in doc.get('Releases', []):
+        rel = Release()
+        if 'version' in release:
+            rel.version = str(release['version'])
+        rel.timestamp = int(release.get('unix-timestamp', 0))
+        rel.urgency = release.get('urgency')
+        rel.description = _split_localized(release.get('description'), locales)[0]
+        app.add_release(rel)
+    for screenshot in doc.get('Screenshots', []):
+        ss = Screenshot()
+        if screenshot.get('default'):
+            ss.kind = 'default'
+        ss.caption = _split_localized(screenshot.get('caption'), locales)[0]
+        if 'source-image' in screenshot:
+            ss.images.append(_image_from_dep11(screenshot['source-image'], 'source'))
+        for thumbnail in screenshot.get('thumbnails', []):
+            ss.images.append(_image_from_dep11(thumbnail, 'thumbnail'))
+        app.add_screenshot(ss)
+    custom = doc.get('Custom')
+    if custom:
+        app.custom = dict(custom)
+    for bundle in doc.get('Bundles', [])[:1]:
+        app.bundle = {
+            'type': bundle.get('type', 'unknown'),
+            'runtime': bundle.get('runtime', 'unknown'),
+            'sdk': bundle.get('sdk', 'unknown'),
+            'value': bundle.get('id'),
+        }
+    return app
+
+def component_to_dep11(app):
+    """ Returns the DEP-11 document for a Component """
+    doc = {'ID': app.id}
+    if app.kind:
+        doc['Type'] = app.kind
+    if app.pkgname:
+        doc['Package'] = app.pkgname
+    for key, value, translations in [('Name', app.name, app.names),
+                                     ('Summary', app.summary, app.summaries),
+                                     ('Description', app.description, app.descriptions)]:
+        if value or translations:
+            doc[key] = _to_localized(value, translations)
+    if app.developer_name:
+        doc['DeveloperName'] = {'C': app.developer_name}
+    if app.project_license:
+        doc['ProjectLicense'] = app.project_license
+    if app.metadata_license:
+        doc['MetadataLicense'] = app.metadata_license
+    if app.categories:
+        doc['Categories'] = list(app.categories)
+    if app.keywords:
+        doc['Keywords'] = {'C': list(app.keywords)}
+    if app.urls:
+        doc['Url'] = dict(app.urls)
+    if app.icons:
+        doc['Icon'] = {}
+        for kind in app.icons:
+            icons = []
+            for icon in app.icons[kind]:
+                tmp = {'url' if kind == 'remote' else 'name': icon.value}
+                if icon.width > 0:
+                    tmp['width'] = icon.width
+                if icon.height > 0:
+                    tmp['height'] = icon.height
+                if icon.scale > 1:
+                    tmp['scale'] = icon.scale
+                icons.append(tmp)
+            if kind == 'stock':
+                doc['Icon'][kind] = icons[0]['name']
+            else:
+                doc['Icon'][kind] = icons
+    provides = []
+    for prov in app.provides:
+        provide = {'guid': prov.value}
+        if prov.kind and prov.kind.startswith('firmware-'):
+            provide['type'] = prov.kind[9:]
+        provides.append(provide)
+    if provides:
+        doc['Provides'] = {'firmware': provides}
+    if app.releases:
+        doc['Releases'] = []
+        for rel in app.releases:
+            release = {'version': rel.version, 'unix-timestamp': rel.timestamp}
+            if rel.urgency:
+                release['urgency'] = rel.urgency
+            if rel.description:
+                release['description'] = {'C': rel.description}
+            doc['Releases'].append(release)
+    if app.screenshots:
+        doc['Screenshots'] = []
+        for ss in app.screenshots:
+            screenshot = {}
+            if ss.kind == 'default':
+                screenshot['default'] = True
+            if ss.caption:
+                screenshot['caption'] = {'C': ss.caption}
+            for im in ss.images:
+                if im.kind == 'thumbnail':
+                    screenshot.setdefault('thumbnails', []).append(_image_to_dep11(im))
+                else:
+                    screenshot['source-image'] = _image_to_dep11(im)
+            doc['Screenshots'].append(screenshot)
+    if app.custom:
+        doc['Custom'] = dict(app.custom)
+    if app.bundle:
+        bundle = {'type': app.bundle['type'], 'id': app.bundle['value']}
+        for key in ['runtime', 'sdk']:
+            if app.bundle.get(key, 'unknown') != 'unknown':
+                bundle[key] = app.bundle[key]
+        doc['Bundles'] = [bundle]
+    return doc
+
+def read_dep11(f, locales=None):
+    """ Returns the header and a generator of Components from a DEP-11 file
+
+    The file object may be gzip compressed, and the components are parsed
+    one document at a time as the generator is consumed.
+    """
+    yaml = _get_yaml()
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    locales = _expand_locales(locales)
+    docs = yaml.load_all(_open_maybe_gzip(f), Loader=loader)
+    try:
+        header = next(docs)
+    except StopIteration:
+        raise ParseError('No DEP-11 header')
+    except yaml.YAMLError as e:
+        raise ParseError(str(e))
+    if not isinstance(header, dict) or header.get('File') != 'DEP-11':
+        raise ParseError('Not a DEP-11 file')
+
+    def _iter_components():
+        try:
+            for doc in docs:
+                if doc:
+                    yield component_from_dep11(doc, locales)
+        except yaml.YAMLError as e:
+            raise ParseError(str(e))
+    return header, _iter_components()
+
+def write_dep11(components, f, origin=None, version='0.8'):
+    """ Write a DEP-11 file one document per component """
+    yaml = _get_yaml()
+    dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    header = {'File': 'DEP-11', 'Version': version}
+    if origin:
+        header['Origin'] = origin
+    for doc in itertools.chain([header], map(component_to_dep11, components)):
+        f.write(yaml.dump(doc, Dumper=dumper, explicit_start=True,
+                          default_flow_style=False, allow_unicode=True,
+                          encoding='utf-8'))
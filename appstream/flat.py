@@ -0,0 +1,294 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+import codecs
+import io
+import mmap
+import os
+import pickle
+import struct
+import types
+
+from appstream.errors import ParseError
+from appstream import component as _component
+from appstream.component import Component, _restore
+
+# A flat catalog is a single buffer that can be mapped by many processes:
+#
+#  magic, then the number of components and the lengths of the origin and
+#  of the field names
+#  the UTF-8 origin
+#  the space-separated names of the component fields in the order written
+#  one (id offset, id length, table offset) entry per component, sorted by
+#  the UTF-8 ID so lookups can bisect without building a dict
+#  per component: the UTF-8 ID, then a table with the start offset of each
+#  field and the end of the last one, then the fields themselves
+#
+# Each field is pickled on its own, followed by one more slot for any
+# attributes that are not fields, so reading an attribute only decodes
+# that one value. A field that still has its default value is left empty.
+# Nothing is decoded until it is used, so attaching costs the same for any
+# size of catalog and the pages stay shared between processes.
+
+_MAGIC = b'ASFLAT02'
+_HEADER = struct.Struct('<III')
+_ENTRY = struct.Struct('<III')
+_OFFSET = struct.Struct('<I')
+_RANGE = struct.Struct('<II')
+
+# the protocol both Python 2 and 3 can read
+_PROTOCOL = 2
+
+_DEFAULTS = dict(zip(Component._FIELDS, Component()._get_state()))
+
+def _get_default(name):
+    """ Returns a new default value for a component field """
+    value = _DEFAULTS[name]
+    if type(value) in (list, dict):
+        return type(value)()
+    return value
+
+# the other globals plain values need when pickled with _PROTOCOL
+_SAFE_GLOBALS = {
+    ('__builtin__', 'set'): set,
+    ('__builtin__', 'frozenset'): frozenset,
+    ('builtins', 'set'): set,
+    ('builtins', 'frozenset'): frozenset,
+    ('_codecs', 'encode'): codecs.encode,
+}
+
+class _Unpickler(pickle.Unpickler):
+    """ Only allows the model classes and plain values in a catalog """
+    def find_class(self, module, name):
+        if module == _component.__name__:
+            value = getattr(_component, name, None)
+            if value is _restore or (isinstance(value, type) and
+                                     issubclass(value, _component._Model)):
+                return value
+        value = _SAFE_GLOBALS.get((module, name))
+        if value is None:
+            raise ParseError('Unexpected %s.%s in flat catalog' % (module, name))
+        return value
+
+def _dumps(value):
+    return pickle.dumps(value, _PROTOCOL)
+
+def _loads(data):
+    return _Unpickler(io.BytesIO(data)).load()
+
+def _encode_component(component):
+    """ Returns the encoded fields of a component, then the other attributes """
+    attrs = component.__dict__
+    blobs = []
+    for name in Component._FIELDS:
+        value = attrs[name]
+        default = _DEFAULTS[name]
+        if type(value) is type(default) and value == default:
+            blobs.append(b'')
+        else:
+            blobs.append(_dumps(value))
+    extra = dict((key, attrs[key]) for key in attrs
+                 if key not in _DEFAULTS and key not in Component._TRANSIENT)
+    blobs.append(_dumps(extra) if extra else b'')
+    return blobs
+
+def write_flat(components, f, origin=None):
+    """ Write components to a file object as a flat catalog """
+    items = sorted((c.id.encode('utf-8'), _encode_component(c))
+                   for c in components)
+    origin_data = (origin or '').encode('utf-8')
+    names_data = ' '.join(Component._FIELDS).encode('utf-8')
+    offset = len(_MAGIC) + _HEADER.size + len(origin_data) + len(names_data) + \
+        _ENTRY.size * len(items)
+    table_size = _OFFSET.size * (len(Component._FIELDS) + 2)
+    entries = []
+    tables = []
+    for app_id, blobs in items:
+        table_off = offset + len(app_id)
+        entries.append(_ENTRY.pack(offset, len(app_id), table_off))
+        offset = table_off + table_size
+        table = []
+        for blob in blobs:
+            table.append(_OFFSET.pack(offset))
+            offset += len(blob)
+        table.append(_OFFSET.pack(offset))
+        tables.append(b''.join(table))
+    f.write(_MAGIC)
+    f.write(_HEADER.pack(len(items), len(origin_data), len(names_data)))
+    f.write(origin_data)
+    f.write(names_data)
+    f.write(b''.join(entries))
+    for (app_id, blobs), table in zip(items, tables):
+        f.write(app_id)
+        f.write(table)
+        f.write(b''.join(blobs))
+
+class FlatComponent(object):
+    """ A view of one component in a flat catalog
+
+    The ID is read straight from the buffer, and any other attribute only
+    decodes that field each time it is used, so nothing is kept per view.
+    Component methods such as to_xml() and get_name() work on the view, or
+    get_component() returns a complete copy of the component.
+    """
+    __slots__ = ('_store', '_idx')
+
+    def __init__(self, store, idx):
+        self._store = store
+        self._idx = idx
+
+    @property
+    def id(self):
+        return self._store._get_id(self._idx).decode('utf-8')
+
+    def get_component(self):
+        """ Returns a new Component with every field decoded """
+        store = self._store
+        values = [store._get_field(self._idx, name) for name in Component._FIELDS]
+        component = _restore(Component, values)
+        component.__dict__.update(store._get_extra(self._idx))
+        return component
+
+    def to_xml(self):
+        return self.get_component().to_xml()
+
+    def __getattr__(self, name):
+        if name in _DEFAULTS:
+            return self._store._get_field(self._idx, name)
+        if name.startswith('__'):
+            raise AttributeError(name)
+        method = getattr(Component, name, None)
+        if callable(method):
+            method = getattr(method, '__func__', method)
+            return types.MethodType(method, self)
+        extra = self._store._get_extra(self._idx)
+        if name in extra:
+            return extra[name]
+        raise AttributeError(name)
+
+class FlatStore(object):
+    """ A read-only store backed by a flat catalog buffer
+
+    The buffer is either bytes or an mmap; open() maps a file written by
+    Store.to_flat_file() so every process that opens it shares one copy of
+    the catalog in the page cache.
+    """
+    def __init__(self, buf):
+        """ Set defaults """
+        if buf[:len(_MAGIC)] != _MAGIC:
+            raise ParseError('Not a flat catalog')
+        self._buf = buf
+        self._mmap = None
+        offset = len(_MAGIC)
+        self._count, origin_len, names_len = _HEADER.unpack_from(buf, offset)
+        offset += _HEADER.size
+        self.origin = buf[offset:offset + origin_len].decode('utf-8') or None
+        offset += origin_len
+        names = buf[offset:offset + names_len].decode('utf-8').split(' ')
+        self._positions = dict((name, idx) for idx, name in enumerate(names))
+        self._extra_position = len(names)
+        self._entries = offset + names_len
+
+    @classmethod
+    def open(cls, filename):
+        """ Map a flat catalog file into memory """
+        with open(filename, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        store = cls(buf)
+        store._mmap = buf
+        return store
+
+    def close(self):
+        """ Unmap the file; views must not be used afterwards """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _get_entry(self, idx):
+        return _ENTRY.unpack_from(self._buf, self._entries + idx * _ENTRY.size)
+
+    def _get_id(self, idx):
+        id_off, id_len, _ = self._get_entry(idx)
+        return self._buf[id_off:id_off + id_len]
+
+    def _get_blob(self, idx, position):
+        """ Returns the encoded data in one slot of a component """
+        _, _, table_off = self._get_entry(idx)
+        start, end = _RANGE.unpack_from(self._buf,
+                                        table_off + position * _OFFSET.size)
+        return self._buf[start:end]
+
+    def _get_field(self, idx, name):
+        """ Returns the decoded value of one field of a component """
+        position = self._positions.get(name)
+        if position is None:
+            return _get_default(name)
+        data = self._get_blob(idx, position)
+        if not data:
+            return _get_default(name)
+        return _loads(data)
+
+    def _get_extra(self, idx):
+        """ Returns the attributes of a component that are not fields """
+        data = self._get_blob(idx, self._extra_position)
+        if not data:
+            return {}
+        return _loads(data)
+
+    def _find(self, app_id):
+        """ Returns the index of a component, or -1 if it does not exist """
+        key = app_id.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get_id(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._get_id(lo) == key:
+            return lo
+        return -1
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, app_id):
+        return self._find(app_id) >= 0
+
+    def get_component(self, app_id):
+        """ Finds an application, returning a FlatComponent or None """
+        idx = self._find(app_id)
+        if idx < 0:
+            return None
+        return FlatComponent(self, idx)
+
+    def get_components(self):
+        """ Returns views of all the applications, in ID order """
+        return [FlatComponent(self, idx) for idx in range(self._count)]
+
+def write_flat_file(components, filename, origin=None):
+    """ Write a flat catalog file, replacing any existing one atomically
+
+    Processes that already have the old file mapped keep using it.
+    """
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        write_flat(components, f, origin)
+    os.rename(tmp, filename)
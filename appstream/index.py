@@ -0,0 +1,481 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+import heapq
+import itertools
+from operator import itemgetter
+from bisect import bisect_left, bisect_right, insort
+
+# Store indexes all have add(component) and remove(component) methods, and
+# are kept up to date by the Store as components are added or replaced. They
+# are first filled using build(components), which can be much faster than
+# adding each component in turn.
+
+def _best_fit(sizes, items, target):
+    """ Returns the smallest item at least as big as target, else the largest """
+    if not items:
+        return None
+    idx = bisect_left(sizes, target)
+    if idx < len(items):
+        return items[idx]
+    return items[-1]
+
+class _SizeTable(object):
+    """ Items sorted by size, with the best fit precomputed for common sizes """
+    def __init__(self, sized, buckets):
+        sized.sort(key=lambda item: item[0])
+        self.sizes = [size for size, _ in sized]
+        self.items = [item for _, item in sized]
+        self.buckets = {}
+        for target in buckets:
+            self.buckets[target] = _best_fit(self.sizes, self.items, target)
+
+    def lookup(self, target):
+        if target in self.buckets:
+            return self.buckets[target]
+        return _best_fit(self.sizes, self.items, target)
+
+class MediaIndex(object):
+    """ Best-fit icon and screenshot image lookups for each component """
+
+    # the pixel sizes that are precomputed for each component
+    ICON_SIZES = [16, 24, 32, 48, 64, 96, 128, 192, 256, 384, 512]
+    IMAGE_WIDTHS = [112, 224, 624, 752, 1248, 1504]
+
+    def __init__(self):
+        """ Set defaults """
+        self._icons = {}
+        self._unsized_icons = {}
+        self._images = {}
+
+    def add(self, component):
+        """ Precompute the best icons and images for a component """
+        sized = []
+        unsized = None
+        for kind in component.icons:
+            for icon in component.icons[kind]:
+                if icon.width > 0:
+                    sized.append((icon.width * icon.scale, icon))
+                elif unsized is None or icon.kind == 'stock':
+                    unsized = icon
+        if sized:
+            self._icons[component.id] = _SizeTable(sized, self.ICON_SIZES)
+        if unsized:
+            self._unsized_icons[component.id] = unsized
+
+        # use the default screenshot, else the first one
+        screenshots = [ss for ss in component.screenshots if ss.kind == 'default']
+        screenshots.extend(component.screenshots)
+        if screenshots:
+            sized = []
+            for im in screenshots[0].images:
+                # the source image is the largest available
+                width = im.width
+                if width == 0 and im.kind == 'source':
+                    width = 1 << 30
+                if width > 0:
+                    sized.append((width, im))
+            if sized:
+                self._images[component.id] = _SizeTable(sized, self.IMAGE_WIDTHS)
+
+    def build(self, components):
+        """ Add many components to an empty index """
+        for component in components:
+            self.add(component)
+
+    def remove(self, component):
+        """ Forget a component """
+        self._icons.pop(component.id, None)
+        self._unsized_icons.pop(component.id, None)
+        self._images.pop(component.id, None)
+
+    def best_icon(self, component_id, size=64, scale=1):
+        """ Returns the smallest icon at least size*scale pixels wide
+
+        If no icon is large enough the largest one is returned, and icons
+        of unknown size such as stock icons are only used as a fallback.
+        """
+        table = self._icons.get(component_id)
+        if table:
+            return table.lookup(size * scale)
+        return self._unsized_icons.get(component_id)
+
+    def best_screenshot_image(self, component_id, width):
+        """ Returns the smallest image of the default screenshot at least width wide """
+        table = self._images.get(component_id)
+        if table:
+            return table.lookup(width)
+        return None
+
+class AttributeIndex(object):
+    """ The IDs of the components with each value of some attributes
+
+    Each key is a (field, value) tuple, e.g. ('category', 'Audio'), and
+    maps to the set of component IDs that have it.
+    """
+    def __init__(self):
+        """ Set defaults """
+        self._ids = {}
+        self._keys = {}
+
+    @staticmethod
+    def _get_keys(component):
+        keys = set()
+        keys.add(('kind', component.kind))
+        keys.add(('project_license', component.project_license))
+        for category in component.categories:
+            keys.add(('category', category))
+        for prov in component.provides:
+            keys.add(('provides', prov.value))
+        for req in component.requires:
+            keys.add(('requires', req.value))
+        for rel in component.releases:
+            keys.add(('urgency', rel.urgency))
+        return keys
+
+    def add(self, component):
+        """ Add the attributes of a component """
+        self.remove(component)
+        keys = self._get_keys(component)
+        self._keys[component.id] = keys
+        for key in keys:
+            self._ids.setdefault(key, set()).add(component.id)
+
+    def build(self, components):
+        """ Add many components to an empty index """
+        for component in components:
+            self.add(component)
+
+    def remove(self, component):
+        """ Forget a component """
+        for key in self._keys.pop(component.id, ()):
+            ids = self._ids.get(key)
+            if ids is not None:
+                ids.discard(component.id)
+                if not ids:
+                    del self._ids[key]
+
+    def lookup(self, field, value):
+        """ Returns the set of IDs with a value, which must not be modified """
+        return self._ids.get((field, value), frozenset())
+
+class TimelineIndex(object):
+    """ Every release in the store, sorted by timestamp
+
+    The keys are (timestamp, component ID, release number) tuples kept in a
+    sorted list, with the timestamp and the (component ID, release) of each
+    in parallel lists, so releases after a time are found with a binary
+    search. The index is built with a single sort, and only components
+    added after that are inserted one release at a time.
+    """
+    def __init__(self):
+        """ Set defaults """
+        self._keys = []
+        self._timestamps = []
+        self._releases = []
+        self._keys_for_id = {}
+
+    def add(self, component):
+        """ Add the releases of a component """
+        self.remove(component)
+        keys = []
+        for idx, rel in enumerate(component.releases):
+            key = (rel.timestamp, component.id, idx)
+            pos = bisect_left(self._keys, key)
+            self._keys.insert(pos, key)
+            self._timestamps.insert(pos, rel.timestamp)
+            self._releases.insert(pos, (component.id, rel))
+            keys.append(key)
+        if keys:
+            self._keys_for_id[component.id] = keys
+
+    def build(self, components):
+        """ Add the releases of many components to an empty index """
+        entries = []
+        for component in components:
+            keys = []
+            for idx, rel in enumerate(component.releases):
+                key = (rel.timestamp, component.id, idx)
+                entries.append((key, rel))
+                keys.append(key)
+            if keys:
+                self._keys_for_id[component.id] = keys
+        entries.sort(key=itemgetter(0))
+        self._keys = [key for key, _ in entries]
+        self._timestamps = [key[0] for key in self._keys]
+        self._releases = [(key[1], rel) for key, rel in entries]
+
+    def remove(self, component):
+        """ Forget a component """
+        for key in self._keys_for_id.pop(component.id, ()):
+            pos = bisect_left(self._keys, key)
+            del self._keys[pos]
+            del self._timestamps[pos]
+            del self._releases[pos]
+
+    def _get_start(self, timestamp, cursor=None):
+        """ Returns the position of the first release after a time and cursor """
+        start = bisect_right(self._timestamps, timestamp)
+        if cursor is not None:
+            start = max(start, bisect_right(self._keys, cursor))
+        return start
+
+    def get_since(self, timestamp, limit=100, cursor=None):
+        """ Returns up to limit (component ID, release) tuples and a cursor
+
+        The releases have a timestamp after the one given and are sorted
+        oldest first. Passing the returned cursor back in gets the next
+        page; it is None when there are no more releases.
+        """
+        start = self._get_start(timestamp, cursor)
+        end = start + limit
+        next_cursor = None
+        if end < len(self._keys):
+            next_cursor = self._keys[end - 1]
+        return self._releases[start:end], next_cursor
+
+    def get_ids_since(self, timestamp):
+        """ Returns the set of component IDs with a release after a time """
+        start = self._get_start(timestamp)
+        return set(app_id for app_id, _ in self._releases[start:])
+
+# the pending changes to a PrefixIndex are sorted in with the other keys
+# if there are more than one in this many keys, rather than inserted
+_PREFIX_RESORT = 8
+
+class PrefixIndex(object):
+    """ The lower case ID, name and package name of every component, sorted
+
+    The keys are (text, component ID) tuples, so the components with a
+    prefix are found with a binary search. Keys added or removed since the
+    last lookup are kept in sets and only merged into the sorted list when
+    next needed, so building the index or replacing many components costs
+    a single sort, while a few changes are inserted in place.
+    """
+    def __init__(self):
+        """ Set defaults """
+        self._keys = []
+        self._keys_for_id = {}
+        self._added = set()
+        self._removed = set()
+
+    @staticmethod
+    def _get_texts(component):
+        texts = set()
+        for text in (component.id, component.name, component.pkgname):
+            if text:
+                texts.add(text.lower())
+        return sorted(texts)
+
+    def _flush(self):
+        """ Merge the pending changes into the sorted keys
+
+        A few changes are bisected into place, and only a batch as large as
+        a fraction of the index, such as when it is built, is sorted.
+        """
+        keys = self._keys
+        if len(self._added) + len(self._removed) > len(keys) // _PREFIX_RESORT + 1:
+            if self._removed:
+                removed = self._removed
+                keys = [key for key in keys if key not in removed]
+            keys.extend(self._added)
+            keys.sort()
+            self._keys = keys
+        else:
+            for key in self._removed:
+                pos = bisect_left(keys, key)
+                if pos < len(keys) and keys[pos] == key:
+                    del keys[pos]
+            for key in self._added:
+                insort(keys, key)
+        self._removed = set()
+        self._added = set()
+
+    def build(self, components):
+        """ Add many components to an empty index """
+        for component in components:
+            self.add(component)
+        self._flush()
+
+    def add(self, component):
+        """ Add the ID and names of a component """
+        self.remove(component)
+        texts = self._get_texts(component)
+        if not texts:
+            return
+        self._keys_for_id[component.id] = texts
+        for text in texts:
+            key = (text, component.id)
+            if key in self._removed:
+                self._removed.discard(key)
+            else:
+                self._added.add(key)
+
+    def remove(self, component):
+        """ Forget a component """
+        for text in self._keys_for_id.pop(component.id, ()):
+            key = (text, component.id)
+            if key in self._added:
+                self._added.discard(key)
+            else:
+                self._removed.add(key)
+
+    def complete(self, prefix, limit=10, cursor=None):
+        """ Returns up to limit component IDs and a cursor
+
+        The IDs are those of the components whose ID, name or package name
+        starts with the prefix, ignoring case, sorted by the text that
+        matched. Passing the returned cursor back in gets the next page; it
+        is None when there are no more matches.
+        """
+        self._flush()
+        prefix = prefix.lower()
+        keys = self._keys
+        if cursor is None:
+            pos = bisect_left(keys, (prefix,))
+        else:
+            pos = bisect_right(keys, cursor)
+        ids = []
+        while pos < len(keys):
+            text, app_id = keys[pos]
+            if not text.startswith(prefix):
+                break
+            # only the first text of a component that matches is used
+            for other in self._keys_for_id[app_id]:
+                if other.startswith(prefix):
+                    break
+            if other == text:
+                if len(ids) == limit:
+                    return ids, keys[pos - 1]
+                ids.append(app_id)
+            pos += 1
+        return ids, None
+
+class _RatingTotals(object):
+    """ The number and sum of a set of ratings """
+    __slots__ = ('count', 'total')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+
+    def add(self, rating):
+        self.count += 1
+        self.total += rating
+
+    def get_average(self):
+        if self.count == 0:
+            return None
+        return float(self.total) / self.count
+
+class _ComponentReviews(object):
+    """ The review aggregates for one component """
+    __slots__ = ('histogram', 'totals', 'locales', 'versions', 'top')
+
+    def __init__(self):
+        self.histogram = [0] * 6
+        self.totals = _RatingTotals()
+        self.locales = {}
+        self.versions = {}
+        self.top = {'karma': [], 'score': []}
+
+class ReviewIndex(object):
+    """ Rating histograms, averages and the top reviews for each component
+
+    Everything is updated as each review is added so queries do not depend
+    on the number of reviews. Ratings are 0 to 100, one star for each 20.
+    """
+
+    # the number of reviews kept for each ordering
+    TOP_N = 20
+
+    def __init__(self):
+        """ Set defaults """
+        self._components = {}
+        self._seq = itertools.count()
+
+    def add(self, component):
+        """ Add the reviews of a component """
+        self._components.pop(component.id, None)
+        for review in component.reviews:
+            self.add_review(component.id, review)
+
+    def build(self, components):
+        """ Add many components to an empty index """
+        for component in components:
+            self.add(component)
+
+    def remove(self, component):
+        """ Forget a component """
+        self._components.pop(component.id, None)
+
+    def add_review(self, component_id, review):
+        """ Add one review of a component """
+        item = self._components.get(component_id)
+        if item is None:
+            item = _ComponentReviews()
+            self._components[component_id] = item
+        rating = review.rating
+        item.histogram[min(max(rating, 0), 100) // 20] += 1
+        item.totals.add(rating)
+        if review.locale:
+            item.locales.setdefault(review.locale, _RatingTotals()).add(rating)
+        if review.version:
+            item.versions.setdefault(review.version, _RatingTotals()).add(rating)
+
+        # keep the best reviews in a bounded min-heap, earliest wins ties
+        seq = -next(self._seq)
+        for key in item.top:
+            heap = item.top[key]
+            entry = (getattr(review, key), seq, review)
+            if len(heap) < self.TOP_N:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    def get_histogram(self, component_id):
+        """ Returns the number of reviews with 0 to 5 stars """
+        item = self._components.get(component_id)
+        if item is None:
+            return [0] * 6
+        return list(item.histogram)
+
+    def get_average(self, component_id, locale=None, version=None):
+        """ Returns the average rating, optionally for one locale or version """
+        item = self._components.get(component_id)
+        if item is None:
+            return None
+        totals = item.totals
+        if locale is not None:
+            totals = item.locales.get(locale)
+        elif version is not None:
+            totals = item.versions.get(version)
+        if totals is None:
+            return None
+        return totals.get_average()
+
+    def get_top(self, component_id, limit=10, key='karma'):
+        """ Returns up to limit reviews with the highest karma or score """
+        item = self._components.get(component_id)
+        if item is None:
+            return []
+        if key not in item.top:
+            raise ValueError('Cannot order reviews by %s' % key)
+        return [entry[2] for entry in heapq.nlargest(limit, item.top[key])]
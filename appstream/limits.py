@@ -0,0 +1,113 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+from appstream.errors import ParseError
+
+# the amount of data passed to the parser at once
+_FEED_SIZE = 64 * 1024
+
+# the per-component limits, as section, child element and attribute name
+_COUNTED_SECTIONS = {
+    'releases': ('release', 'max_releases'),
+    'reviews': ('review', 'max_reviews'),
+    'screenshots': ('screenshot', 'max_screenshots'),
+}
+
+class ParseLimits(object):
+    """ Limits on the resources used when parsing untrusted data
+
+    Any limit left as None is not enforced. The limits are checked as the
+    data is parsed, so a ParseError is raised as soon as one is exceeded
+    rather than after the whole document has been built.
+    """
+    def __init__(self, max_bytes=None, max_depth=None, max_components=None,
+                 max_releases=None, max_reviews=None, max_screenshots=None):
+        """ Set defaults """
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.max_components = max_components
+        self.max_releases = max_releases
+        self.max_reviews = max_reviews
+        self.max_screenshots = max_screenshots
+
+    def check_size(self, size):
+        """ Raise a ParseError if the input is too large """
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise ParseError('Input is larger than %i bytes' % self.max_bytes)
+
+class _LimitedTarget(object):
+    """ A parser target that enforces limits before passing on the events """
+    def __init__(self, target, limits, component_depth):
+        self._target = target
+        self._limits = limits
+        self._component_depth = component_depth
+        self._depth = 0
+        self._components = 0
+        self._section = None
+        self._counts = {}
+
+    def start(self, tag, attrib):
+        self._depth += 1
+        limits = self._limits
+        if limits.max_depth is not None and self._depth > limits.max_depth:
+            raise ParseError('Elements nested deeper than %i' % limits.max_depth)
+        level = self._depth - self._component_depth
+        if level == 0:
+            self._components += 1
+            if limits.max_components is not None and \
+               self._components > limits.max_components:
+                raise ParseError('More than %i components' % limits.max_components)
+            self._counts = {}
+        elif level == 1:
+            self._section = tag
+        elif level == 2 and self._section in _COUNTED_SECTIONS:
+            child_tag, name = _COUNTED_SECTIONS[self._section]
+            if tag == child_tag:
+                count = self._counts.get(name, 0) + 1
+                self._counts[name] = count
+                limit = getattr(limits, name)
+                if limit is not None and count > limit:
+                    raise ParseError('More than %i <%s> in a component' % (limit, tag))
+        return self._target.start(tag, attrib)
+
+    def end(self, tag):
+        self._depth -= 1
+        return self._target.end(tag)
+
+    def data(self, data):
+        return self._target.data(data)
+
+    def close(self):
+        return self._target.close()
+
+def _feed(parser, xml_data, limits=None):
+    """ Feed XML data to a parser in chunks, returning the parser result """
+    if limits is not None:
+        limits.check_size(len(xml_data))
+    # lxml has a limit on how much can be fed at once
+    for offset in range(0, len(xml_data), _FEED_SIZE):
+        parser.feed(xml_data[offset:offset + _FEED_SIZE])
+    return parser.close()
+
+def _wrap_target(target, limits, component_depth):
+    """ Returns a target that enforces limits, if there are any """
+    if limits is None:
+        return target
+    return _LimitedTarget(target, limits, component_depth)
@@ -0,0 +1,153 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+import sys
+
+# the containers that are walked into
+_CONTAINERS = (list, tuple, set, frozenset)
+
+class _SizeWalker(object):
+    """ Adds up the deep size of each field and the size of each class
+
+    Every object is only counted once, the first time it is reached, so
+    objects shared between fields or with an index are not counted twice.
+    An object is added to every field it is nested in, so the size of
+    'Release.checksums' is also part of 'Component.releases'. The size of
+    an appstream object itself and of its attribute dict is added to its
+    class as well, and transient attributes such as the feed parser of a
+    component are skipped.
+    """
+    def __init__(self):
+        self.sizes = {}
+        self.classes = {}
+        self.total = 0
+        self.empty_count = 0
+        self.empty_bytes = 0
+        self._seen = set()
+
+    def _add(self, keys, size):
+        sizes = self.sizes
+        for key in keys:
+            sizes[key] = sizes.get(key, 0) + size
+        self.total += size
+
+    def walk(self, obj):
+        # avoid recursion, as review and description nesting is unbounded
+        stack = [(obj, ())]
+        while stack:
+            obj, keys = stack.pop()
+            if id(obj) in self._seen:
+                continue
+            self._seen.add(id(obj))
+            size = sys.getsizeof(obj)
+            if type(obj).__module__.startswith('appstream.'):
+                name = type(obj).__name__
+                transient = getattr(type(obj), '_TRANSIENT', {})
+                attrs = getattr(obj, '__dict__', None)
+                if attrs is not None:
+                    self._seen.add(id(attrs))
+                    size += sys.getsizeof(attrs)
+                    for attr in attrs:
+                        if attr not in transient:
+                            stack.append((attrs[attr], keys + ('%s.%s' % (name, attr),)))
+                for attr in getattr(type(obj), '__slots__', ()):
+                    if hasattr(obj, attr):
+                        stack.append((getattr(obj, attr), keys + ('%s.%s' % (name, attr),)))
+                self.classes[name] = self.classes.get(name, 0) + size
+                self._add(keys, size)
+                continue
+            self._add(keys, size)
+            if isinstance(obj, dict):
+                if not obj:
+                    self.empty_count += 1
+                    self.empty_bytes += size
+                for k in obj:
+                    stack.append((k, keys))
+                    stack.append((obj[k], keys))
+            elif isinstance(obj, _CONTAINERS):
+                if not obj:
+                    self.empty_count += 1
+                    self.empty_bytes += size
+                for value in obj:
+                    stack.append((value, keys))
+
+def memory_report(components, indexes=None, top=10):
+    """ Returns where the memory of some components and indexes goes
+
+    The result is a dict with:
+
+     - total: the deep size in bytes of everything reached
+     - fields: the deep size of each 'Class.field', e.g. 'Release.checksums',
+       including any objects nested in it, so nested fields overlap
+     - classes: bytes for the objects of each class and their attribute
+       dicts, not including the values of their fields
+     - top: the (ID, bytes) of the largest components, largest first
+     - indexes: bytes for each index not already counted in a component
+     - empty_containers: the number and bytes of empty lists and dicts
+
+    Sizes come from sys.getsizeof() so they do not include allocator
+    overhead, and interned strings shared with the rest of the program are
+    counted where they are first reached.
+    """
+    walker = _SizeWalker()
+    per_component = []
+    for component in components:
+        before = walker.total
+        walker.walk(component)
+        per_component.append((component.id, walker.total - before))
+    per_component.sort(key=lambda item: item[1], reverse=True)
+
+    index_sizes = {}
+    for name in sorted(indexes or {}):
+        before = walker.total
+        walker.walk(indexes[name])
+        index_sizes[name] = walker.total - before
+
+    return {
+        'total': walker.total,
+        'fields': walker.sizes,
+        'classes': walker.classes,
+        'top': per_component[:top],
+        'indexes': index_sizes,
+        'empty_containers': {'count': walker.empty_count,
+                             'bytes': walker.empty_bytes},
+    }
+
+def trace_parse(xml_data, top=10, **kwargs):
+    """ Parse a catalog with tracemalloc running
+
+    Returns the Store and the top allocations made while parsing, grouped
+    by source line, as tracemalloc.StatisticDiff objects. Any keyword
+    arguments are passed to Store.parse(). This needs Python 3.4 or newer.
+    """
+    import tracemalloc
+    from appstream.store import Store
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        store = Store()
+        store.parse(xml_data, **kwargs)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return store, after.compare_to(before, 'lineno')[:top]
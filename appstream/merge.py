@@ -0,0 +1,138 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+from appstream.component import Component
+
+# how each Component attribute is merged, the higher priority value winning
+_MERGE_SCALARS = [
+    'kind',
+    'update_contact',
+    'name',
+    'pkgname',
+    'summary',
+    'description',
+    'metadata_license',
+    'project_license',
+    'developer_name',
+]
+_MERGE_DICTS = [
+    'names',
+    'summaries',
+    'descriptions',
+    'urls',
+    'icons',
+    'custom',
+    'bundle',
+]
+_MERGE_LISTS = [
+    'provides',
+    'requires',
+    'screenshots',
+    'kudos',
+    'keywords',
+    'categories',
+]
+
+def _merge_unique(lists, key):
+    """ Returns the items of all the lists, the last one for each key winning
+
+    Items with a key of None, such as reviews without an ID, can not be
+    told apart and are all kept.
+    """
+    merged = []
+    positions = {}
+    for values in lists:
+        for item in values:
+            k = key(item)
+            if k is None:
+                merged.append(item)
+            elif k in positions:
+                merged[positions[k]] = item
+            else:
+                positions[k] = len(merged)
+                merged.append(item)
+    return merged
+
+def merge_components(items):
+    """ Returns a new Component merged from (component, origin) tuples
+
+    The items must be in ascending priority, so scalar values from later
+    items replace earlier ones. Releases are deduplicated by version and
+    reviews by ID, again with the later items winning. The lists and dicts
+    of the new component, including the lists of icons of each kind, are
+    new, but the objects in them such as releases are shared with the items.
+    """
+    merged = Component()
+    merged.id = items[0][0].id
+    for component, origin in items:
+        for attr in _MERGE_SCALARS:
+            value = getattr(component, attr)
+            if value:
+                setattr(merged, attr, value)
+        for attr in _MERGE_DICTS:
+            value = getattr(component, attr)
+            if value:
+                tmp = dict(getattr(merged, attr))
+                # lists such as the icons of each kind are copied too
+                for key in value:
+                    item = value[key]
+                    if type(item) is list:
+                        item = list(item)
+                    tmp[key] = item
+                setattr(merged, attr, tmp)
+        for attr in _MERGE_LISTS:
+            value = getattr(component, attr)
+            if value:
+                setattr(merged, attr, list(value))
+        merged.origin = origin
+    merged.releases = _merge_unique([c.releases for c, _ in items],
+                                    lambda rel: rel.version)
+    merged.reviews = _merge_unique([c.reviews for c, _ in items],
+                                   lambda rev: rev.id)
+    return merged
+
+def merge_stores(stores, priority=None):
+    """ Returns a dict of merged components from stores in ascending priority
+
+    If priority is a list of origins, highest priority first, the stores are
+    reordered to match it; stores with an origin not in the list keep their
+    order and have a lower priority than any that are listed.
+
+    Every component is a new object, even if it is only in one store, so
+    adding to the result does not change the input stores.
+    """
+    ranked = list(stores)
+    if priority is not None:
+        rank = dict((origin, idx) for idx, origin in enumerate(reversed(priority)))
+        ranked = sorted(ranked, key=lambda store: rank.get(store.origin, -1))
+
+    by_id = {}
+    for store in ranked:
+        for component in store.components.values():
+            by_id.setdefault(component.id, []).append((component, store.origin))
+
+    components = {}
+    for app_id in by_id:
+        items = by_id[app_id]
+        merged = merge_components(items)
+        if len(items) == 1 and items[0][0].origin is not None:
+            merged.origin = items[0][0].origin
+        components[app_id] = merged
+    return components
@@ -0,0 +1,102 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+# the filters that can be answered by the attribute index
+_INDEXED_FILTERS = frozenset([
+    'kind',
+    'category',
+    'provides',
+    'requires',
+    'project_license',
+    'urgency',
+])
+
+# every filter that can be used
+_FILTERS = _INDEXED_FILTERS | frozenset(['has_release_newer_than'])
+
+class Query(object):
+    """ A lazy filter over the components of a store
+
+    Queries are immutable; filter() returns a new query with the extra
+    conditions, all of which must match. Nothing is evaluated until the
+    query is iterated, and the store must not be modified while it is.
+    """
+    def __init__(self, store, filters=None):
+        """ Set defaults """
+        self._store = store
+        self._filters = filters or []
+
+    def filter(self, **kwargs):
+        """ Returns a new query that also matches all of the keyword filters
+
+        The filters are kind, category, provides, requires, project_license,
+        urgency and has_release_newer_than, e.g. filter(category='Audio').
+        All of them are answered using the store indexes.
+        """
+        filters = list(self._filters)
+        for name in sorted(kwargs):
+            if name not in _FILTERS:
+                raise ValueError('Unknown filter %s' % name)
+            filters.append((name, kwargs[name]))
+        return Query(self._store, filters)
+
+    def _plan(self):
+        """ Returns the candidate IDs and the other sets to check
+
+        The smallest index set is iterated and the other index sets are only
+        used for membership tests; the candidates are None if there are no
+        filters and every component matches.
+        """
+        sets = []
+        index = None
+        for name, value in self._filters:
+            if name in _INDEXED_FILTERS:
+                if index is None:
+                    index = self._store._get_index('attributes')
+                sets.append(index.lookup(name, value))
+            else:
+                timeline = self._store._get_index('timeline')
+                sets.append(timeline.get_ids_since(value))
+        if not sets:
+            return None, []
+        sets.sort(key=len)
+        return sets[0], sets[1:]
+
+    def __iter__(self):
+        candidates, sets = self._plan()
+        components = self._store.components
+        if candidates is None:
+            items = components.values()
+        else:
+            items = (components[app_id] for app_id in candidates)
+        for component in items:
+            if sets and not all(component.id in ids for ids in sets):
+                continue
+            yield component
+
+    def count(self):
+        """ Returns the number of matching components """
+        return sum(1 for _ in self)
+
+    def first(self):
+        """ Returns a matching component, or None """
+        for component in self:
+            return component
+        return None
@@ -0,0 +1,174 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+import threading
+
+def _copy_component(component):
+    """ Returns a copy of a component with its own lists and dicts
+
+    Store.add() and Store.add_review() append to the lists of an existing
+    component, so these are copied, including the lists of icons of each
+    kind. The objects in them such as releases are shared.
+    """
+    copy = component.__class__.__new__(component.__class__)
+    attrs = dict(component.__dict__)
+    for key in attrs:
+        value = attrs[key]
+        kind = type(value)
+        if kind is list:
+            attrs[key] = value[:]
+        elif kind is dict:
+            value = value.copy()
+            for k in value:
+                if type(value[k]) is list:
+                    value[k] = value[k][:]
+            attrs[key] = value
+    attrs.update(component._TRANSIENT)
+    copy.__dict__ = attrs
+    return copy
+
+class StoreSnapshot(object):
+    """ A frozen, read-only view of a store that can be shared between threads
+
+    The snapshot copies the components and builds every index when it is
+    created, so adding to or removing from the original store afterwards
+    does not affect readers, and lookups never modify any shared state.
+    Objects inside the components such as releases are shared and must not
+    be modified. If copy is False the components of the store are used as
+    they are, which is only safe if nothing else uses the store afterwards,
+    as in SnapshotHolder.reload().
+    """
+    __slots__ = ('origin', '_store', '_component_list')
+
+    def __init__(self, store, copy=True):
+        """ Set defaults """
+        from appstream.store import Store
+        frozen = Store(store.origin)
+        if copy:
+            frozen.components = dict((app_id, _copy_component(component))
+                                     for app_id, component in store.components.items())
+        else:
+            frozen.components = dict(store.components)
+        frozen.build_indexes()
+        object.__setattr__(self, 'origin', store.origin)
+        object.__setattr__(self, '_store', frozen)
+        object.__setattr__(self, '_component_list',
+                           tuple(frozen.components.values()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('StoreSnapshot is read-only')
+
+    def __len__(self):
+        return len(self._component_list)
+
+    def __contains__(self, app_id):
+        return app_id in self._store.components
+
+    def get_component(self, app_id):
+        """ Finds an application from the snapshot """
+        return self._store.components.get(app_id)
+
+    def get_components(self):
+        """ Returns all the applications from the snapshot """
+        return self._component_list
+
+    def query(self, **kwargs):
+        """ Returns a lazy Query of the components, see Store.query() """
+        return self._store.query(**kwargs)
+
+    def complete(self, prefix, limit=10, cursor=None):
+        """ Returns the components whose ID or name start with a prefix """
+        return self._store.complete(prefix, limit, cursor)
+
+    def get_releases_since(self, timestamp, limit=100, cursor=None):
+        """ Returns releases newer than a UNIX time, oldest first, and a cursor """
+        return self._store.get_releases_since(timestamp, limit, cursor)
+
+    def best_icon(self, app_id, size=64, scale=1):
+        """ Returns the best Icon for a component to show at a size and scale """
+        return self._store.best_icon(app_id, size, scale)
+
+    def best_screenshot_image(self, app_id, width):
+        """ Returns the best Image of the default screenshot for a width """
+        return self._store.best_screenshot_image(app_id, width)
+
+    def get_rating_histogram(self, app_id):
+        """ Returns the number of reviews of a component with 0 to 5 stars """
+        return self._store.get_rating_histogram(app_id)
+
+    def get_rating_average(self, app_id, locale=None, version=None):
+        """ Returns the average review rating, optionally for a locale or version """
+        return self._store.get_rating_average(app_id, locale, version)
+
+    def get_top_reviews(self, app_id, limit=10, key='karma'):
+        """ Returns the reviews with the highest karma or score """
+        return self._store.get_top_reviews(app_id, limit, key)
+
+class SnapshotHolder(object):
+    """ Holds the current snapshot, swapping in a new one atomically on reload
+
+    Readers call get() and never block; a reload builds the new store, its
+    snapshot and all of the snapshot indexes completely before publishing it
+    with a single reference swap.
+    """
+    def __init__(self, snapshot=None):
+        """ Set defaults """
+        self._snapshot = snapshot
+        self._reload_lock = threading.Lock()
+        self.error = None
+
+    def get(self):
+        """ Returns the current snapshot, or None if nothing is loaded """
+        return self._snapshot
+
+    def publish(self, snapshot):
+        """ Make a snapshot visible to all new readers """
+        self._snapshot = snapshot
+
+    def reload(self, filename, **kwargs):
+        """ Load a store from disk and publish it, returning the snapshot
+
+        Any keyword arguments are passed to Store.from_file(). Concurrent
+        reloads are serialized, but readers are never blocked.
+        """
+        from appstream.store import Store
+        with self._reload_lock:
+            store = Store()
+            store.from_file(filename, **kwargs)
+            snapshot = StoreSnapshot(store, copy=False)
+            self.publish(snapshot)
+        return snapshot
+
+    def reload_async(self, filename, **kwargs):
+        """ Reload in a background thread, returning the started thread
+
+        If loading fails the old snapshot stays published and the exception
+        is saved in the error attribute.
+        """
+        def _reload():
+            try:
+                self.reload(filename, **kwargs)
+                self.error = None
+            except Exception as e:
+                self.error = e
+        thread = threading.Thread(target=_reload)
+        thread.daemon = True
+        thread.start()
+        return thread
@@ -19,51 +19,249 @@
 # MA 02110-1301, USA
 
 import gzip
+import os
 
-import xml.etree.ElementTree as ET
+from appstream import delta
+from appstream.compact import compact_component_xml, new_report
+from appstream import dep11
+from appstream.index import AttributeIndex, MediaIndex, PrefixIndex, ReviewIndex
+from appstream.index import TimelineIndex
+from appstream.merge import merge_stores
+from appstream.query import Query
+from appstream.snapshot import StoreSnapshot
+from appstream.component import BACKENDS, Component, _get_fields
+from appstream.errors import ParseError
+from appstream.utils import _escape, _expand_locales, _parse_xml
 
-try:
-    # Py2.7 and newer
-    from xml.etree.ElementTree import ParseError as StdlibParseError
-except ImportError:
-    # Py2.6 and older
-    from xml.parsers.expat import ExpatError as StdlibParseError
+# modules only needed by a few methods are imported when first used, which
+# keeps the import time down for short-lived command line tools
 
-from appstream.errors import ParseError
-from appstream.component import Component
+def _gzip_writer(fileobj):
+    """ Returns a gzip writer for fileobj with a fixed header
+
+    The header normally contains the time and the filename, so these are
+    left out to make the output reproducible.
+    """
+    return gzip.GzipFile(filename='', mode='wb', fileobj=fileobj, mtime=0)
+
+class _HashingWriter(object):
+    """ Writes to a file while hashing everything that is written """
+    def __init__(self, f, checksum):
+        """ Set defaults """
+        self._f = f
+        self.checksum = checksum
+
+    def write(self, data):
+        """ Write and hash some data """
+        self.checksum.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        """ Flush the underlying file """
+        self._f.flush()
+
+def _get_component_problems(component):
+    """ Returns the ID and validation problems of a component """
+    return (component.id, component.get_problems())
+
+# the indexes that can be built for a store
+_INDEX_TYPES = {
+    'attributes': AttributeIndex,
+    'media': MediaIndex,
+    'prefix': PrefixIndex,
+    'reviews': ReviewIndex,
+    'timeline': TimelineIndex,
+}
 
 class Store(object):
-    """ A quick'n'dirty store """
+    """ A quick'n'dirty store
+
+    Indexes are built the first time they are needed and then kept up to date
+    by add(), merge() and the parse methods; if self.components is modified
+    directly then call build_indexes() afterwards.
+    """
     def __init__(self, origin=None):
         """ Set defaults """
         self.origin = origin
         self.components = {}
+        self._indexes = {}
+        self._feed_parser = None
+
+    def _get_index(self, name):
+        """ Returns an index, building it if required """
+        index = self._indexes.get(name)
+        if index is None:
+            index = _INDEX_TYPES[name]()
+            index.build(self.components.values())
+            self._indexes[name] = index
+        return index
 
-    def to_xml(self):
-        xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    def _set_component(self, component):
+        """ Add or replace a component, updating any indexes """
+        if self._indexes:
+            old = self.components.get(component.id)
+            for index in self._indexes.values():
+                if old:
+                    index.remove(old)
+                index.add(component)
+        self.components[component.id] = component
+
+    def _set_components(self, components):
+        """ Add or replace many components, rebuilding any indexes in use
+
+        Rebuilding each index once is much cheaper than removing and adding
+        every component in turn when a whole catalog is parsed.
+        """
+        names = list(self._indexes.keys())
+        self._indexes = {}
+        for component in components:
+            self.components[component.id] = component
+        for name in names:
+            self._get_index(name)
+
+    def _remove_component(self, app_id):
+        """ Remove a component if it exists, updating any indexes """
+        old = self.components.pop(app_id, None)
+        if old:
+            for index in self._indexes.values():
+                index.remove(old)
+
+    def build_indexes(self):
+        """ Build all the indexes now rather than when they are first used """
+        self._indexes = {}
+        for name in _INDEX_TYPES:
+            self._get_index(name)
+
+    def _iter_xml(self, policy=None, report=None):
+        """ Yields the catalog XML a component at a time """
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
         if len(self.components) == 0:
-            return '<components version="0.9" origin="%s"/>\n' % self.origin
-        xml += '<components version="0.9" origin="%s">\n' % self.origin
-        for app_id in self.components:
-            xml += self.components[app_id].to_xml()
-        xml += '</components>\n'
-        return xml
+            yield '<components version="0.9" origin="%s"/>\n' % _escape(self.origin)
+            return
+        yield '<components version="0.9" origin="%s">\n' % _escape(self.origin)
+        for app_id in sorted(self.components):
+            component = self.components[app_id]
+            if policy is None:
+                report['releases_kept'] += len(component.releases)
+                yield component.to_xml()
+            else:
+                yield compact_component_xml(component, policy, report)
+        yield '</components>\n'
+
+    def to_xml(self, policy=None):
+        """ Returns the catalog as XML
 
-    def to_file(self, filename):
-        """ Save the store to disk """
+        If policy is a ReleasePolicy then only the releases it keeps are
+        included; the components in the store are not changed.
+        """
+        return ''.join(self._iter_xml(policy, new_report()))
 
-        # save compressed file
-        xml = self.to_xml()
-        f = gzip.open(filename, 'wb')
+    def to_file(self, filename, policy=None):
+        """ Save the store to disk
+
+        The output only depends on the contents of the store, so saving the
+        same components twice gives byte-identical files. If policy is a
+        ReleasePolicy then only the releases it keeps are written.
+
+        Returns a dict with the number of releases kept and dropped by the
+        policy, and the number of uncompressed bytes that were saved.
+        """
+        report = new_report()
+        with open(filename, 'wb') as f:
+            self._write_gzip_xml(f, policy, report)
+        return report
+
+    def _write_gzip_xml(self, f, policy, report):
+        """ Compress the catalog XML into f a component at a time """
+        gz = _gzip_writer(f)
         try:
-            f.write(xml.encode('utf-8'))
+            for xml in self._iter_xml(policy, report):
+                gz.write(xml.encode('utf-8'))
         finally:
-            f.close()
+            gz.close()
 
-    def from_file(self, filename):
-        """ Open the store from disk """
+    def to_hashed_file(self, directory, prefix='appstream', policy=None):
+        """ Save the store to disk, named after a hash of the contents
+
+        Returns the filename, which is e.g. appstream-<sha256>.xml.gz; if a
+        file with that name already exists it is not written again, so an
+        unchanged store can be republished without clients downloading it.
+
+        The compressed data is hashed as it is streamed to a temporary file in
+        the same directory, which is then renamed into place.
+        """
+        import hashlib
+        import tempfile
+        fd, tmp = tempfile.mkstemp(prefix='.%s-' % prefix, suffix='.tmp',
+                                   dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer = _HashingWriter(f, hashlib.sha256())
+                self._write_gzip_xml(writer, policy, new_report())
+            filename = os.path.join(directory, '%s-%s.xml.gz' %
+                                    (prefix, writer.checksum.hexdigest()))
+            if os.path.exists(filename):
+                os.remove(tmp)
+            else:
+                os.chmod(tmp, 0o644)
+                os.rename(tmp, filename)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return filename
+
+    def from_file(self, filename, locales=None, fields=None, backend='tree',
+                  limits=None):
+        """ Open the store from disk
+
+        If limits has max_bytes set then no more than that is decompressed,
+        so a small file cannot expand to fill memory.
+        """
         with gzip.open(filename, 'rb') as f:
-            self.parse(f.read())
+            if limits is not None and limits.max_bytes is not None:
+                xml_data = f.read(limits.max_bytes + 1)
+            else:
+                xml_data = f.read()
+            self.parse(xml_data, locales=locales, fields=fields,
+                       backend=backend, limits=limits)
+
+    def to_flat_file(self, filename):
+        """ Save the store as a flat catalog for appstream.FlatStore.open()
+
+        Worker processes can all map the file and read components without
+        parsing the catalog or keeping a private copy of it.
+        """
+        from appstream.flat import write_flat_file
+        write_flat_file(self.get_components(), filename, self.origin)
+
+    def to_dep11(self, filename):
+        """ Save the store to disk in the DEP-11 YAML format """
+        components = (self.components[app_id] for app_id in sorted(self.components))
+        with open(filename, 'wb') as f:
+            gz = _gzip_writer(f)
+            try:
+                dep11.write_dep11(components, gz, self.origin)
+            finally:
+                gz.close()
+
+    def from_dep11(self, filename, locales=None):
+        """ Open the store from a DEP-11 YAML file, which may be compressed
+
+        Nothing is added unless the whole file can be read.
+        """
+        with open(filename, 'rb') as f:
+            header, components = dep11.read_dep11(f, locales=locales)
+            origin = header.get('Origin')
+            components = list(components)
+        for component in components:
+            component.origin = origin
+        self.origin = origin
+        self._set_components(components)
+
+    def snapshot(self):
+        """ Returns a read-only snapshot of the store for sharing between threads """
+        return StoreSnapshot(self)
 
     def get_component(self, app_id):
         """ Finds an application from the store """
@@ -78,28 +276,278 @@ class Store(object):
             components.append(self.components[app_id])
         return components
 
+    def query(self, **kwargs):
+        """ Returns a lazy Query of the components, e.g. query(kind='firmware')
+
+        The query can be narrowed further with filter(), and uses the store
+        indexes to avoid looking at components that cannot match.
+        """
+        return Query(self).filter(**kwargs)
+
     def add(self, component):
         """ Add component to the store """
 
-        # if already exists, just add the release objects
+        # if already exists, just add the new release objects
         old = self.get_component(component.id)
         if old:
-            old.releases.extend(component.releases)
+            for index in self._indexes.values():
+                index.remove(old)
+            versions = set(rel.version for rel in old.releases)
+            for rel in component.releases:
+                if rel.version not in versions:
+                    versions.add(rel.version)
+                    old.releases.append(rel)
+            for index in self._indexes.values():
+                index.add(old)
             return
-        self.components[component.id] = component
+        self._set_component(component)
 
-    def parse(self, xml_data):
-        """ Parse XML data """
+    def merge(self, stores, priority=None):
+        """ Merge other stores into this one
 
-        # parse tree
+        Components with the same ID are merged, with scalar values taken from
+        the store with the highest priority, and releases deduplicated by
+        version. Without priority, later stores win over earlier ones and
+        this store has the lowest priority; otherwise priority is a list of
+        origins, highest first. The origin attribute of each component is
+        set to the origin of the store that won.
+
+        The merged components are new objects, but their releases, reviews
+        and other child objects are shared with the other stores.
+        """
+        self.components = merge_stores([self] + list(stores), priority)
+
+        # rebuild any indexes that were in use
+        names = list(self._indexes.keys())
+        self._indexes = {}
+        for name in names:
+            self._get_index(name)
+
+    @staticmethod
+    def make_delta(old, new):
+        """ Returns a delta document that turns the old store into the new one
+
+        The delta lists the removed IDs and includes every component that was
+        added or changed, so it is only as large as the change.
+        """
+        return delta.make_delta(old.components, new.components, new.origin)
+
+    def apply_delta(self, xml_data):
+        """ Patch the store in place using a delta from make_delta() """
+        origin, removed, components = delta.parse_delta(xml_data)
+        self.origin = origin
+        for app_id in removed:
+            self._remove_component(app_id)
+        for component in components:
+            self._set_component(component)
+
+    def add_review(self, app_id, review):
+        """ Add a review to a component in the store """
+        component = self.get_component(app_id)
+        if not component:
+            return
+        count = len(component.reviews)
+        component.add_review(review)
+        if len(component.reviews) > count and 'reviews' in self._indexes:
+            self._indexes['reviews'].add_review(app_id, review)
+
+    def get_rating_histogram(self, app_id):
+        """ Returns the number of reviews of a component with 0 to 5 stars """
+        return self._get_index('reviews').get_histogram(app_id)
+
+    def get_rating_average(self, app_id, locale=None, version=None):
+        """ Returns the average review rating, optionally for a locale or version """
+        return self._get_index('reviews').get_average(app_id, locale, version)
+
+    def get_top_reviews(self, app_id, limit=10, key='karma'):
+        """ Returns the reviews with the highest karma or score
+
+        At most ReviewIndex.TOP_N reviews are available.
+        """
+        return self._get_index('reviews').get_top(app_id, limit, key)
+
+    def get_releases_since(self, timestamp, limit=100, cursor=None):
+        """ Returns releases newer than a UNIX time, oldest first, and a cursor
+
+        The result is a list of up to limit (component, release) tuples; to
+        get the next page call again with the same timestamp and the cursor,
+        which is None when there are no more releases.
+        """
+        items, cursor = self._get_index('timeline').get_since(timestamp, limit, cursor)
+        return [(self.components[app_id], rel) for app_id, rel in items], cursor
+
+    def complete(self, prefix, limit=10, cursor=None):
+        """ Returns the components whose ID or name start with a prefix
+
+        The ID, name and package name are matched ignoring case. The result
+        is a list of up to limit components and a cursor; to get the next
+        page call again with the same prefix and the cursor, which is None
+        when there are no more components.
+        """
+        ids, cursor = self._get_index('prefix').complete(prefix, limit, cursor)
+        return [self.components[app_id] for app_id in ids], cursor
+
+    def best_icon(self, app_id, size=64, scale=1):
+        """ Returns the best Icon for a component to show at a size and scale """
+        return self._get_index('media').best_icon(app_id, size, scale)
+
+    def best_screenshot_image(self, app_id, width):
+        """ Returns the best Image of the default screenshot for a width """
+        return self._get_index('media').best_screenshot_image(app_id, width)
+
+    def to_columns(self, use_numpy=True):
+        """ Returns the components and releases as tables of columns
+
+        The result is a dict with 'components' and 'releases' tables, each a
+        dict of column name to array, where the 'component' column of the
+        releases table is an index into the components table.
+        """
+        from appstream import columns
+        return columns.to_columns(self.get_components(), use_numpy)
+
+    def export_releases(self, f, fmt='csv'):
+        """ Write one row per release to a file object as 'csv' or 'jsonl' """
+        from appstream import columns
+        if fmt == 'csv':
+            columns.write_csv(self.get_components(), f)
+        elif fmt == 'jsonl':
+            columns.write_jsonl(self.get_components(), f)
+        else:
+            raise ValueError('Unknown export format %s' % fmt)
+
+    def verify_payloads(self, directory, workers=4, cache=None):
+        """ Check the release checksums against the files in a directory
+
+        See appstream.verify.verify_payloads() for the format of the report.
+        """
+        from appstream.verify import verify_payloads
+        return verify_payloads(self.get_components(), directory, workers, cache)
+
+    def memory_report(self, top=10):
+        """ Returns how much memory each model class and field is using
+
+        The components and any built indexes are walked once, and the deep
+        size of each object is added to the fields that hold it, e.g.
+        'Release.checksums' and 'Component.releases'. See appstream.memory.memory_report() for the
+        format, and appstream.memory.trace_parse() to see the allocations
+        made while parsing.
+        """
+        from appstream.memory import memory_report
+        return memory_report(self.get_components(), self._indexes, top)
+
+    def validate_all(self, workers=1):
+        """ Validate all the components, returning the problems for each ID
+
+        Unlike Component.validate() this does not stop at the first problem,
+        and components without any problems are not included in the result.
+        If workers is greater than 1 the components are validated in a pool
+        of that many processes.
+        """
+        components = self.get_components()
+        if workers > 1 and len(components) > 1:
+            chunksize = max(1, len(components) // (workers * 4))
+            import multiprocessing
+            pool = multiprocessing.Pool(workers)
+            try:
+                results = pool.map(_get_component_problems, components, chunksize)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(_get_component_problems, components)
+        report = {}
+        for app_id, problems in results:
+            if problems:
+                report[app_id] = problems
+        return report
+
+    def _new_feed_parser(self, locales, fields, limits):
+        """ Returns a FeedParser that adds each component as it ends """
+        from appstream.builder import ComponentBuilder, FeedParser
+        def _on_root(attrib):
+            self.origin = attrib['origin']
+        def _on_component(component):
+            component.origin = self.origin
+            self._set_component(component)
+        builder = ComponentBuilder(_on_component, 2, _on_root,
+                                   _expand_locales(locales), _get_fields(fields))
+        return FeedParser(builder, limits)
+
+    def start_feed(self, locales=None, fields=None, limits=None):
+        """ Start parsing a catalog pushed a chunk at a time with feed()
+
+        The options are the same as for parse(). This is only needed to set
+        them, as feed() starts with the defaults otherwise.
+        """
+        self._feed_parser = self._new_feed_parser(locales, fields, limits)
+
+    def feed(self, data):
+        """ Parse the next chunk of a catalog
+
+        Each component is added to the store as soon as its closing tag has
+        been fed, so the store can be used before the download finishes.
+        """
+        if self._feed_parser is None:
+            self.start_feed()
         try:
-            root = ET.fromstring(xml_data)
-        except StdlibParseError as e:
-            raise ParseError(str(e))
+            self._feed_parser.feed(data)
+        except ParseError:
+            self._feed_parser = None
+            raise
+
+    def close(self):
+        """ Finish parsing the catalog passed to feed() """
+        parser = self._feed_parser
+        self._feed_parser = None
+        if parser is not None:
+            parser.close()
+
+    def parse(self, xml_data, locales=None, fields=None, backend='tree',
+              limits=None):
+        """ Parse XML data
+
+        If locales is set then translations for any other locale are skipped
+        before any processing is done, which saves both time and memory.
+
+        If fields is set then only those component attributes are parsed,
+        e.g. ['provides', 'releases']. The components are then always built
+        from parser events, so the other sections are skipped as they are
+        read and never built.
+
+        The default 'tree' backend builds an element tree and then walks it.
+        The 'events' backend builds the components directly from the parser
+        events, using lxml if it is installed. It takes about as long, but
+        never holds the tree of the whole catalog, so its peak memory use is
+        much lower. Either way the store is only changed if the whole
+        catalog was parsed successfully.
+
+        If limits is a ParseLimits then a ParseError is raised as soon as the
+        data exceeds any of them, which is useful for untrusted catalogs.
+        """
+        if backend not in BACKENDS:
+            raise ValueError('Unknown parse backend %s' % backend)
+
+        # parse events into a new store first, so the components are only
+        # added if the whole catalog is valid, just like the tree backend
+        if backend == 'events' or fields is not None:
+            parsed = Store()
+            parser = parsed._new_feed_parser(locales, fields, limits)
+            parser.feed(xml_data)
+            parser.close()
+            self.origin = parsed.origin
+            self._set_components(parsed.components.values())
+            return
+        locales = _expand_locales(locales)
+
+        # parse tree
+        root = _parse_xml(xml_data, limits=limits)
 
         self.origin = root.attrib['origin']
 
+        components = []
         for child in root:
             component = Component()
-            component.parse(child)
-            self.components[component.id] = component
+            component._parse_tree(child, locales, fields)
+            component.origin = self.origin
+            components.append(component)
+        self._set_components(components)
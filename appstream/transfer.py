@@ -0,0 +1,154 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+
+import gc
+import pickle
+
+from appstream.component import Checksum, Component, Icon, Image, Provide
+from appstream.component import Release, Require, Review, Screenshot
+from appstream.component import _restore, string_types
+
+# the version of the format written by dump_components()
+_VERSION = 2
+
+# each model class is written as its position in this list, so new classes
+# must only ever be added to the end
+_CLASSES = [Checksum, Component, Icon, Image, Provide, Release, Require,
+            Review, Screenshot]
+_CODES = dict((cls, code) for code, cls in enumerate(_CLASSES))
+
+# the tag of a tuple that is a value rather than an encoded model
+_TUPLE = -1
+
+_STRING_TYPES = frozenset(string_types)
+
+def _encode(obj, strings):
+    """ Returns a model object as a tagged tuple
+
+    The tuple is (code, values), or (code, values, extra) when the object
+    has attributes that are not fields. Tuples that are values are written
+    as (_TUPLE, items) so they can not be mistaken for models.
+
+    Equal strings are replaced with the first one seen, so pickle writes
+    each string once and refers back to it after that. Only lists and
+    dicts are walked into; anything that is not a model object, string or
+    container, including subclasses of the model classes, is left for
+    pickle to handle as it is.
+    """
+    values = list(obj._get_state())
+    for idx, value in enumerate(values):
+        kind = type(value)
+        if kind in _STRING_TYPES:
+            values[idx] = strings.setdefault(value, value)
+        elif kind is list:
+            values[idx] = [_encode_value(item, strings) for item in value]
+        elif kind is dict:
+            # keys are never models, so only strings are replaced
+            values[idx] = dict((strings.setdefault(key, key)
+                                if type(key) in _STRING_TYPES else key,
+                                _encode_value(value[key], strings))
+                               for key in value)
+        elif kind is tuple:
+            values[idx] = (_TUPLE, value)
+    attrs = obj.__dict__
+    if len(attrs) == len(obj._FIELDS) + len(obj._TRANSIENT):
+        return (_CODES[type(obj)], values)
+    fields = frozenset(obj._FIELDS)
+    extra = dict((key, attrs[key]) for key in attrs
+                 if key not in fields and key not in obj._TRANSIENT)
+    return (_CODES[type(obj)], values, extra)
+
+def _encode_value(value, strings):
+    """ Returns an item of a list or dict field for pickling """
+    kind = type(value)
+    if kind in _STRING_TYPES:
+        return strings.setdefault(value, value)
+    if kind in _CODES:
+        return _encode(value, strings)
+    if kind is tuple:
+        return (_TUPLE, value)
+    return value
+
+def _decode(encoded):
+    """ Returns a model object or tuple from a tagged tuple """
+    code = encoded[0]
+    if code == _TUPLE:
+        return encoded[1]
+    values = encoded[1]
+    for idx, value in enumerate(values):
+        kind = type(value)
+        if kind is list:
+            values[idx] = [_decode(item) if type(item) is tuple else item
+                           for item in value]
+        elif kind is dict:
+            for key in value:
+                if type(value[key]) is tuple:
+                    value[key] = _decode(value[key])
+        elif kind is tuple:
+            values[idx] = value[1]
+    obj = _restore(_CLASSES[code], values)
+    if len(encoded) > 2:
+        obj.__dict__.update(encoded[2])
+    return obj
+
+def _decode_value(value):
+    """ Returns an item of a list field after unpickling """
+    if type(value) is tuple:
+        return _decode(value)
+    return value
+
+def _without_gc(func, *args):
+    """ Call a function with the garbage collector paused
+
+    Creating many objects triggers collections that can not free anything,
+    as nothing is unreachable until the whole batch has been built.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return func(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
+def _dump(components, protocol):
+    strings = {}
+    encoded = [_encode_value(component, strings) for component in components]
+    return pickle.dumps((_VERSION, encoded), protocol)
+
+def _load(data):
+    version, encoded = pickle.loads(data)
+    if version != _VERSION:
+        raise ValueError('Unsupported component dump version %s' % version)
+    return [_decode_value(component) for component in encoded]
+
+def dump_components(components, protocol=pickle.HIGHEST_PROTOCOL):
+    """ Returns a list of components as compact bytes
+
+    This is much smaller than pickling the components one by one, as field
+    names are not written and each distinct string is only written once
+    for the whole batch. Use load_components() to get the components back.
+    """
+    return _without_gc(_dump, components, protocol)
+
+def load_components(data):
+    """ Returns the list of components written by dump_components() """
+    return _without_gc(_load, data)
@@ -18,6 +18,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 # MA 02110-1301, USA
 
+import sys
 import xml.etree.ElementTree as ET
 
 try:
@@ -28,6 +29,88 @@ except ImportError:
     from xml.parsers.expat import ExpatError as StdlibParseError
 
 from appstream.errors import ParseError
+from appstream.limits import _feed, _wrap_target
+
+if sys.version_info[0] == 2:
+    _STRING_TYPES = (basestring,)
+else:
+    _STRING_TYPES = (str,)
+
+# the ElementTree name of the xml:lang attribute
+_XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+def _get_lang(attrib):
+    """ Returns the xml:lang of an element, or None if untranslated """
+    lang = attrib.get(_XML_LANG)
+    if lang == 'C':
+        return None
+    return lang
+
+def _get_locale_fallbacks(locale):
+    """ Returns the locales to try in order, e.g. de_DE.UTF-8 -> de_DE, de """
+    fallbacks = [locale]
+    without_codeset = locale.split('.')[0]
+    if '@' in locale:
+        without_codeset += '@' + locale.split('@', 1)[1]
+    without_modifier = without_codeset.split('@')[0]
+    language = without_modifier.split('_')[0]
+    for tmp in [without_codeset, without_modifier, language]:
+        if tmp not in fallbacks:
+            fallbacks.append(tmp)
+    return fallbacks
+
+def _expand_locales(locales):
+    """ Returns the set of all the locales needed to look up a list of locales """
+    if locales is None:
+        return None
+    expanded = set()
+    for locale in locales:
+        expanded.update(_get_locale_fallbacks(locale))
+    return frozenset(expanded)
+
+def _get_localized(translations, default, locale):
+    """ Returns a translated value using the fallback chain for a locale """
+    if locale and translations:
+        for tmp in _get_locale_fallbacks(locale):
+            if tmp in translations:
+                return translations[tmp]
+    return default
+
+def _parse_xml(xml_data, target=None, limits=None, component_depth=2):
+    """ Parse XML data into a tree, optionally using a custom target """
+    try:
+        if target is None:
+            if limits is None:
+                return ET.fromstring(xml_data)
+            target = ET.TreeBuilder()
+        parser = ET.XMLParser(target=_wrap_target(target, limits, component_depth))
+        return _feed(parser, xml_data, limits)
+    except StdlibParseError as e:
+        raise ParseError(str(e))
+
+# the escaped forms of strings that needed escaping, as values such as the
+# developer name or checksum filename are often repeated many times
+_ESCAPE_CACHE = {}
+_ESCAPE_CACHE_SIZE = 4096
+
+def _escape(value):
+    """ Returns a value escaped for XML text or a double-quoted attribute
+
+    Values that are not strings are returned unchanged.
+    """
+    if not isinstance(value, _STRING_TYPES):
+        return value
+    # most values need no escaping, so check before doing any work
+    if '&' not in value and '<' not in value and '>' not in value and '"' not in value:
+        return value
+    escaped = _ESCAPE_CACHE.get(value)
+    if escaped is None:
+        escaped = value.replace('&', '&amp;').replace('<', '&lt;') \
+                       .replace('>', '&gt;').replace('"', '&quot;')
+        if len(_ESCAPE_CACHE) >= _ESCAPE_CACHE_SIZE:
+            _ESCAPE_CACHE.clear()
+        _ESCAPE_CACHE[value] = escaped
+    return escaped
 
 def _join_lines(txt):
     """ Remove whitespace from XML input """
@@ -45,15 +128,15 @@ def _parse_desc(node):
     """ A quick'n'dirty description parser """
     desc = ''
     if len(node) == 0:
-        return '<p>' + node.text + '</p>'
+        return '<p>' + _escape(node.text) + '</p>'
     for n in node:
         if n.tag == 'p':
-            desc += '<p>' + _join_lines(n.text) + '</p>'
+            desc += '<p>' + _escape(_join_lines(n.text)) + '</p>'
         elif n.tag == 'ol' or n.tag == 'ul':
             desc += '<ul>'
             for c in n:
                 if c.tag == 'li':
-                    desc += '<li>' + _join_lines(c.text) + '</li>'
+                    desc += '<li>' + _escape(_join_lines(c.text)) + '</li>'
                 else:
                     raise ParseError('Expected <li> in <%s>, got <%s>' % (n.tag, c.tag))
             desc += '</ul>'
@@ -82,8 +165,12 @@ def _import_description_sentence_case(text):
     return text[0].upper() + text[1:]
 
 def import_description(text):
-    """ Convert ASCII text to AppStream markup format """
-    xml = ''
+    """ Convert ASCII text to AppStream markup format
+
+    Any &, < or > in the text is escaped, so the result is always valid
+    markup and does not need to be checked with validate_description().
+    """
+    xml = []
     is_in_ul = False
     for line in text.split('\n'):
 
@@ -97,21 +184,42 @@ def import_description(text):
         if line_li:
             # first list element
             if not is_in_ul:
-                xml += '<ul>\n'
+                xml.append('<ul>\n')
                 is_in_ul = True
-            xml += '<li>' + _import_description_sentence_case(line_li) + '</li>\n'
+            xml.append('<li>%s</li>\n' % _escape(_import_description_sentence_case(line_li)))
             continue
 
         # done with the list
         if is_in_ul:
-            xml += '</ul>\n'
+            xml.append('</ul>\n')
             is_in_ul = False
 
         # regular paragraph
-        xml += '<p>' + _import_description_sentence_case(line) + '</p>\n'
+        xml.append('<p>%s</p>\n' % _escape(_import_description_sentence_case(line)))
 
     # no trailing paragraph
     if is_in_ul:
-        xml += '</ul>\n'
+        xml.append('</ul>\n')
+
+    return ''.join(xml)
 
-    return xml
+def import_descriptions(texts, workers=1, chunksize=1024):
+    """ Convert many ASCII texts to AppStream markup, yielding each in turn
+
+    This is import_description() for an iterable of texts, such as the lines
+    of a file or rows of a query, and the results are yielded in the same
+    order. If workers is greater than 1 the texts are converted in a pool of
+    that many processes, sending them chunksize at a time.
+    """
+    if workers <= 1:
+        for text in texts:
+            yield import_description(text)
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+        for xml in pool.imap(import_description, texts, chunksize):
+            yield xml
+    finally:
+        pool.terminate()
+        pool.join()
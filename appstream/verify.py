@@ -0,0 +1,156 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+import hashlib
+import os
+
+# hashlib releases the GIL for large updates, so use big reads
+_CHUNK_SIZE = 1024 * 1024
+
+# the checksum kinds that are verified; others are reported as unsupported
+_KINDS = frozenset(['sha1', 'sha256', 'sha512'])
+
+def _hash_file(path, kinds):
+    """ Returns the hex digests of a file for each kind, reading it once """
+    hashers = dict((kind, hashlib.new(kind)) for kind in kinds)
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(_CHUNK_SIZE)
+            if not buf:
+                break
+            for hasher in hashers.values():
+                hasher.update(buf)
+    return dict((kind, hashers[kind].hexdigest()) for kind in hashers)
+
+def _get_digests(args):
+    """ Returns the digests for a path, using the cache entry if still valid """
+    path, kinds, entry = args
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None, False
+    if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+        if kinds.issubset(entry['digests']):
+            return path, st, entry['digests'], True
+    try:
+        digests = _hash_file(path, kinds)
+    except (IOError, OSError):
+        # e.g. a directory or a file that can not be read
+        return path, None, None, False
+    return path, st, digests, False
+
+def _get_safe_path(root, filename):
+    """ Returns the real path of a file under root, or None if it is outside
+
+    The filenames come from the catalog, so absolute paths, '..' and
+    symlinks that lead out of the payload directory are all refused.
+    """
+    path = os.path.realpath(os.path.join(root, filename))
+    if not path.startswith(os.path.join(root, '')):
+        return None
+    return path
+
+def verify_payloads(components, directory, workers=4, cache=None):
+    """ Check the release checksums against the files in a directory
+
+    Files are hashed once for all the checksum kinds that refer to them,
+    using a pool of threads. If a cache dict is given, files whose mtime
+    and size are unchanged since they were hashed are not read again, and
+    the cache is updated with the new digests; it only contains JSON types
+    so it can be saved between runs.
+
+    Returns a dict with 'mismatched', 'missing', 'unsupported' and 'unsafe'
+    lists of problems, and the number of files 'hashed' and 'cached'. A
+    checksum is unsafe if its filename refers to a file outside the
+    directory, and such files are never read. Files that exist but can not
+    be read, such as directories, are reported as missing. Only sha1,
+    sha256 and sha512 checksums are supported.
+    """
+    report = {
+        'mismatched': [],
+        'missing': [],
+        'unsupported': [],
+        'unsafe': [],
+        'hashed': 0,
+        'cached': 0,
+    }
+
+    # find out which digests are needed for each file
+    checks = []
+    kinds_for_path = {}
+    root = os.path.realpath(directory)
+    for component in components:
+        for rel in component.releases:
+            for csum in rel.checksums:
+                if not csum.filename or not csum.value:
+                    continue
+                problem = {
+                    'id': component.id,
+                    'version': rel.version,
+                    'filename': csum.filename,
+                    'kind': csum.kind,
+                }
+                if csum.kind not in _KINDS:
+                    report['unsupported'].append(problem)
+                    continue
+                path = _get_safe_path(root, csum.filename)
+                if path is None:
+                    report['unsafe'].append(problem)
+                    continue
+                kinds_for_path.setdefault(path, set()).add(csum.kind)
+                checks.append((path, csum, problem))
+
+    # hash each file once
+    if cache is None:
+        cache = {}
+    work = [(path, kinds_for_path[path], cache.get(path)) for path in kinds_for_path]
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(max(1, workers))
+    try:
+        results = pool.map(_get_digests, work)
+    finally:
+        pool.close()
+        pool.join()
+    digests_for_path = {}
+    for path, st, digests, cached in results:
+        if st is None:
+            continue
+        digests_for_path[path] = digests
+        if cached:
+            report['cached'] += 1
+        else:
+            report['hashed'] += 1
+            cache[path] = {
+                'mtime': st.st_mtime,
+                'size': st.st_size,
+                'digests': digests,
+            }
+
+    # compare
+    for path, csum, problem in checks:
+        digests = digests_for_path.get(path)
+        if digests is None:
+            report['missing'].append(problem)
+            continue
+        if digests[csum.kind] != csum.value.lower():
+            problem['expected'] = csum.value
+            problem['actual'] = digests[csum.kind]
+            report['mismatched'].append(problem)
+    return report
@@ -0,0 +1,262 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Richard Hughes <richard@hughsie.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA
+
+from __future__ import print_function
+
+import subprocess
+import sys
+import time
+
+import appstream
+
+def _make_catalog(n_components, n_releases=5):
+    """ Returns a synthetic catalog as UTF-8 encoded XML """
+    xml = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+           '<components version="0.9" origin="bench">\n']
+    for i in range(n_components):
+        xml.append('  <component type="firmware">\n'
+                   '    <id>com.example.Device%i.firmware</id>\n'
+                   '    <name>Device %i Update</name>\n'
+                   '    <name xml:lang="de">Gerät %i Aktualisierung</name>\n'
+                   '    <summary>Firmware for device %i</summary>\n'
+                   '    <description><p>Updating adds new features.</p>'
+                   '<ul><li>One</li><li>Two</li></ul></description>\n'
+                   '    <provides>\n'
+                   '      <firmware type="flashed">%08x-b966-4eae-adae-9c32edfcc484</firmware>\n'
+                   '    </provides>\n'
+                   '    <url type="homepage">http://www.example.com/</url>\n'
+                   '    <icon type="cached" width="64" height="64">%i.png</icon>\n'
+                   '    <metadata_license>CC0-1.0</metadata_license>\n'
+                   '    <project_license>GPL-2.0+</project_license>\n'
+                   '    <developer_name>Example Limited</developer_name>\n'
+                   '    <releases>\n' % (i, i, i, i, i, i))
+        for j in range(n_releases):
+            xml.append('      <release version="1.%i.%i" timestamp="%i" urgency="%s">\n'
+                       '        <size type="installed">%i</size>\n'
+                       '        <size type="download">%i</size>\n'
+                       '        <checksum target="content" filename="firmware.bin" type="sha1">%040x</checksum>\n'
+                       '        <description><p>Fixes bugs.</p></description>\n'
+                       '      </release>\n' %
+                       (i, j, 1400000000 + i * 1000 + j * 100,
+                        ['low', 'medium', 'high', 'critical'][j % 4],
+                        1024 * j, 512 * j, i * 31 + j))
+        xml.append('    </releases>\n'
+                   '    <reviews>\n'
+                   '      <review rating="%i" karma="%i" score="%i" id="%i">\n'
+                   '        <summary>Works</summary>\n'
+                   '        <lang>en_GB</lang>\n'
+                   '        <version>1.0</version>\n'
+                   '      </review>\n'
+                   '    </reviews>\n'
+                   '    <screenshots>\n'
+                   '      <screenshot type="default">\n'
+                   '        <image type="source">http://example.com/%i.png</image>\n'
+                   '        <caption>A screenshot</caption>\n'
+                   '      </screenshot>\n'
+                   '    </screenshots>\n'
+                   '    <categories><category>System</category></categories>\n'
+                   '    <keywords><keyword>firmware</keyword></keywords>\n'
+                   '    <custom><value key="foo">bar</value></custom>\n'
+                   '  </component>\n' % ((i * 20) % 120, i % 7 - 3, i % 5, i, i))
+    xml.append('</components>\n')
+    return ''.join(xml).encode('utf-8')
+
+def _best_of(func, repeat=3):
+    """ Returns the fastest of several runs in seconds """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def bench_fields(n_components=5000):
+    """ Compare a full parse with parsing only some fields """
+    data = _make_catalog(n_components)
+    full = appstream.Store()
+    full.parse(data)
+    for fields in [None, ['provides', 'releases'], ['provides'], ['name']]:
+        def _parse():
+            store = appstream.Store()
+            store.parse(data, fields=fields)
+            return store
+        elapsed = _best_of(_parse)
+        if fields is not None:
+            def _summary(component):
+                values = [getattr(component, field) for field in fields]
+                return [len(v) if isinstance(v, list) else v for v in values]
+            for component in _parse().get_components():
+                assert _summary(component) == _summary(full.components[component.id])
+        print('parse %i components, fields %s: %.3fs' %
+              (n_components, ','.join(fields or ['all']), elapsed))
+
+def bench_parse_backends(n_components=2000):
+    """ Compare the time and peak memory of the parse backends """
+    import tracemalloc
+    from appstream import builder
+    data = _make_catalog(n_components)
+    reference = None
+    lxml_etree = builder.lxml_etree
+    backends = [('tree', None), ('events', None)]
+    if lxml_etree is not None:
+        backends.append(('events', lxml_etree))
+    for backend, parser_module in backends:
+        name = backend
+        if parser_module is not None:
+            name += ' (lxml)'
+        builder.lxml_etree = parser_module
+        def _parse():
+            store = appstream.Store()
+            store.parse(data, backend=backend)
+            return store
+        elapsed = _best_of(_parse)
+        tracemalloc.start()
+        xml = _parse().to_xml()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if reference is None:
+            reference = xml
+        assert xml == reference, name
+        print('parse %i components, %s: %.3fs, peak %.1fMB' %
+              (n_components, name, elapsed, peak / 1e6))
+    builder.lxml_etree = lxml_etree
+
+def bench_startup(budget=0.1):
+    """ Measure how long importing the package takes in a new interpreter """
+    def _run(code):
+        return lambda: subprocess.check_call([sys.executable, '-c', code])
+    baseline = _best_of(_run('pass'), 5)
+    elapsed = _best_of(_run('import appstream'), 5) - baseline
+    print('import appstream: %.3fs (budget %.3fs)' % (elapsed, budget))
+    assert elapsed < budget, 'import time is over budget'
+
+def bench_serialize(n_components=2000):
+    """ Measure the cost of escaping values when writing a catalog """
+    from appstream import component
+    store = appstream.Store()
+    store.parse(_make_catalog(n_components))
+    escape = component._escape
+    for name, func in [('escaped', escape), ('unescaped', lambda value: value)]:
+        component._escape = func
+        elapsed = _best_of(store.to_xml)
+        print('to_xml %i components, %s: %.3fs' % (n_components, name, elapsed))
+    component._escape = escape
+
+def bench_pickle(n_components=10000):
+    """ Compare pickling components one by one and as a batch """
+    import pickle
+    from appstream.transfer import dump_components, load_components
+    store = appstream.Store()
+    store.parse(_make_catalog(n_components))
+    components = store.get_components()
+    protocol = pickle.HIGHEST_PROTOCOL
+    methods = [
+        ('pickle', lambda: pickle.dumps(components, protocol), pickle.loads),
+        ('dump_components', lambda: dump_components(components), load_components),
+    ]
+    for name, dump, load in methods:
+        data = dump()
+        elapsed = _best_of(lambda: load(dump()))
+        print('%s %i components: %i bytes, round trip %.3fs' %
+              (name, n_components, len(data), elapsed))
+
+def bench_complete(n_components=20000):
+    """ Compare scanning the component IDs with the prefix index """
+    store = appstream.Store()
+    store.parse(_make_catalog(n_components, n_releases=1))
+    prefixes = ['com.example.device%i' % i for i in range(0, n_components, 97)]
+    def _scan():
+        for prefix in prefixes:
+            matches = [app_id for app_id in store.components
+                       if app_id.lower().startswith(prefix)]
+            sorted(matches)
+    def _complete():
+        for prefix in prefixes:
+            store.complete(prefix)
+    start = time.time()
+    store.complete('')
+    print('build prefix index for %i components: %.3fs' %
+          (n_components, time.time() - start))
+    for name, func in [('scan', _scan), ('complete', _complete)]:
+        elapsed = _best_of(func)
+        print('%s %i prefixes: %.3fms each' %
+              (name, len(prefixes), elapsed * 1000 / len(prefixes)))
+
+def bench_import_descriptions(n_texts=100000, workers=4):
+    """ Compare importing and validating notes with the batch API """
+    from appstream import utils
+    texts = ['Release %i:\n- Fix boot with <special> devices & docks\n'
+             '- Update microcode\n\nThanks to the testers.' % i
+             for i in range(n_texts)]
+    def _validated():
+        for text in texts:
+            utils.validate_description(utils.import_description(text))
+    for name, func in [
+            ('import + validate', _validated),
+            ('import_descriptions', lambda: list(utils.import_descriptions(texts))),
+            ('import_descriptions, %i workers' % workers,
+             lambda: list(utils.import_descriptions(texts, workers)))]:
+        elapsed = _best_of(func)
+        print('%s %i notes: %.3fs, %i notes/s' %
+              (name, n_texts, elapsed, n_texts / elapsed))
+
+def bench_get(n_components=20000):
+    """ Measure looking up the last component of a catalog from the CLI """
+    import os
+    import shutil
+    import tempfile
+    from appstream.__main__ import _get_flat, _get_streamed, _scan
+    store = appstream.Store()
+    store.parse(_make_catalog(n_components, n_releases=1))
+    app_id = 'com.example.Device%i.firmware' % (n_components - 1)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'catalog.xml.gz')
+        flat = os.path.join(tmpdir, 'catalog.flat')
+        store.to_file(filename)
+        store.to_flat_file(flat)
+        for name, func in [('parse', lambda: _get_streamed(filename, app_id)),
+                           ('scan', lambda: _scan(filename, app_id)),
+                           ('flat', lambda: _get_flat(flat, app_id))]:
+            elapsed = _best_of(func)
+            print('get last of %i components, %s: %.3fms' %
+                  (n_components, name, elapsed * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def main():
+    benchmarks = {
+        'complete': bench_complete,
+        'fields': bench_fields,
+        'get': bench_get,
+        'import': bench_import_descriptions,
+        'parse': bench_parse_backends,
+        'pickle': bench_pickle,
+        'serialize': bench_serialize,
+        'startup': bench_startup,
+    }
+    names = sys.argv[1:] or sorted(benchmarks.keys())
+    for name in names:
+        benchmarks[name]()
+
+if __name__ == "__main__":
+    main()
@@ -20,7 +20,1666 @@
 
 from __future__ import print_function
 
+import datetime
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
 import appstream
+import appstream.flat
+import appstream.index
+
+def test_validate_all():
+
+    store = appstream.Store()
+    app = appstream.Component()
+    app.id = 'org.example.Good'
+    app.name = 'Good'
+    app.summary = 'Good app'
+    app.description = '<p>Good.</p>'
+    app.metadata_license = 'CC0-1.0'
+    app.project_license = 'GPL-2.0+'
+    app.developer_name = 'Example'
+    store.add(app)
+    app = appstream.Component()
+    app.id = 'org.example.Bad'
+    app.kind = 'firmware'
+    app.metadata_license = 'GPL-2.0+'
+    store.add(app)
+
+    for workers in [1, 2]:
+        report = store.validate_all(workers=workers)
+        assert list(report.keys()) == ['org.example.Bad'], report
+        problems = report['org.example.Bad']
+        assert problems == ['No <name> tag',
+                            'No <summary> tag',
+                            'No <description> tag',
+                            'No <provides> tag',
+                            'No <release> tag',
+                            'Invalid <metadata_license> tag',
+                            'No <project_license> tag',
+                            'No <developer_name> tag'], problems
+
+    # the first problem is still raised
+    try:
+        app.validate()
+        assert False
+    except appstream.ValidationError as e:
+        assert str(e) == 'No <name> tag', str(e)
+
+def test_locales():
+
+    data = """<?xml version="1.0" encoding="UTF-8"?>
+<components version="0.9" origin="test">
+  <component type="desktop">
+    <id>org.example.Hello</id>
+    <name>Hello</name>
+    <name xml:lang="de">Hallo</name>
+    <name xml:lang="fr">Bonjour</name>
+    <name xml:lang="pt_BR">Olá</name>
+    <summary>Says hello</summary>
+    <summary xml:lang="de">Sagt hallo</summary>
+    <description><p>Hello world.</p></description>
+    <description xml:lang="de"><p>Hallo Welt.</p></description>
+  </component>
+</components>
+"""
+    store = appstream.Store()
+    store.parse(data)
+    app = store.get_component('org.example.Hello')
+    assert app.name == 'Hello', app.name
+    assert app.get_name() == 'Hello', app.get_name()
+    assert app.get_name('de_DE.UTF-8') == 'Hallo', app.get_name('de_DE.UTF-8')
+    assert app.get_name('fr_FR') == 'Bonjour', app.get_name('fr_FR')
+    assert app.get_name('pt_BR') == u'Olá', app.get_name('pt_BR')
+    assert app.get_name('pt_PT') == 'Hello', app.get_name('pt_PT')
+    assert app.get_summary('de_AT') == 'Sagt hallo', app.get_summary('de_AT')
+    assert app.get_summary('fr') == 'Says hello', app.get_summary('fr')
+    assert app.get_description('de') == '<p>Hallo Welt.</p>'
+    assert app.get_description('ja') == '<p>Hello world.</p>'
+
+    # only keep the requested translations
+    store = appstream.Store()
+    store.parse(data, locales=['de_DE'])
+    app = store.get_component('org.example.Hello')
+    assert app.name == 'Hello', app.name
+    assert sorted(app.names.keys()) == ['de'], app.names
+    assert app.get_name('fr') == 'Hello', app.get_name('fr')
+    assert app.get_name('de_DE') == 'Hallo', app.get_name('de_DE')
+
+    # translations survive a round trip
+    app2 = appstream.Component()
+    app2.parse(app.to_xml())
+    assert app2.names == {'de': 'Hallo'}, app2.names
+    assert app2.summaries == {'de': 'Sagt hallo'}, app2.summaries
+
+def test_fields():
+
+    data = """<?xml version="1.0" encoding="UTF-8"?>
+<components version="0.9" origin="test">
+  <component type="firmware">
+    <id>com.example.Device.firmware</id>
+    <name>Device</name>
+    <provides>
+      <firmware type="flashed">84f40464-9272-4ef7-9399-cd95f12da696</firmware>
+    </provides>
+    <releases>
+      <release version="1.2.3" timestamp="1500000000"/>
+    </releases>
+    <reviews>
+      <review date="2016-09-15" rating="80" id="17"/>
+    </reviews>
+    <screenshots>
+      <screenshot type="default"><image>http://a.png</image></screenshot>
+    </screenshots>
+    <keywords><keyword>one</keyword></keywords>
+    <custom><value key="foo">bar</value></custom>
+  </component>
+</components>
+"""
+    store = appstream.Store()
+    store.parse(data, fields=['provides', 'releases'])
+    app = store.get_component('com.example.Device.firmware')
+    assert app.kind == 'firmware', app.kind
+    assert app.name is None, app.name
+    assert len(app.provides) == 1, app.provides
+    assert len(app.releases) == 1, app.releases
+    assert len(app.reviews) == 0, app.reviews
+    assert len(app.screenshots) == 0, app.screenshots
+    assert len(app.keywords) == 0, app.keywords
+    assert len(app.custom) == 0, app.custom
+
+    xml = app.to_xml()
+    app = appstream.Component()
+    app.parse(xml, fields=['releases'])
+    assert app.id == 'com.example.Device.firmware', app.id
+    assert len(app.provides) == 0, app.provides
+    assert len(app.releases) == 1, app.releases
+
+    try:
+        store.parse(data, fields=['id', 'nonexistent'])
+        assert False
+    except ValueError:
+        pass
+
+def test_columns():
+
+    store = appstream.Store()
+    for app_id, versions in [('org.example.A', ['1.0', '1.1']),
+                             ('org.example.B', ['2.0'])]:
+        app = appstream.Component()
+        app.id = app_id
+        app.kind = 'firmware'
+        for idx, version in enumerate(versions):
+            rel = appstream.Release()
+            rel.version = version
+            rel.timestamp = 1500000000 + idx
+            rel.urgency = 'high'
+            rel.size_download = 1024
+            rel.add_checksum(appstream.Checksum())
+            app.add_release(rel)
+        store.add(app)
+
+    tables = store.to_columns(use_numpy=False)
+    comps = tables['components']
+    rels = tables['releases']
+    assert comps['id'] == ['org.example.A', 'org.example.B'], comps['id']
+    assert list(rels['component']) == [0, 0, 1], rels['component']
+    assert rels['version'] == ['1.0', '1.1', '2.0'], rels['version']
+    assert list(rels['timestamp']) == [1500000000, 1500000001, 1500000000]
+    assert sum(rels['size_download']) == 3072, rels['size_download']
+    assert list(rels['checksums']) == [1, 1, 1], rels['checksums']
+
+    f = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+    store.export_releases(f, fmt='csv')
+    lines = f.getvalue().splitlines()
+    assert len(lines) == 4, lines
+    assert lines[0] == 'id,kind,version,timestamp,urgency,size_installed,size_download,checksums', lines[0]
+    assert lines[3] == 'org.example.B,firmware,2.0,1500000000,high,0,1024,1', lines[3]
+
+    f = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+    store.export_releases(f, fmt='jsonl')
+    rows = [json.loads(line) for line in f.getvalue().splitlines()]
+    assert rows[1]['version'] == '1.1', rows[1]
+    assert rows[1]['id'] == 'org.example.A', rows[1]
+
+def _has_yaml():
+    """ Returns True if PyYAML is installed for the DEP-11 tests """
+    try:
+        importlib.import_module('yaml')
+    except ImportError:
+        return False
+    return True
+
+def test_dep11():
+
+    if not _has_yaml():
+        print('PyYAML not installed, skipping DEP-11 tests')
+        return
+
+    data = b"""---
+File: DEP-11
+Version: '0.8'
+Origin: debian-stable-main
+---
+Type: desktop-application
+ID: org.example.Hello.desktop
+Package: hello
+Name:
+  C: Hello
+  de: Hallo
+  fr: Bonjour
+Summary:
+  C: Says hello
+Description:
+  C: >-
+    <p>Hello world.</p>
+Categories:
+  - Utility
+Keywords:
+  C:
+    - greeting
+Url:
+  homepage: https://example.org/
+Icon:
+  stock: hello
+  cached:
+    - name: hello_64.png
+      width: 64
+      height: 64
+Releases:
+  - version: 1.0
+    unix-timestamp: 1500000000
+Screenshots:
+  - default: true
+    caption:
+      C: Main window
+    source-image:
+      url: https://example.org/a.png
+      width: 800
+      height: 600
+    thumbnails:
+      - url: https://example.org/b.png
+        width: 624
+        height: 351
+---
+Type: firmware
+ID: com.example.Device.firmware
+Name:
+  C: Device
+Provides:
+  firmware:
+    - type: flashed
+      guid: 84F40464-9272-4EF7-9399-CD95F12DA696
+"""
+    header, components = appstream.dep11.read_dep11(io.BytesIO(data), locales=['de_DE'])
+    assert header['Origin'] == 'debian-stable-main', header
+    components = list(components)
+    assert len(components) == 2, components
+    app = components[0]
+    assert app.id == 'org.example.Hello.desktop', app.id
+    assert app.kind == 'desktop-application', app.kind
+    assert app.pkgname == 'hello', app.pkgname
+    assert app.name == 'Hello', app.name
+    assert app.names == {'de': 'Hallo'}, app.names
+    assert app.description == '<p>Hello world.</p>', app.description
+    assert app.keywords == ['greeting'], app.keywords
+    icon = app.icons['cached'][0]
+    assert icon.value == 'hello_64.png', icon.value
+    assert icon.width == 64, icon.width
+    assert app.releases[0].version == '1.0', app.releases[0].version
+    assert app.releases[0].timestamp == 1500000000
+    ss = app.screenshots[0]
+    assert ss.kind == 'default', ss.kind
+    assert ss.get_image_by_kind('thumbnail').width == 624
+    app = components[1]
+    assert app.provides[0].kind == 'firmware-flashed', app.provides[0].kind
+    assert app.provides[0].value == '84f40464-9272-4ef7-9399-cd95f12da696'
+
+    # round trip through a compressed file
+    store = appstream.Store('debian-stable-main')
+    for app in components:
+        store.add(app)
+    store.to_dep11('/tmp/components.yml.gz')
+    store2 = appstream.Store()
+    store2.from_dep11('/tmp/components.yml.gz')
+    assert store2.origin == 'debian-stable-main', store2.origin
+    for app in store.get_components():
+        app2 = store2.get_component(app.id)
+        assert app2.kind == app.kind, app2.kind
+        assert app2.names == app.names, app2.names
+        assert sorted(app2.icons) == sorted(app.icons), app2.icons
+        assert len(app2.releases) == len(app.releases), app2.releases
+        assert len(app2.provides) == len(app.provides), app2.provides
+        assert app2.origin == 'debian-stable-main', app2.origin
+        for ss, ss2 in zip(app.screenshots, app2.screenshots):
+            assert ss.to_xml() == ss2.to_xml(), ss2.to_xml()
+
+    # nothing is added if the file is only partly valid
+    with gzip.open('/tmp/components.yml.gz', 'wb') as f:
+        f.write(data + b'---\nID: [unclosed\n')
+    store2 = appstream.Store('old')
+    try:
+        store2.from_dep11('/tmp/components.yml.gz')
+        assert False
+    except appstream.ParseError:
+        pass
+    assert store2.origin == 'old', store2.origin
+    assert store2.components == {}, store2.components
+
+def test_snapshot():
+
+    store = appstream.Store('test')
+    app = appstream.Component()
+    app.id = 'org.example.A'
+    app.kind = 'firmware'
+    rel = appstream.Release()
+    rel.version = '1.0'
+    rel.timestamp = 1000
+    app.add_release(rel)
+    store.add(app)
+
+    snapshot = store.snapshot()
+    assert snapshot.origin == 'test', snapshot.origin
+    assert 'org.example.A' in snapshot
+    try:
+        snapshot.origin = 'other'
+        assert False
+    except AttributeError:
+        pass
+
+    # changing the store does not change the snapshot
+    app = appstream.Component()
+    app.id = 'org.example.B'
+    store.add(app)
+    assert len(snapshot) == 1, len(snapshot)
+    assert snapshot.get_component('org.example.B') is None
+
+    # adding releases and reviews to a component does not change it either
+    app = appstream.Component()
+    app.id = 'org.example.A'
+    rel = appstream.Release()
+    rel.version = '2.0'
+    rel.timestamp = 2000
+    app.add_release(rel)
+    store.add(app)
+    review = appstream.Review()
+    review.id = 'r1'
+    store.add_review('org.example.A', review)
+    assert len(store.get_component('org.example.A').releases) == 2
+    app = snapshot.get_component('org.example.A')
+    assert [r.version for r in app.releases] == ['1.0'], app.releases
+    assert app.reviews == []
+
+    # the indexes are built before the snapshot is returned
+    assert sorted(snapshot._store._indexes) == ['attributes', 'media', 'prefix',
+                                                'reviews', 'timeline']
+    assert [c.id for c in snapshot.complete('org.example.')[0]] == ['org.example.A']
+    assert [c.id for c in snapshot.query(kind='firmware')] == ['org.example.A']
+    items, _ = snapshot.get_releases_since(0)
+    assert [(c.id, r.version) for c, r in items] == [('org.example.A', '1.0')]
+    assert snapshot.best_icon('org.example.A') is None
+    assert snapshot.get_rating_histogram('org.example.A') == [0] * 6
+
+    holder = appstream.SnapshotHolder(snapshot)
+    store.to_file('/tmp/snapshot.xml.gz')
+    thread = holder.reload_async('/tmp/snapshot.xml.gz')
+    thread.join()
+    assert holder.error is None, holder.error
+    assert len(holder.get()) == 2, len(holder.get())
+    assert holder.get().get_component('org.example.B').id == 'org.example.B'
+    assert [c.id for c in holder.get().complete('org.example.b')[0]] == ['org.example.B']
+
+    # a failed reload keeps the old snapshot
+    holder.reload_async('/tmp/does-not-exist.xml.gz').join()
+    assert holder.error is not None
+    assert len(holder.get()) == 2, len(holder.get())
+
+def test_verify_payloads():
+
+    outer = tempfile.mkdtemp()
+    directory = os.path.join(outer, 'payloads')
+    os.mkdir(directory)
+    try:
+        with open(os.path.join(outer, 'outside.bin'), 'wb') as f:
+            f.write(b'hello world')
+        with open(os.path.join(directory, 'good.bin'), 'wb') as f:
+            f.write(b'hello world')
+        with open(os.path.join(directory, 'bad.bin'), 'wb') as f:
+            f.write(b'goodbye world')
+        os.mkdir(os.path.join(directory, 'subdir'))
+
+        app = appstream.Component()
+        app.id = 'org.example.A'
+        rel = appstream.Release()
+        rel.version = '1.0'
+        app.add_release(rel)
+        for target, filename, kind, value in [
+                ('container', 'good.bin', 'sha1', '2aae6c35c94fcfb415dbe95f408b9ce91ee846ed'),
+                ('content', 'good.bin', 'sha256', 'b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9'),
+                ('signature', 'bad.bin', 'sha1', 'deadbeef'),
+                ('device', 'missing.bin', 'sha1', 'deadbeef'),
+                ('folder', 'subdir', 'sha1', 'deadbeef'),
+                ('variable', 'good.bin', 'shake_128', 'deadbeef'),
+                ('parent', '../outside.bin', 'sha1', 'deadbeef'),
+                ('absolute', os.path.join(outer, 'outside.bin'), 'sha1', 'deadbeef')]:
+            csum = appstream.Checksum()
+            csum.target = target
+            csum.filename = filename
+            csum.kind = kind
+            csum.value = value
+            rel.add_checksum(csum)
+        store = appstream.Store()
+        store.add(app)
+
+        cache = {}
+        report = store.verify_payloads(directory, workers=2, cache=cache)
+        assert report['hashed'] == 2, report
+        assert report['cached'] == 0, report
+        assert len(report['mismatched']) == 1, report
+        assert report['mismatched'][0]['filename'] == 'bad.bin', report
+        assert [p['filename'] for p in report['missing']] == \
+            ['missing.bin', 'subdir'], report
+        assert [p['kind'] for p in report['unsupported']] == ['shake_128'], report
+
+        # files outside the directory are never read
+        assert len(report['unsafe']) == 2, report
+        assert report['unsafe'][0]['filename'] == '../outside.bin', report
+
+        # unchanged files are not hashed again
+        report = store.verify_payloads(directory, workers=2, cache=cache)
+        assert report['hashed'] == 0, report
+        assert report['cached'] == 2, report
+        assert len(report['mismatched']) == 1, report
+    finally:
+        shutil.rmtree(outer)
+
+def test_merge():
+
+    stores = []
+    for origin, name, versions in [('lvfs', 'Device', ['1.0', '1.1']),
+                                   ('vendor', 'Vendor Device', ['1.1', '1.2']),
+                                   ('other', None, ['0.9'])]:
+        store = appstream.Store(origin)
+        app = appstream.Component()
+        app.id = 'com.example.Device.firmware'
+        app.name = name
+        app.developer_name = origin
+        for version in versions:
+            rel = appstream.Release()
+            rel.version = version
+            rel.description = '<p>From %s</p>' % origin
+            app.add_release(rel)
+        store.add(app)
+        app = appstream.Component()
+        app.id = 'com.example.%s.firmware' % origin
+        store.add(app)
+        stores.append(store)
+
+    store = appstream.Store('merged')
+    store.merge(stores, priority=['vendor', 'lvfs'])
+    assert len(store.components) == 4, store.components
+    app = store.get_component('com.example.Device.firmware')
+    assert app.origin == 'vendor', app.origin
+    assert app.name == 'Vendor Device', app.name
+    assert app.developer_name == 'vendor', app.developer_name
+    versions = [rel.version for rel in app.releases]
+    assert sorted(versions) == ['0.9', '1.0', '1.1', '1.2'], versions
+    rel = [rel for rel in app.releases if rel.version == '1.1'][0]
+    assert rel.description == '<p>From vendor</p>', rel.description
+    assert store.get_component('com.example.lvfs.firmware').origin == 'lvfs'
+
+    # the input stores are not changed
+    app = stores[0].get_component('com.example.Device.firmware')
+    assert len(app.releases) == 2, app.releases
+
+    # without priority the last store wins
+    store = appstream.Store('merged')
+    store.merge(stores)
+    app = store.get_component('com.example.Device.firmware')
+    assert app.developer_name == 'other', app.developer_name
+    assert app.name == 'Vendor Device', app.name
+
+    # releases and reviews without a version or ID are all kept
+    unkeyed = []
+    for origin, count in [('lvfs', 3), ('vendor', 2)]:
+        store = appstream.Store(origin)
+        app = appstream.Component()
+        app.id = 'org.example.A'
+        for i in range(count):
+            app.reviews.append(appstream.Review())
+            app.releases.append(appstream.Release())
+        store.add(app)
+        unkeyed.append(store)
+    store = appstream.Store('merged')
+    store.merge(unkeyed)
+    app = store.get_component('org.example.A')
+    assert len(app.reviews) == 5, app.reviews
+    assert len(app.releases) == 5, app.releases
+
+    # components from only one store are copied
+    other = appstream.Store('other')
+    app = appstream.Component()
+    app.id = 'org.example.B'
+    rel = appstream.Release()
+    rel.version = '1.0'
+    app.add_release(rel)
+    other.add(app)
+    store.merge([other])
+    assert store.get_component('org.example.B').origin == 'other'
+    assert app.origin is None
+    app2 = appstream.Component()
+    app2.id = 'org.example.B'
+    rel = appstream.Release()
+    rel.version = '2.0'
+    app2.add_release(rel)
+    store.add(app2)
+    assert len(store.get_component('org.example.B').releases) == 2
+    assert len(app.releases) == 1, app.releases
+
+    # the icons of each kind are copied as well
+    icon = appstream.Icon()
+    icon.kind = 'cached'
+    icon.value = 'a.png'
+    app.add_icon(icon)
+    store.merge([other])
+    icon = appstream.Icon()
+    icon.kind = 'cached'
+    icon.value = 'b.png'
+    store.get_component('org.example.B').add_icon(icon)
+    assert [i.value for i in app.icons['cached']] == ['a.png'], app.icons
+
+    # adding a component again does not duplicate releases
+    store = appstream.Store()
+    store.add(stores[0].get_component('com.example.Device.firmware'))
+    store.add(stores[1].get_component('com.example.Device.firmware'))
+    app = store.get_component('com.example.Device.firmware')
+    versions = [rel.version for rel in app.releases]
+    assert versions == ['1.0', '1.1', '1.2'], versions
+
+def test_media_index():
+
+    data = """<?xml version="1.0" encoding="UTF-8"?>
+<components version="0.9" origin="test">
+  <component type="desktop">
+    <id>org.example.Hello</id>
+    <icon type="stock">hello</icon>
+    <icon type="cached" width="64" height="64">64x64/hello.png</icon>
+    <icon type="cached" width="128" height="128">128x128/hello.png</icon>
+    <icon type="cached" width="64" height="64" scale="2">64x64@2/hello.png</icon>
+    <screenshots>
+      <screenshot>
+        <image type="source">http://other.png</image>
+      </screenshot>
+      <screenshot type="default">
+        <image type="source">http://source.png</image>
+        <image type="thumbnail" width="624" height="351">http://624.png</image>
+        <image type="thumbnail" width="112" height="63">http://112.png</image>
+      </screenshot>
+    </screenshots>
+  </component>
+  <component type="desktop">
+    <id>org.example.Stock</id>
+    <icon type="stock">stock</icon>
+  </component>
+</components>
+"""
+    store = appstream.Store()
+    store.parse(data)
+    app = store.get_component('org.example.Hello')
+    icon = app.icons['cached'][2]
+    assert icon.scale == 2, icon.scale
+    assert icon.value == '64x64@2/hello.png', icon.value
+
+    assert store.best_icon('org.example.Hello', 48).value == '64x64/hello.png'
+    assert store.best_icon('org.example.Hello', 64).value == '64x64/hello.png'
+    assert store.best_icon('org.example.Hello', 100).value == '128x128/hello.png'
+    icon = store.best_icon('org.example.Hello', 64, scale=2)
+    assert icon.width * icon.scale == 128, icon.to_xml()
+    icon = store.best_icon('org.example.Hello', 512)
+    assert icon.width * icon.scale == 128, icon.to_xml()
+    assert store.best_icon('org.example.Stock', 64).value == 'stock'
+    assert store.best_icon('org.example.Missing', 64) is None
+
+    im = store.best_screenshot_image('org.example.Hello', 100)
+    assert im.url == 'http://112.png', im.url
+    im = store.best_screenshot_image('org.example.Hello', 300)
+    assert im.url == 'http://624.png', im.url
+    im = store.best_screenshot_image('org.example.Hello', 1920)
+    assert im.url == 'http://source.png', im.url
+
+    # the index follows changes to the store
+    app = appstream.Component()
+    app.id = 'org.example.New'
+    icon = appstream.Icon()
+    icon.kind = 'remote'
+    icon.value = 'http://new.png'
+    icon.width = 256
+    app.add_icon(icon)
+    store.add(app)
+    assert store.best_icon('org.example.New', 64).value == 'http://new.png'
+
+def test_review_index():
+
+    store = appstream.Store()
+    app = appstream.Component()
+    app.id = 'org.example.A'
+    store.add(app)
+    for idx, (rating, karma, locale, version) in enumerate([
+            (100, 5, 'en_GB', '1.0'),
+            (80, -1, 'en_GB', '1.0'),
+            (20, 10, 'de_DE', '1.1'),
+            (100, 3, 'de_DE', '1.1')]):
+        rev = appstream.Review()
+        rev.id = str(idx)
+        rev.rating = rating
+        rev.karma = karma
+        rev.score = -karma
+        rev.locale = locale
+        rev.version = version
+        store.add_review('org.example.A', rev)
+
+        # build the index half way through
+        if idx == 1:
+            assert store.get_rating_histogram('org.example.A') == [0, 0, 0, 0, 1, 1]
+
+    assert store.get_rating_histogram('org.example.A') == [0, 1, 0, 0, 1, 2]
+    assert store.get_rating_average('org.example.A') == 75.0
+    assert store.get_rating_average('org.example.A', locale='de_DE') == 60.0
+    assert store.get_rating_average('org.example.A', version='1.0') == 90.0
+    assert store.get_rating_average('org.example.A', locale='fr_FR') is None
+    ids = [rev.id for rev in store.get_top_reviews('org.example.A', 2)]
+    assert ids == ['2', '0'], ids
+    ids = [rev.id for rev in store.get_top_reviews('org.example.A', key='score')]
+    assert ids == ['1', '3', '0', '2'], ids
+
+    # duplicate reviews are ignored
+    store.add_review('org.example.A', store.get_top_reviews('org.example.A', 1)[0])
+    assert sum(store.get_rating_histogram('org.example.A')) == 4
+
+    assert store.get_rating_histogram('org.example.B') == [0] * 6
+    assert store.get_rating_average('org.example.B') is None
+    assert store.get_top_reviews('org.example.B') == []
+
+def _to_dict(obj):
+    """ Returns a model object as nested dicts for comparing """
+    if isinstance(obj, list):
+        return [_to_dict(item) for item in obj]
+    if isinstance(obj, dict):
+        return dict((key, _to_dict(obj[key])) for key in obj)
+    if hasattr(obj, '__dict__'):
+        return _to_dict(vars(obj))
+    return obj
+
+def test_parse_backends():
+
+    data = """<?xml version="1.0" encoding="UTF-8"?>
+<components version="0.9" origin="test">
+  <component type="desktop">
+    <id>org.example.Hello</id>
+    <name>Hello</name>
+    <name xml:lang="de">Hallo</name>
+    <summary>Says <b>hello</b></summary>
+    <description>
+      <p>Hello
+         world.</p>
+      <ol><li>One</li><li>Two</li></ol>
+    </description>
+    <description xml:lang="de"><p>Hallo Welt.</p></description>
+    <description xml:lang="fr">Bonjour</description>
+    <updatecontact>hello@example.com</updatecontact>
+    <metadata_license>CC0-1.0</metadata_license>
+    <licence>GPL-2.0+</licence>
+    <developer_name>Example</developer_name>
+    <pkgname>hello</pkgname>
+    <url type="bugtracker">http://example.com/bugs</url>
+    <url>http://example.com/</url>
+    <icon type="cached" width="64" height="64">hello.png</icon>
+    <bundle type="flatpak" runtime="org.gnome.Platform">app/org.example.Hello</bundle>
+    <provides>
+      <firmware type="flashed">84F40464-9272-4EF7-9399-CD95F12DA696</firmware>
+      <binary>hello</binary>
+    </provides>
+    <requires>
+      <id compare="ge" version="0.8.2">org.freedesktop.fwupd</id>
+    </requires>
+    <kudos><kudo>HiDpiIcon</kudo><other>x</other></kudos>
+    <keywords><keyword>greeting</keyword></keywords>
+    <categories><category>Utility</category></categories>
+    <custom><value key="foo">bar</value><value>nokey</value></custom>
+    <releases>
+      <release version="0x0102" timestamp="1500000000" urgency="high">
+        <size type="installed">123</size>
+        <size>456</size>
+        <checksum target="content" filename="a.bin" type="sha256">beef</checksum>
+        <description><p>Fixed.</p></description>
+      </release>
+      <release version="0x0102" timestamp="1400000000"/>
+      <other/>
+    </releases>
+    <reviews>
+      <review rating="80" karma="-1" id="17">
+        <summary>Hello world</summary>
+        <description><p>Mighty Fine</p></description>
+        <lang>en_GB</lang>
+        <metadata><value key="foo">bar</value></metadata>
+      </review>
+    </reviews>
+    <screenshots>
+      <screenshot type="default">
+        <image type="source">http://a.png</image>
+        <image type="thumbnail" width="624" height="351">http://b.png</image>
+        <caption><p>A caption</p></caption>
+      </screenshot>
+    </screenshots>
+  </component>
+  <component>
+    <id>org.example.Empty</id>
+  </component>
+</components>
+"""
+    for kwargs in [{}, {'locales': ['de']}, {'fields': ['releases', 'name']}]:
+        stores = []
+        for backend in ['tree', 'events']:
+            store = appstream.Store()
+            store.parse(data, backend=backend, **kwargs)
+            stores.append(store)
+        assert stores[1].origin == 'test', stores[1].origin
+        assert _to_dict(stores[0].components) == _to_dict(stores[1].components), kwargs
+
+    apps = []
+    for backend in ['tree', 'events']:
+        app = appstream.Component()
+        app.parse(stores[0].get_component('org.example.Hello').to_xml(),
+                  backend=backend)
+        apps.append(app)
+    assert apps[1].id == 'org.example.Hello', apps[1].id
+    assert _to_dict(apps[0]) == _to_dict(apps[1])
+
+    # errors are the same
+    for backend in ['tree', 'events']:
+        try:
+            appstream.Store().parse('<components origin="x"><component>'
+                                    '<description><p>x</p><b>y</b></description>'
+                                    '</component></components>', backend=backend)
+            assert False
+        except appstream.ParseError:
+            pass
+        try:
+            appstream.Store().parse('junk', backend=backend)
+            assert False
+        except appstream.ParseError:
+            pass
+
+def test_parse_limits():
+
+    def _catalog(n_components, n_releases, depth=0):
+        xml = '<components origin="x">'
+        for i in range(n_components):
+            xml += '<component><id>c%i</id><releases>' % i
+            for j in range(n_releases):
+                xml += '<release version="%i"/>' % j
+            xml += '</releases>%s%s</component>' % ('<p>' * depth, '</p>' * depth)
+        return xml + '</components>'
+
+    cases = [
+        (_catalog(3, 1), appstream.ParseLimits(max_components=2)),
+        (_catalog(1, 4), appstream.ParseLimits(max_releases=3)),
+        (_catalog(1, 1, 10), appstream.ParseLimits(max_depth=8)),
+        (_catalog(1, 1), appstream.ParseLimits(max_bytes=20)),
+    ]
+    for xml, limits in cases:
+        for backend in ['tree', 'events']:
+            store = appstream.Store('old')
+            store.add(appstream.Component())
+            try:
+                store.parse(xml, backend=backend, limits=limits)
+                assert False, backend
+            except appstream.ParseError:
+                pass
+
+            # nothing is added if the catalog could not be parsed
+            assert store.origin == 'old', store.origin
+            assert list(store.components.keys()) == [None], store.components
+
+    # within the limits
+    limits = appstream.ParseLimits(max_bytes=4096, max_depth=4,
+                                   max_components=3, max_releases=4)
+    for backend in ['tree', 'events']:
+        store = appstream.Store()
+        store.parse(_catalog(3, 4), backend=backend, limits=limits)
+        assert len(store.get_components()) == 3
+        store.parse(_catalog(3, 4), backend=backend, limits=limits, fields=['id'])
+        assert len(store.get_components()) == 3
+        app = appstream.Component()
+        app.parse('<component><id>a</id><releases><release version="1"/>'
+                  '<release version="2"/></releases></component>',
+                  backend=backend, limits=limits)
+        assert len(app.releases) == 2
+        try:
+            app.parse('<component><id>b</id><releases><release version="3"/>'
+                      '<release version="4"/></releases></component>',
+                      backend=backend,
+                      limits=appstream.ParseLimits(max_releases=1))
+            assert False, backend
+        except appstream.ParseError:
+            pass
+
+        # the component is unchanged if it could not be parsed
+        assert app.id == 'a', app.id
+        assert [rel.version for rel in app.releases] == ['1', '2'], backend
+
+    # a small compressed file cannot expand past max_bytes
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'big.xml.gz')
+        f = gzip.open(filename, 'wb')
+        f.write(_catalog(500, 1).encode('utf-8'))
+        f.close()
+        try:
+            appstream.Store().from_file(filename,
+                                        limits=appstream.ParseLimits(max_bytes=1024))
+            assert False
+        except appstream.ParseError:
+            pass
+        store = appstream.Store()
+        store.from_file(filename, limits=appstream.ParseLimits(max_components=500))
+        assert len(store.get_components()) == 500
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_cli():
+
+    # heavy optional modules are only imported when they are needed
+    code = ('import sys, appstream; '
+            'print(",".join(m for m in ["dateutil", "lxml", "multiprocessing", '
+            '"numpy", "yaml"] if m in sys.modules))')
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=cwd)
+    assert out.strip() == b'', out
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for origin, name in [('a', 'Hello'), ('b', 'Goodbye')]:
+            store = appstream.Store(origin)
+            app = appstream.Component()
+            app.id = 'org.example.Hello'
+            app.name = name
+            app.keywords = ['greeting']
+            store.add(app)
+            app = appstream.Component()
+            app.id = 'org.example.Other'
+            app.keywords = ['org.example.Hello']
+            store.add(app)
+            filename = os.path.join(tmpdir, '%s.xml.gz' % origin)
+            store.to_file(filename)
+            filenames.append(filename)
+
+        def _run(*args):
+            proc = subprocess.Popen([sys.executable, '-m', 'appstream'] + list(args),
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, cwd=cwd)
+            out = proc.communicate()[0].decode('utf-8')
+            return proc.returncode, out
+
+        rc, out = _run('get', filenames[0], 'org.example.Hello')
+        assert rc == 0 and '<name>Hello</name>' in out, out
+        rc, out = _run('get', filenames[0], 'org.example.Other')
+        assert rc == 0 and '<id>org.example.Other</id>' in out, out
+        rc, out = _run('get', filenames[0], 'org.example.Missing')
+        assert rc == 1, rc
+
+        # from a flat catalog, or parsing when the ID is not written as-is
+        flat = os.path.join(tmpdir, 'a.flat')
+        store.to_flat_file(flat)
+        rc, out = _run('get', flat, 'org.example.Hello')
+        assert rc == 0 and '<name>Goodbye</name>' in out, out
+        rc, out = _run('get', flat, 'org.example.Missing')
+        assert rc == 1, rc
+        escaped = os.path.join(tmpdir, 'escaped.xml')
+        with open(escaped, 'wb') as f:
+            f.write(store.to_xml().replace('<id>org.example.Hello',
+                                           '<id>org&#46;example.Hello').encode('utf-8'))
+        rc, out = _run('get', escaped, 'org.example.Hello')
+        assert rc == 0 and '<name>Goodbye</name>' in out, out
+        rc, out = _run('search', filenames[0], 'GREET')
+        assert out == 'org.example.Hello\tHello\n', out
+        rc, out = _run('stats', filenames[0])
+        assert 'components: 2\n' in out, out
+        rc, out = _run('dump', filenames[0])
+        store = appstream.Store()
+        store.parse(out)
+        assert len(store.get_components()) == 2
+        rc, out = _run('validate', filenames[0])
+        assert rc == 1 and 'org.example.Other: ' in out, out
+        merged = os.path.join(tmpdir, 'merged.xml.gz')
+        rc, out = _run('merge', merged, filenames[0], filenames[1],
+                       '--priority', 'a,b', '--origin', 'merged')
+        assert rc == 0, rc
+        store = appstream.Store()
+        store.from_file(merged)
+        assert store.origin == 'merged', store.origin
+        assert store.get_component('org.example.Hello').name == 'Hello'
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_reproducible():
+
+    def _make_store(order):
+        store = appstream.Store('test')
+        for app_id in order:
+            app = appstream.Component()
+            app.id = app_id
+            app.name = 'Name'
+            for lang in order:
+                app.names[lang] = 'Name %s' % lang
+                app.urls[lang] = 'http://example.com/%s' % lang
+                app.custom[lang] = 'value'
+            store.add(app)
+        return store
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        data = []
+        for order in [['a', 'b', 'c'], ['c', 'a', 'b']]:
+            filename = os.path.join(tmpdir, 'out.xml.gz')
+            _make_store(order).to_file(filename)
+            with open(filename, 'rb') as f:
+                data.append(f.read())
+        assert data[0] == data[1]
+
+        # no filename and a zero mtime in the gzip header
+        assert data[0][3:4] == b'\x00', data[0][3:4]
+        assert data[0][4:8] == b'\x00\x00\x00\x00', data[0][4:8]
+
+        filename = _make_store(['a', 'b']).to_hashed_file(tmpdir)
+        assert os.path.basename(filename).startswith('appstream-')
+        assert filename.endswith('.xml.gz'), filename
+        mtime = os.path.getmtime(filename)
+        assert _make_store(['b', 'a']).to_hashed_file(tmpdir) == filename
+        assert os.path.getmtime(filename) == mtime
+        assert _make_store(['a']).to_hashed_file(tmpdir) != filename
+        with open(filename, 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        assert filename.endswith('-%s.xml.gz' % checksum), filename
+        assert not [n for n in os.listdir(tmpdir) if n.endswith('.tmp')]
+
+        # DEP-11 output is streamed with the same fixed header
+        if _has_yaml():
+            for i, names in enumerate((['a', 'b'], ['b', 'a'])):
+                _make_store(names).to_dep11(os.path.join(tmpdir, '%i.yml.gz' % i))
+            data = []
+            for i in range(2):
+                with open(os.path.join(tmpdir, '%i.yml.gz' % i), 'rb') as f:
+                    data.append(f.read())
+            assert data[0] == data[1]
+            store = appstream.Store()
+            store.from_dep11(os.path.join(tmpdir, '0.yml.gz'))
+            assert len(store.get_components()) == 2
+        store = appstream.Store()
+        store.from_file(filename)
+        assert len(store.get_components()) == 2
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_delta():
+
+    def _make_app(app_id, version, icon='a.png'):
+        app = appstream.Component()
+        app.id = app_id
+        app.name = app_id
+        rel = appstream.Release()
+        rel.version = version
+        rel.timestamp = 1500000000
+        app.add_release(rel)
+        icon_obj = appstream.Icon()
+        icon_obj.kind = 'cached'
+        icon_obj.value = icon
+        icon_obj.width = icon_obj.height = 64
+        app.add_icon(icon_obj)
+        app.kind = 'firmware'
+        app.origin = 'test'
+        app.metadata_license = 'CC0-1.0'
+        app.update_contact = 'someone@example.com'
+        for kind in ('firmware-flashed', None):
+            prov = appstream.Provide()
+            prov.kind = kind
+            prov.value = ('%s-%s' % (app_id, kind)).lower()
+            app.add_provide(prov)
+        return app
+
+    old = appstream.Store('test')
+    for i in range(50):
+        old.add(_make_app('org.example.App%i' % i, '1.0'))
+    new = appstream.Store()
+    new.parse(old.to_xml())
+    new._remove_component('org.example.App1')
+    new.add(_make_app('org.example.New', '1.0'))
+    new._set_component(_make_app('org.example.App2', '2.0', 'b.png'))
+
+    delta = appstream.Store.make_delta(old, new)
+    assert len(delta) < len(new.to_xml()) // 10, len(delta)
+    assert 'org.example.App3<' not in delta
+
+    # patching gives exactly the components of the new store
+    client = appstream.Store()
+    client.parse(old.to_xml())
+    client.build_indexes()
+    client.apply_delta(delta)
+    assert _to_dict(client.components) == _to_dict(new.components)
+    assert client.to_xml() == new.to_xml()
+    assert client.get_component('org.example.App1') is None
+    assert client.best_icon('org.example.App1') is None
+    assert client.best_icon('org.example.App2').value == 'b.png'
+    assert client.best_icon('org.example.New').value == 'a.png'
+
+    # nothing changed
+    client.apply_delta(appstream.Store.make_delta(new, new))
+    assert _to_dict(client.components) == _to_dict(new.components)
+    try:
+        client.apply_delta(new.to_xml())
+        assert False
+    except appstream.ParseError:
+        pass
+
+def test_flat():
+
+    store = appstream.Store('test')
+    for i in range(100):
+        app = appstream.Component()
+        app.id = 'org.example.App%03i' % i
+        app.name = u'App \u00ae %i' % i
+        app.summary = 'Summary'
+        app.origin = 'test'
+        store.add(app)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'catalog.flat')
+        store.to_flat_file(filename)
+        flat = appstream.FlatStore.open(filename)
+        try:
+            assert flat.origin == 'test', flat.origin
+            assert len(flat) == 100
+            assert 'org.example.App042' in flat
+            assert 'org.example.App100' not in flat
+            assert flat.get_component('org.example.App') is None
+            for app_id in store.components:
+                view = flat.get_component(app_id)
+                assert view.id == app_id, view.id
+                assert view.to_xml() == store.components[app_id].to_xml()
+            view = flat.get_component('org.example.App007')
+            assert view.name == u'App \u00ae 7', view.name
+            assert view.summary == 'Summary'
+            assert view.origin == 'test'
+            ids = [view.id for view in flat.get_components()]
+            assert ids == sorted(store.components), ids[:3]
+            assert view.releases == [] and view.releases is not view.releases
+            assert view.get_name() == u'App \u00ae 7'
+        finally:
+            flat.close()
+
+        # every field and extra attribute is kept
+        app = store.components['org.example.App001']
+        app.kind = 'firmware'
+        app.metadata_license = 'CC0-1.0'
+        app.update_contact = 'someone@example.com'
+        app.names['fr'] = 'Appli'
+        rel = appstream.Release()
+        rel.version = '1.2'
+        csum = appstream.Checksum()
+        csum.value = 'abc'
+        rel.add_checksum(csum)
+        app.add_release(rel)
+        prov = appstream.Provide()
+        prov.value = 'guid'
+        app.add_provide(prov)
+        app.priority = 5
+        app.tags = set(['a', 'b'])
+        app.raw = b'\xff'
+        store.to_flat_file(filename)
+        flat = appstream.FlatStore.open(filename)
+        try:
+            view = flat.get_component('org.example.App001')
+            assert _to_dict(view.get_component()) == _to_dict(app)
+            assert view.releases[0].checksums[0].value == 'abc'
+            assert view.provides[0].kind is None
+            assert view.priority == 5
+            assert view.tags == set(['a', 'b']) and view.raw == b'\xff'
+            assert view.to_xml() == app.to_xml()
+            try:
+                view.missing
+                assert False
+            except AttributeError:
+                pass
+        finally:
+            flat.close()
+
+        # only model objects and plain values are loaded
+        app.created = datetime.date(2020, 1, 1)
+        buf = io.BytesIO()
+        appstream.flat.write_flat([app], buf)
+        try:
+            appstream.FlatStore(buf.getvalue()).get_component(app.id).created
+            assert False
+        except appstream.ParseError:
+            pass
+
+        # from bytes too
+        with open(filename, 'rb') as f:
+            flat = appstream.FlatStore(f.read())
+        assert flat.get_component('org.example.App099').name == u'App \u00ae 99'
+        try:
+            appstream.FlatStore(b'junk')
+            assert False
+        except appstream.ParseError:
+            pass
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_query():
+
+    store = appstream.Store('test')
+    for i in range(40):
+        app = appstream.Component()
+        app.id = 'org.example.App%i' % i
+        app.kind = ['firmware', 'desktop'][i % 2]
+        app.project_license = ['GPL-2.0+', 'MIT', 'proprietary'][i % 3]
+        app.categories = [['Audio'], ['Video'], ['Audio', 'System']][i % 3]
+        prov = appstream.Provide()
+        prov.kind = 'firmware-flashed'
+        prov.value = 'guid-%i' % (i % 10)
+        app.add_provide(prov)
+        req = appstream.Require()
+        req.kind = 'id'
+        req.value = 'org.freedesktop.fwupd' if i % 4 else 'org.example.Other'
+        app.add_require(req)
+        for j in range(i % 3):
+            rel = appstream.Release()
+            rel.version = '1.%i' % j
+            rel.timestamp = 1000 * i + j
+            rel.urgency = ['low', 'critical'][j]
+            app.add_release(rel)
+        store.add(app)
+
+    def _check(**kwargs):
+        got = sorted(c.id for c in store.query(**kwargs))
+        expected = []
+        for c in store.get_components():
+            ok = True
+            for name, value in kwargs.items():
+                if name == 'kind':
+                    ok = ok and c.kind == value
+                elif name == 'category':
+                    ok = ok and value in c.categories
+                elif name == 'provides':
+                    ok = ok and value in [p.value for p in c.provides]
+                elif name == 'requires':
+                    ok = ok and value in [r.value for r in c.requires]
+                elif name == 'project_license':
+                    ok = ok and c.project_license == value
+                elif name == 'urgency':
+                    ok = ok and value in [r.urgency for r in c.releases]
+                elif name == 'has_release_newer_than':
+                    ok = ok and any(r.timestamp > value for r in c.releases)
+            if ok:
+                expected.append(c.id)
+        assert got == sorted(expected), (kwargs, got, expected)
+        return len(got)
+
+    assert _check() == 40
+    assert _check(kind='firmware') == 20
+    assert _check(kind='firmware', category='Audio', project_license='GPL-2.0+') > 0
+    assert _check(category='Audio', project_license='MIT') == 0
+    assert _check(provides='guid-3') == 4
+    assert _check(requires='org.example.Other', kind='firmware') == 10
+    assert _check(urgency='critical', has_release_newer_than=20000) > 0
+    assert _check(has_release_newer_than=30000) > 0
+    assert _check(category='Nope') == 0
+
+    # chaining and replacing components
+    query = store.query(kind='firmware').filter(urgency='critical')
+    count = query.count()
+    app = appstream.Component()
+    app.id = 'org.example.App2'
+    app.kind = 'desktop'
+    store._set_component(app)
+    assert query.count() == count - 1
+    assert _check(kind='firmware', urgency='critical') == count - 1
+    assert store.query(provides='guid-2').first().id != 'org.example.App2'
+    assert store.query(kind='nope').first() is None
+    try:
+        store.query(colour='red')
+        assert False
+    except ValueError:
+        pass
+
+def test_release_policy():
+
+    store = appstream.Store('test')
+    for i in range(3):
+        app = appstream.Component()
+        app.id = 'org.example.App%i' % i
+        for j in range(i * 4):
+            rel = appstream.Release()
+            rel.version = '1.%i' % j
+            rel.timestamp = 1000 + j * (1 - 2 * (j % 2))
+            rel.urgency = 'critical' if j == 1 else 'low'
+            rel.description = u'<p>Fixed \u00ae</p>'
+            app.add_release(rel)
+        store.add(app)
+    full = store.to_xml()
+
+    policy = appstream.ReleasePolicy(keep_latest=2, urgencies=['critical'])
+    kept = policy.select(store.get_component('org.example.App2').releases)
+    assert [rel.version for rel in kept] == ['1.1', '1.4', '1.6'], kept
+    policy = appstream.ReleasePolicy(newer_than=1003)
+    kept = policy.select(store.get_component('org.example.App2').releases)
+    assert [rel.version for rel in kept] == ['1.4', '1.6'], kept
+    assert appstream.ReleasePolicy().select([1, 2]) == [1, 2]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'out.xml.gz')
+        policy = appstream.ReleasePolicy(keep_latest=1, newer_than=5000)
+        report = store.to_file(filename, policy)
+        assert report['releases_kept'] == 2, report
+        assert report['releases_dropped'] == 10, report
+        compact = store.to_xml(policy)
+        assert report['bytes_saved'] == \
+            len(full.encode('utf-8')) - len(compact.encode('utf-8')), report
+
+        # the store is unchanged
+        assert store.to_xml() == full
+        assert len(store.get_component('org.example.App2').releases) == 8
+
+        reparsed = appstream.Store()
+        reparsed.from_file(filename)
+        assert reparsed.to_xml() == compact
+        versions = [rel.version for rel in
+                    reparsed.get_component('org.example.App2').releases]
+        assert versions == ['1.6'], versions
+
+        # without a policy nothing is dropped
+        report = store.to_file(filename)
+        assert report['releases_dropped'] == 0 and report['bytes_saved'] == 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_releases_since():
+
+    def _make_app(app_id, timestamps):
+        app = appstream.Component()
+        app.id = app_id
+        for ts in timestamps:
+            rel = appstream.Release()
+            rel.version = '1.%i' % ts
+            rel.timestamp = ts
+            app.add_release(rel)
+        return app
+
+    store = appstream.Store('test')
+    store.add(_make_app('org.example.A', [100, 300, 500]))
+    store.add(_make_app('org.example.B', [200, 300, 600]))
+    items, cursor = store.get_releases_since(300)
+    assert [(c.id, r.timestamp) for c, r in items] == \
+        [('org.example.A', 500), ('org.example.B', 600)], items
+    assert cursor is None
+
+    # paging
+    seen = []
+    cursor = None
+    while True:
+        items, cursor = store.get_releases_since(150, limit=2, cursor=cursor)
+        seen.extend(r.timestamp for c, r in items)
+        if cursor is None:
+            break
+    assert seen == [200, 300, 300, 500, 600], seen
+
+    # kept up to date by add and merge
+    store.add(_make_app('org.example.A', [700]))
+    items, _ = store.get_releases_since(600)
+    assert [(c.id, r.version) for c, r in items] == [('org.example.A', '1.700')]
+    other = appstream.Store('other')
+    other.add(_make_app('org.example.C', [800]))
+    store.merge([other])
+    items, _ = store.get_releases_since(600)
+    assert [c.id for c, r in items] == ['org.example.A', 'org.example.C'], items
+    store._remove_component('org.example.C')
+    items, _ = store.get_releases_since(600)
+    assert len(items) == 1, items
+    ids = sorted(c.id for c in store.query(has_release_newer_than=550))
+    assert ids == ['org.example.A', 'org.example.B'], ids
+
+    # building in bulk gives the same index as adding one at a time
+    from appstream.index import TimelineIndex
+    built = TimelineIndex()
+    built.build(store.get_components())
+    added = TimelineIndex()
+    for component in store.get_components():
+        added.add(component)
+    assert built.get_since(0, 100) == added.get_since(0, 100)
+    assert built._timestamps == added._timestamps
+
+def test_feed():
+
+    store = appstream.Store('test')
+    for i in range(20):
+        app = appstream.Component()
+        app.id = 'org.example.App%02i' % i
+        app.name = u'App \u00ae %i' % i
+        rel = appstream.Release()
+        rel.version = '1.%i' % i
+        rel.timestamp = 1500000000 + i
+        app.add_release(rel)
+        store.add(app)
+    xml = store.to_xml()
+    data = xml.encode('utf-8')
+
+    for chunk_size in [1, 7, 4096]:
+        fed = appstream.Store()
+        for offset in range(0, len(data), chunk_size):
+            fed.feed(data[offset:offset + chunk_size])
+        fed.close()
+        assert fed.origin == 'test', fed.origin
+        assert fed.to_xml() == xml
+
+    # each component is available as soon as its closing tag is fed
+    fed = appstream.Store()
+    end = xml.index('</component>') + len('</component>')
+    fed.feed(xml[:end])
+    assert list(fed.components) == ['org.example.App00'], list(fed.components)
+    fed.feed(xml[end:])
+    fed.close()
+    assert len(fed.components) == 20
+
+    # options, limits and errors
+    fed = appstream.Store()
+    fed.start_feed(fields=['name'], limits=appstream.ParseLimits(max_components=30))
+    fed.feed(data)
+    fed.close()
+    assert fed.get_component('org.example.App03').releases == []
+    fed = appstream.Store()
+    fed.start_feed(limits=appstream.ParseLimits(max_bytes=1000))
+    try:
+        for offset in range(0, len(data), 100):
+            fed.feed(data[offset:offset + 100])
+        assert False
+    except appstream.ParseError:
+        pass
+    fed.close()
+    assert 0 < len(fed.components) < 20
+    fed = appstream.Store()
+    try:
+        fed.feed('<components origin="x"><oops></components>')
+        fed.close()
+        assert False
+    except appstream.ParseError:
+        pass
+
+    # components too
+    app_xml = store.get_component('org.example.App05').to_xml()
+    app = appstream.Component()
+    for offset in range(0, len(app_xml), 5):
+        app.feed(app_xml[offset:offset + 5])
+    app.close()
+    assert app.to_xml() == app_xml
+
+def test_memory_report():
+
+    store = appstream.Store('test')
+    for i in range(5):
+        app = appstream.Component()
+        app.id = 'org.example.App%i' % i
+        app.description = '<p>%s</p>' % ('x' * 1000 * i)
+        rel = appstream.Release()
+        rel.version = '1.0'
+        csum = appstream.Checksum()
+        csum.value = 'deadbeef'
+        rel.add_checksum(csum)
+        app.add_release(rel)
+        review = appstream.Review()
+        review.id = 'review%i' % i
+        review.metadata['foo'] = 'bar'
+        app.add_review(review)
+        store.add(app)
+
+    # fields include the deep size of the objects they hold
+    app = store.get_component('org.example.App0')
+    for i in range(100):
+        csum = appstream.Checksum()
+        csum.target = 'target%i' % i
+        csum.value = '%040x' % i
+        app.releases[0].add_checksum(csum)
+    app._feed_parser = object()
+
+    report = store.memory_report(top=2)
+    fields = report['fields']
+    classes = report['classes']
+    for key in ['Component.description', 'Release.checksums', 'Checksum.value',
+                'Review.metadata']:
+        assert fields.get(key, 0) > 0, key
+    assert fields['Component.description'] > 10000
+    assert 'Component._feed_parser' not in fields
+    assert fields['Release.checksums'] > classes['Checksum'] + fields['Checksum.value']
+    assert fields['Release.checksums'] > 100 * sys.getsizeof(csum)
+    assert fields['Component.releases'] > fields['Release.checksums']
+    assert set(classes) == set(['Component', 'Release', 'Checksum', 'Review'])
+    assert report['total'] == classes['Component'] + \
+        sum(fields[key] for key in fields if key.startswith('Component.'))
+    assert [app_id for app_id, _ in report['top']] == \
+        ['org.example.App0', 'org.example.App4'], report['top']
+    assert report['indexes'] == {}
+    assert report['empty_containers']['count'] > 0
+
+    # indexes only count what the components do not already hold
+    store.build_indexes()
+    indexed = store.memory_report()
+    assert set(indexed['indexes']) == set(['attributes', 'media', 'prefix', 'reviews',
+                                               'timeline'])
+    assert indexed['total'] > report['total']
+
+    if sys.version_info >= (3, 4):
+        from appstream.memory import trace_parse
+        parsed, stats = trace_parse(store.to_xml(), top=5)
+        assert len(parsed.components) == 5
+        assert 0 < len(stats) <= 5
+
+def test_escaping():
+
+    special = u'A & B <C> "D" \u00ae'
+    store = appstream.Store('o&o')
+    app = appstream.Component()
+    app.id = 'org.example.Escape'
+    app.name = special
+    app.names['de'] = special
+    app.summary = special
+    app.developer_name = special
+    app.description = '<p>Already &amp; markup</p>'
+    app.urls['homepage'] = 'http://example.com/?a=1&b=2'
+    app.keywords = [special]
+    app.custom['key&"'] = special
+    app.bundle = {'type': 'flatpak', 'runtime': 'a&b', 'sdk': 'unknown',
+                  'value': 'app/<x>'}
+    rel = appstream.Release()
+    rel.version = '1&2'
+    rel.location = 'http://example.com/?f=1&g=2'
+    csum = appstream.Checksum()
+    csum.filename = 'a&b "c".cab'
+    csum.target = 'container'
+    csum.value = 'deadbeef'
+    rel.add_checksum(csum)
+    app.add_release(rel)
+    review = appstream.Review()
+    review.id = '1'
+    review.summary = special
+    review.reviewer_name = special
+    review.metadata['k<'] = special
+    app.add_review(review)
+    store.add(app)
+
+    for backend in ['tree', 'events']:
+        parsed = appstream.Store()
+        parsed.parse(store.to_xml(), backend=backend)
+        assert parsed.origin == 'o&o', parsed.origin
+        app2 = parsed.get_component('org.example.Escape')
+        assert app2.name == special, app2.name
+        assert app2.names['de'] == special
+        assert app2.summary == special
+        assert app2.developer_name == special
+        assert app2.description == '<p>Already &amp; markup</p>', app2.description
+        assert app2.urls['homepage'] == 'http://example.com/?a=1&b=2'
+        assert app2.keywords == [special]
+        assert app2.custom == {'key&"': special}, app2.custom
+        assert app2.bundle['runtime'] == 'a&b' and app2.bundle['value'] == 'app/<x>'
+        assert app2.releases[0].version == '1&2'
+        assert app2.releases[0].location == 'http://example.com/?f=1&g=2'
+        assert app2.releases[0].checksums[0].filename == 'a&b "c".cab'
+        assert app2.reviews[0].summary == special
+        assert app2.reviews[0].reviewer_name == special
+        assert app2.reviews[0].metadata == {'k<': special}
+        assert parsed.to_xml() == store.to_xml()
+
+def test_pickle():
+
+    import pickle
+    from appstream.transfer import dump_components, load_components
+
+    store = appstream.Store('test')
+    for i in range(20):
+        app = appstream.Component()
+        app.id = 'org.example.App%i' % i
+        app.name = 'App %i' % i
+        app.origin = 'test'
+        app.urls['homepage'] = 'http://example.com/'
+        app.developer_name = 'Example Corp'
+        for j in range(3):
+            rel = appstream.Release()
+            rel.version = '1.%i' % j
+            rel.timestamp = 1000 + j
+            csum = appstream.Checksum()
+            csum.target = 'container'
+            csum.value = 'deadbeef'
+            rel.add_checksum(csum)
+            app.add_release(rel)
+        review = appstream.Review()
+        review.id = 'review%i' % i
+        review.metadata['foo'] = 'bar'
+        app.add_review(review)
+        store.add(app)
+    components = store.get_components()
+
+    # each object is pickled without its field names
+    app = components[0]
+    app2 = pickle.loads(pickle.dumps(app, pickle.HIGHEST_PROTOCOL))
+    assert app2.to_xml() == app.to_xml()
+    assert app2.origin == 'test'
+    assert app2._feed_parser is None
+    assert b'checksums' not in pickle.dumps(app.releases[0], 2)
+
+    # extra attributes are kept
+    app.extra = 'value'
+    app2 = pickle.loads(pickle.dumps(app, 2))
+    assert app2.extra == 'value'
+    del app.extra
+
+    # batches are smaller still
+    data = dump_components(components)
+    assert len(data) < len(pickle.dumps(components, pickle.HIGHEST_PROTOCOL))
+    loaded = load_components(data)
+    assert [c.to_xml() for c in loaded] == [c.to_xml() for c in components]
+    assert loaded[0].releases[0].checksums[0].value == 'deadbeef'
+    assert loaded[0]._feed_parser is None
+    assert load_components(dump_components([])) == []
+
+    # extra attributes and tuple values are kept in batches too
+    app.extra = 'value'
+    app.custom['key'] = ('t', 1)
+    app.keywords = ['a', ('b', 2)]
+    app.releases[0].note = 'extra'
+    loaded = load_components(dump_components([app]))[0]
+    assert loaded.extra == 'value'
+    assert loaded.custom == {'key': ('t', 1)}, loaded.custom
+    assert loaded.keywords == ['a', ('b', 2)], loaded.keywords
+    assert loaded.releases[0].note == 'extra'
+    assert _to_dict(loaded) == _to_dict(app)
+
+def test_complete():
+
+    store = appstream.Store('test')
+    for app_id, name, pkgname in [('org.gnome.Maps', 'Maps', 'gnome-maps'),
+                                  ('org.gnome.Mahjongg', 'Mahjongg', None),
+                                  ('org.gnome.Music', 'Music', 'gnome-music'),
+                                  ('com.hughski.ColorHug', 'ColorHug Client', None),
+                                  ('org.kde.marble', 'Marble', 'marble')]:
+        app = appstream.Component()
+        app.id = app_id
+        app.name = name
+        app.pkgname = pkgname
+        store.add(app)
+
+    def _ids(components):
+        return [c.id for c in components]
+
+    # IDs, names and package names, ignoring case
+    apps, cursor = store.complete('org.gnome.')
+    assert _ids(apps) == ['org.gnome.Mahjongg', 'org.gnome.Maps',
+                          'org.gnome.Music'], _ids(apps)
+    assert cursor is None
+    assert _ids(store.complete('COLOR')[0]) == ['com.hughski.ColorHug']
+    assert _ids(store.complete('gnome-m')[0]) == ['org.gnome.Maps', 'org.gnome.Music']
+    assert _ids(store.complete('ma')[0]) == ['org.gnome.Mahjongg',
+                                             'org.gnome.Maps', 'org.kde.marble']
+    assert store.complete('xyz') == ([], None)
+
+    # each component is only returned once over all the pages
+    seen = []
+    cursor = None
+    while True:
+        apps, cursor = store.complete('', limit=2, cursor=cursor)
+        assert len(apps) <= 2
+        seen.extend(_ids(apps))
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(store.components.keys()), seen
+
+    # kept up to date as components change
+    app = appstream.Component()
+    app.id = 'org.gnome.Maps'
+    app.name = 'Atlas'
+    store._set_component(app)
+    assert _ids(store.complete('ma')[0]) == ['org.gnome.Mahjongg', 'org.kde.marble']
+    assert _ids(store.complete('atl')[0]) == ['org.gnome.Maps']
+    app = appstream.Component()
+    app.id = 'org.gnome.Mines'
+    store.add(app)
+    assert _ids(store.complete('org.gnome.mi')[0]) == ['org.gnome.Mines']
+
+    # changes between lookups are merged in when next needed
+    mines = store.get_component('org.gnome.Mines')
+    store._remove_component('org.gnome.Mines')
+    store._set_component(mines)
+    store._remove_component('org.gnome.Music')
+    assert _ids(store.complete('org.gnome.m')[0]) == ['org.gnome.Mahjongg',
+                                                      'org.gnome.Maps',
+                                                      'org.gnome.Mines']
+    app = appstream.Component()
+    app.id = 'org.gnome.Music'
+    store._set_component(app)
+    store._remove_component('org.gnome.Music')
+    assert _ids(store.complete('org.gnome.mu')[0]) == []
+
+    # parsing replaces the components and rebuilds the index once
+    store.parse(store.to_xml())
+    assert _ids(store.complete('org.gnome.m')[0]) == ['org.gnome.Mahjongg',
+                                                      'org.gnome.Maps',
+                                                      'org.gnome.Mines']
+
+    # a few changes to a large index are inserted without sorting it again
+    for i in range(200):
+        app = appstream.Component()
+        app.id = 'org.example.App%03i' % i
+        store.add(app)
+    store.complete('')
+    keys = store._indexes['prefix']._keys
+    app = appstream.Component()
+    app.id = 'org.example.App050a'
+    store.add(app)
+    store._remove_component('org.example.App100')
+    assert _ids(store.complete('org.example.app05', limit=20)[0]) == \
+        ['org.example.App050', 'org.example.App050a'] + \
+        ['org.example.App%03i' % i for i in range(51, 60)]
+    assert store.complete('org.example.app100') == ([], None)
+    index = store._indexes['prefix']
+    assert index._keys is keys
+    fresh = appstream.index.PrefixIndex()
+    fresh.build(store.components.values())
+    assert index._keys == fresh._keys
+
+def test_import_descriptions():
+
+    texts = ['- Fix <b> & "c"\n- Second item', 'Plain text', '', '1. One step']
+    expected = [appstream.utils.import_description(text) for text in texts]
+    assert expected[0] == '<ul>\n<li>Fix &lt;b&gt; &amp; &quot;c&quot;</li>\n' \
+                          '<li>Second item</li>\n</ul>\n', expected[0]
+    for xml in expected:
+        if xml:
+            appstream.utils.validate_description(xml)
+
+    # lazy, and in order with or without workers
+    results = appstream.utils.import_descriptions(iter(texts))
+    assert next(results) == expected[0]
+    assert list(results) == expected[1:]
+    results = appstream.utils.import_descriptions(texts * 10, workers=2, chunksize=3)
+    assert list(results) == expected * 10
 
 def main():
 
@@ -245,6 +1904,32 @@ Enhancemets:
 
     store.to_file('/tmp/firmware.xml.gz')
 
+    test_validate_all()
+    test_locales()
+    test_fields()
+    test_columns()
+    test_dep11()
+    test_snapshot()
+    test_verify_payloads()
+    test_merge()
+    test_media_index()
+    test_review_index()
+    test_parse_backends()
+    test_parse_limits()
+    test_cli()
+    test_reproducible()
+    test_delta()
+    test_flat()
+    test_query()
+    test_release_policy()
+    test_releases_since()
+    test_feed()
+    test_memory_report()
+    test_escaping()
+    test_pickle()
+    test_complete()
+    test_import_descriptions()
+
     # sign
     #from signature import Signature
     #ss = Signature()